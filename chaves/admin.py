@@ -1,29 +1,48 @@
 from django.contrib import admin
-from .models import Projetista, Polo, Chave, CustomUsuario, Aviso, EmailConfig
+from .models import Projetista, Polo, Chave, CustomUsuario, Aviso, AtribuicaoProjetista, EmailConfig, EmailPendente, ExportacaoChaves, ImportacaoPlanilha, SolicitacaoChave
 from django.contrib.auth.admin import UserAdmin
 from .forms import CustomUsuarioCreateForm, CustomUsuarioChangeForm
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import redirect
-from django.http import HttpResponse
-from openpyxl import Workbook
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.timezone import now
+from core.facetas import FiltroFacetado, PaginadorContagemEmCache, contagens, monitorar
+from .filtros import filtrar_busca_admin, filtros_da_querystring
+from .exportacao import chave_cache_exportacao, resposta_planilha
+from .atribuicao import assinar_filtro, filtro_da_acao
 
 def atribuir_projetista(modeladmin, request, queryset):
-    # Aqui você pode armazenar os IDs em sessão ou outra lógica
-    request.session['chave_ids'] = list(queryset.values_list('id', flat=True))
-    return redirect('atribuir_projetista')
+    # Leva só um filtro assinado (ids da página ou filtros da listagem), não a lista de ids na sessão
+    filtro = assinar_filtro(filtro_da_acao(request, queryset))
+    return redirect(f"{reverse('atribuir_projetista')}?{urlencode({'filtro': filtro})}")
 
 class SemProjetistaFilter(admin.SimpleListFilter):
     title = ('Atribuição')
     parameter_name = 'projetista'
 
     def lookups(self, request, model_admin):
+        # Quantidade pelo mesmo GROUP BY em cache do filtro de projetista
+        quantidade = dict(contagens(Chave, 'projetista')).get(None, 0)
         return (
-            ('nao_atribuido', ('Não Atribuído')),
+            ('nao_atribuido', (f'Não Atribuído ({quantidade})')),
         )
 
     def queryset(self, request, queryset):
         if self.value() == 'nao_atribuido':
             return queryset.filter(projetista__isnull=True)
 
+class ProjetistaFilter(FiltroFacetado):
+    # Substitui o filtro padrão de 'projetista', que listava todos os projetistas; mesmo parâmetro na URL
+    title = 'projetista'
+    parameter_name = 'projetista__id__exact'
+    campo = 'projetista'
+
+    def rotulos(self, valores):
+        return dict(Projetista.objects.filter(pk__in=valores).values_list('pk', 'projetista'))
+
 @admin.register(CustomUsuario)
 class CustomUsuarioAdmin(UserAdmin):
     add_form = CustomUsuarioCreateForm
@@ -46,35 +65,8 @@ class PoloAdmin(admin.ModelAdmin):
     list_display = ('polo',)
 
 def exportar_para_excel(modeladmin, request, queryset):
-    response = HttpResponse(content_type='application/ms-excel')
-    response['Content-Disposition'] = 'attachment; filename="relatorio_chaves.xlsx"'
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Chaves"
-
-    # Adicionando os cabeçalhos
-    colunas = ['Chave', 'Projetista', 'NS', 'Poste/Ponto', 'Coordenada', 'Polo', 'Município', 'Observação', 'Dt de Inclusão', 'Dt de Modificação']
-    ws.append(colunas)
-
-    # Adicionando os dados
-    for obj in queryset:
-        data = [
-            obj.chave,
-            obj.projetista.projetista if obj.projetista else '',  # Ajuste conforme o modelo de relacionamento
-            obj.ns,
-            obj.poste,
-            obj.coordenada,
-            obj.polo.polo if obj.polo else '',  # Ajuste conforme o modelo de relacionamento
-            obj.municipio,
-            obj.observacao,
-            obj.data_inclusao.strftime("%Y-%m-%d %H:%M") if obj.data_inclusao else '',
-            obj.data_modificacao.strftime("%Y-%m-%d %H:%M") if obj.data_modificacao else '',
-        ]
-        ws.append(data)
-
-    wb.save(response)
-    return response
+    # Planilha gerada em modo write-only e lida em blocos com join (chaves.exportacao)
+    return resposta_planilha(queryset)
 
 exportar_para_excel.short_description = "Exportar Selecionados para Excel"
 
@@ -85,7 +77,85 @@ class ChaveAdmin(admin.ModelAdmin):
     search_fields = ['chave', 'ns', 'projetista__projetista', 'municipio', 'polo__polo', 'observacao']
     change_list_template = "custom_change_list.html"
     actions = [atribuir_projetista, exportar_para_excel]
-    list_filter = (SemProjetistaFilter, 'projetista')  # Adicionando o filtro personalizado
+    list_filter = (SemProjetistaFilter, ProjetistaFilter)  # Adicionando o filtro personalizado
+    # Opções dos filtros e total da listagem vêm do cache (core.facetas), sem COUNT(*) da tabela inteira
+    paginator = PaginadorContagemEmCache
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Mesmos campos de search_fields, mas pelo índice de busca (chaves.busca) em vez
+        # de um LIKE '%termo%' por campo. Como no admin padrão, cada termo precisa aparecer
+        # em algum dos campos; termos entre aspas podem conter espaços.
+        return filtrar_busca_admin(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path('exportar-tudo/', self.admin_site.admin_view(self.exportar_tudo), name='chaves_chave_exportar_tudo'),
+        ] + super().get_urls()
+
+    def exportar_tudo(self, request):
+        # Todas as chaves do filtro atual, geradas pelo worker (manage.py processar_exportacoes).
+        # Um pedido com os mesmos formato, filtros e dados reaproveita o arquivo já gerado.
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        formato = request.GET.get('formato', ExportacaoChaves.XLSX)
+        if formato not in dict(ExportacaoChaves.FORMATO_CHOICES):
+            formato = ExportacaoChaves.XLSX
+        filtros = filtros_da_querystring(request.GET)
+        chave_cache = chave_cache_exportacao(formato, filtros)
+
+        exportacao = ExportacaoChaves.reaproveitavel(chave_cache, request.user)
+        if exportacao:
+            messages.info(request, "Já existe uma exportação destes filtros com os dados atuais; usando o mesmo arquivo.")
+        else:
+            exportacao = ExportacaoChaves.objects.create(
+                usuario=request.user, formato=formato, filtros=filtros, chave_cache=chave_cache,
+            )
+            messages.info(request, "Exportação enfileirada. O arquivo será gerado em segundo plano.")
+        return redirect('exportacao_chaves', id=exportacao.pk)
+
+    def changelist_view(self, request, extra_context=None):
+        # Avisa (uma vez) das exportações do usuário que terminaram, com o link para baixar
+        terminadas = list(ExportacaoChaves.objects.filter(
+            usuario=request.user, notificada=False, status__in=[ExportacaoChaves.CONCLUIDA, ExportacaoChaves.ERRO],
+        ))
+        for exportacao in terminadas:
+            if exportacao.status == ExportacaoChaves.CONCLUIDA:
+                messages.success(request, format_html(
+                    'Exportação #{} pronta ({} chaves): <a href="{}">baixar arquivo</a>.',
+                    exportacao.pk, exportacao.linhas, reverse('baixar_exportacao', kwargs={'id': exportacao.pk}),
+                ))
+            else:
+                messages.error(request, f"Exportação #{exportacao.pk} falhou: {exportacao.mensagem_erro}")
+        if terminadas:
+            ExportacaoChaves.objects.filter(pk__in=[exportacao.pk for exportacao in terminadas]).update(notificada=True)
+        return super().changelist_view(request, extra_context)
+
+
+monitorar(Chave)
+
+
+@admin.register(ImportacaoPlanilha)
+class ImportacaoPlanilhaAdmin(admin.ModelAdmin):
+    list_display = ('nome_original', 'usuario', 'status', 'linhas_processadas', 'criados', 'atualizados', 'inalterados', 'duplicados', 'invalidos', 'data_criacao', 'data_fim')
+    list_filter = ('status', 'atualizar_existentes')
+    search_fields = ('nome_original', 'hash_conteudo')
+    readonly_fields = ('arquivo', 'nome_original', 'hash_conteudo', 'usuario', 'atualizar_existentes', 'linhas_processadas', 'criados', 'atualizados', 'inalterados', 'duplicados', 'invalidos', 'mensagem_erro', 'relatorio', 'data_criacao', 'data_inicio', 'data_fim')
+
+
+@admin.register(ExportacaoChaves)
+class ExportacaoChavesAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'formato', 'status', 'linhas', 'data_criacao', 'data_fim')
+    list_filter = ('status', 'formato')
+    readonly_fields = ('usuario', 'formato', 'filtros', 'chave_cache', 'arquivo', 'status', 'linhas', 'mensagem_erro', 'notificada', 'data_criacao', 'data_inicio', 'data_fim')
+
+
+@admin.register(AtribuicaoProjetista)
+class AtribuicaoProjetistaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'projetista', 'status', 'atualizadas', 'total', 'data_criacao', 'data_fim')
+    list_filter = ('status',)
+    list_select_related = ('usuario', 'projetista')
+    readonly_fields = ('usuario', 'projetista', 'filtros', 'total', 'atualizadas', 'lotes', 'status', 'mensagem_erro', 'data_criacao', 'data_inicio', 'data_fim')
 
 
 @admin.register(Aviso)
@@ -99,6 +169,33 @@ class EmailConfig(admin.ModelAdmin):
     list_filter = ('nome',)
 
 
+def reenviar_emails(modeladmin, request, queryset):
+    # Volta para a fila do worker (manage.py enviar_emails) com as tentativas zeradas
+    quantidade = queryset.exclude(status=EmailPendente.ENVIADO).update(
+        status=EmailPendente.PENDENTE, tentativas=0, proxima_tentativa=now(), ultimo_erro='',
+    )
+    messages.success(request, f"{quantidade} e-mail(s) de volta na fila de envio.")
+
+reenviar_emails.short_description = "Reenviar e-mails selecionados"
+
+
+@admin.register(EmailPendente)
+class EmailPendenteAdmin(admin.ModelAdmin):
+    list_display = ('assunto', 'status', 'tentativas', 'proxima_tentativa', 'data_criacao', 'data_envio')
+    list_filter = ('status',)
+    search_fields = ('assunto',)
+    actions = [reenviar_emails]
+    readonly_fields = ('assunto', 'remetente', 'destinatarios', 'corpo_texto', 'corpo_html', 'status', 'tentativas', 'proxima_tentativa', 'ultimo_erro', 'reservado_em', 'data_criacao', 'data_envio')
+
+
+@admin.register(SolicitacaoChave)
+class SolicitacaoChaveAdmin(admin.ModelAdmin):
+    list_display = ('projetista', 'chaves_sem_ns', 'urgente', 'data_solicitacao', 'email')
+    list_filter = ('urgente',)
+    list_select_related = ('projetista', 'email')
+    readonly_fields = ('projetista', 'chaves_sem_ns', 'urgente', 'data_solicitacao', 'email')
+
+
 admin.site.site_header = "JANOS - Administração do Banco de Dados"
 admin.site.site_title = "JANOS - Administração"
 admin.site.index_title = "JANOS - Página de administração"
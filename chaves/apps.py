@@ -6,3 +6,6 @@ class ChavesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chaves'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+
@@ -0,0 +1,100 @@
+"""
+Atribuição de projetista a muitas chaves de uma vez.
+
+A ação do admin não guarda a lista de ids na sessão: leva para a tela de
+atribuição um filtro assinado (django.core.signing), com os ids marcados na
+página ou, com "Selecionar todas", os filtros da listagem (chaves.filtros).
+Selecionar 50 mil chaves custa o mesmo que selecionar 50.
+
+O UPDATE roda em lotes de até TAMANHO_LOTE chaves por faixa de id, cada um
+na sua transação, para não segurar locks de milhares de linhas no MySQL.
+Seleções que cabem num lote são atribuídas na própria requisição; as
+maiores viram uma AtribuicaoProjetista, que o worker (manage.py
+processar_atribuicoes) executa com processar_atribuicao(), gravando o
+progresso que a tela da atribuição acompanha.
+"""
+from django.core import signing
+from django.db import transaction
+from django.utils.timezone import now
+
+from core.facetas import invalidar_facetas
+
+from .filtros import filtrar_chaves, filtros_da_querystring
+from .models import AtribuicaoProjetista, Chave
+
+SALT = 'chaves.atribuir_projetista'
+
+# Validade do filtro assinado (segundos): o bastante para escolher o projetista
+IDADE_MAXIMA = 60 * 60
+
+# Chaves atualizadas por transação
+TAMANHO_LOTE = 1000
+
+
+def filtro_da_acao(request, queryset):
+    """Filtro das chaves escolhidas na ação do admin: os filtros da listagem com "Selecionar todas", senão os ids marcados."""
+    if request.POST.get('select_across') == '1':
+        return filtros_da_querystring(request.GET)
+    return {'ids': list(queryset.values_list('pk', flat=True))}
+
+
+def assinar_filtro(filtros):
+    return signing.dumps(filtros, salt=SALT, compress=True)
+
+
+def ler_filtro(token):
+    """Filtros de assinar_filtro(); levanta signing.BadSignature se o token foi alterado ou expirou."""
+    return signing.loads(token, salt=SALT, max_age=IDADE_MAXIMA)
+
+
+def atribuir_em_lotes(queryset, projetista, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Atribui `projetista` às chaves de `queryset` em lotes por faixa de id.
+    Cada UPDATE reaplica o filtro dentro da faixa, em transação própria.
+    `progresso(atualizadas)` é chamado após cada lote. Devolve (atualizadas, lotes).
+    """
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    atualizadas = lotes = 0
+    ultimo = 0
+    while True:
+        faixa = list(ids.filter(pk__gt=ultimo)[:tamanho_lote])
+        if not faixa:
+            break
+        with transaction.atomic():
+            # update() não passa por auto_now; data_modificacao muda a versão das exportações em cache
+            atualizadas += queryset.filter(pk__gte=faixa[0], pk__lte=faixa[-1]).update(
+                projetista=projetista, data_modificacao=now()
+            )
+        lotes += 1
+        if progresso:
+            progresso(atualizadas)
+        if len(faixa) < tamanho_lote:
+            break
+        ultimo = faixa[-1]
+    return atualizadas, lotes
+
+
+def processar_atribuicao(atribuicao):
+    """
+    Executa uma AtribuicaoProjetista já reservada pelo worker
+    (manage.py processar_atribuicoes): refaz a consulta a partir dos filtros
+    guardados e grava as chaves atualizadas a cada lote.
+    """
+    chaves = filtrar_chaves(Chave.objects.all(), atribuicao.filtros)
+
+    def progresso(atualizadas):
+        AtribuicaoProjetista.objects.filter(pk=atribuicao.pk).update(atualizadas=atualizadas)
+
+    try:
+        atribuicao.atualizadas, atribuicao.lotes = atribuir_em_lotes(chaves, atribuicao.projetista, progresso=progresso)
+    except Exception as e:
+        atribuicao.refresh_from_db(fields=['atualizadas'])
+        atribuicao.status = AtribuicaoProjetista.ERRO
+        atribuicao.mensagem_erro = str(e)
+    else:
+        atribuicao.status = AtribuicaoProjetista.CONCLUIDA
+    # Os lotes já gravados valem mesmo se um lote seguinte falhou
+    invalidar_facetas(Chave)
+    atribuicao.data_fim = now()
+    atribuicao.save()
+    return atribuicao
@@ -0,0 +1,154 @@
+"""
+Busca por trecho nas chaves sem LIKE '%termo%'.
+
+`campo__icontains` vira LIKE '%termo%' no MySQL, que percorre a tabela
+inteira. Aqui:
+
+- chave, ns, município e observação usam o índice de trigramas
+  (TrigramaChave): cada termo com 3 ou mais caracteres primeiro seleciona,
+  pelo índice (campo, trigrama), as chaves que têm todos os trigramas do
+  termo; o icontains só é conferido nessas candidatas. Termos menores que 3
+  caracteres continuam no icontains.
+- projetista e polo são tabelas pequenas: o termo é procurado nelas e a
+  chave é filtrada pelos ids encontrados, pelo índice da chave estrangeira.
+
+O índice é atualizado pelo post_save de Chave (chaves.signals) e por
+chamadas explícitas depois de operações em lote que não disparam sinais
+(bulk_create da importação).
+"""
+from django.db.models import Count, Q
+
+from .models import Chave, Polo, Projetista, TrigramaChave
+
+TAMANHO_MINIMO = 3
+
+# Quantas chaves são reindexadas por consulta
+TAMANHO_LOTE_INDICE = 500
+
+# Campo do índice -> campo de Chave
+CAMPOS = {
+    TrigramaChave.CHAVE: 'chave',
+    TrigramaChave.NS: 'ns',
+    TrigramaChave.MUNICIPIO: 'municipio',
+    TrigramaChave.OBSERVACAO: 'observacao',
+}
+
+
+def trigramas(texto):
+    """Conjunto de trigramas (em minúsculas) de um texto; vazio se tiver menos de 3 caracteres."""
+    texto = (texto or '').lower()
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _registros(pk, valores):
+    for campo, valor in zip(CAMPOS, valores):
+        for trigrama in trigramas(valor):
+            yield TrigramaChave(chave_id=pk, campo=campo, trigrama=trigrama)
+
+
+def atualizar_indice(ids, novas=False):
+    """
+    Recalcula os trigramas das chaves `ids`. `novas=True` pula o DELETE,
+    para chaves que acabaram de ser criadas.
+    """
+    ids = list(ids)
+    for inicio in range(0, len(ids), TAMANHO_LOTE_INDICE):
+        bloco = ids[inicio:inicio + TAMANHO_LOTE_INDICE]
+        registros = []
+        for pk, *valores in Chave.objects.filter(pk__in=bloco).values_list('pk', *CAMPOS.values()):
+            registros.extend(_registros(pk, valores))
+        if not novas:
+            TrigramaChave.objects.filter(chave_id__in=bloco).delete()
+        TrigramaChave.objects.bulk_create(registros, batch_size=1000)
+
+
+def indexar_importadas(numeros):
+    """
+    Indexa chaves recém-criadas pela importação. Delas só o número está
+    preenchido, então basta buscar os ids (o bulk_create do MySQL não os
+    devolve) e gerar os trigramas do campo chave.
+    """
+    registros = [
+        TrigramaChave(chave_id=pk, campo=TrigramaChave.CHAVE, trigrama=trigrama)
+        for pk, numero in Chave.objects.filter(chave__in=numeros).values_list('pk', 'chave')
+        for trigrama in trigramas(numero)
+    ]
+    TrigramaChave.objects.bulk_create(registros, batch_size=1000)
+
+
+def reconstruir_indice(progresso=None):
+    """Refaz o índice inteiro, em blocos por id. Retorna quantas chaves foram indexadas."""
+    TrigramaChave.objects.all().delete()
+    ultimo, total = 0, 0
+    while True:
+        linhas = list(
+            Chave.objects.filter(pk__gt=ultimo).order_by('pk')
+            .values_list('pk', *CAMPOS.values())[:TAMANHO_LOTE_INDICE]
+        )
+        if not linhas:
+            return total
+        registros = []
+        for pk, *valores in linhas:
+            registros.extend(_registros(pk, valores))
+        TrigramaChave.objects.bulk_create(registros, batch_size=1000)
+        ultimo = linhas[-1][0]
+        total += len(linhas)
+        if progresso is not None:
+            progresso(total)
+
+
+def candidatas(termo, campos):
+    """
+    Subconsulta com os ids das chaves que têm todos os trigramas de `termo`
+    em pelo menos um dos `campos`.
+    """
+    termo_trigramas = trigramas(termo)
+    return (
+        TrigramaChave.objects
+        .filter(campo__in=campos, trigrama__in=termo_trigramas)
+        .values('chave_id', 'campo')
+        .annotate(encontrados=Count('id'))
+        .filter(encontrados=len(termo_trigramas))
+        .values('chave_id')
+    )
+
+
+def condicao_trecho(termo, campos):
+    """Q das chaves em que algum dos `campos` (constantes de TrigramaChave) contém `termo`."""
+    termo = termo.strip()
+    conferencia = Q()
+    for campo in campos:
+        conferencia |= Q(**{f"{CAMPOS[campo]}__icontains": termo})
+    if len(termo) < TAMANHO_MINIMO:
+        return conferencia
+    return Q(pk__in=candidatas(termo, campos)) & conferencia
+
+
+def filtrar_por_trecho(queryset, termo, campos):
+    """Filtra `queryset` pelas chaves em que algum dos `campos` contém `termo`, sem diferenciar maiúsculas."""
+    return queryset.filter(condicao_trecho(termo, campos))
+
+
+def ids_projetistas(termo):
+    """Ids dos projetistas com `termo` no nome (tabela pequena, o LIKE não pesa)."""
+    return list(Projetista.objects.filter(projetista__icontains=termo.strip()).values_list('pk', flat=True))
+
+
+def ids_polos(termo):
+    return list(Polo.objects.filter(polo__icontains=termo.strip()).values_list('pk', flat=True))
+
+
+def filtrar_busca_geral(queryset, termo):
+    """
+    Busca do admin: chaves em que o termo aparece em qualquer campo de
+    search_fields. Projetista e polo só entram na condição quando o termo
+    existe nessas tabelas, para que a busca por número/NS fique só no índice.
+    """
+    condicao = condicao_trecho(termo, list(CAMPOS))
+    projetistas = ids_projetistas(termo)
+    if projetistas:
+        condicao |= Q(projetista_id__in=projetistas)
+    polos = ids_polos(termo)
+    if polos:
+        condicao |= Q(polo_id__in=polos)
+    return queryset.filter(condicao)
@@ -0,0 +1,125 @@
+"""
+Caixa de saída de e-mails (EmailPendente).
+
+enfileirar_email() grava a mensagem já renderizada; enviar_pendentes(),
+chamado pelo worker (manage.py enviar_emails), reserva um lote, abre uma
+conexão com o backend de e-mail (EMAIL_BACKEND) e envia todas por ela.
+Uma falha reagenda a mensagem com espera crescente (ESPERA_BASE dobrando a
+cada tentativa, até ESPERA_MAXIMA); depois de MAXIMO_TENTATIVAS ela fica
+como FALHOU e pode ser reenviada pelo admin.
+
+Com EMAIL_BACKEND locmem/console, ou apontando EMAIL_HOST/EMAIL_PORT para
+um servidor SMTP local de depuração, dá para testar sem enviar nada.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from django.utils.timezone import now
+
+from .models import EmailPendente
+
+logger = logging.getLogger(__name__)
+
+# Mensagens enviadas por conexão
+TAMANHO_LOTE = 50
+
+MAXIMO_TENTATIVAS = 6
+
+# Espera antes da segunda tentativa (segundos); dobra a cada falha
+ESPERA_BASE = 60
+ESPERA_MAXIMA = 60 * 60
+
+# Reservas mais antigas que isto são de um worker que parou no meio do lote
+RESERVA_EXPIRA = timedelta(minutes=10)
+
+REMETENTE_PADRAO = 'JANOS <noreply@dbsistemas.com.br>'
+
+
+def enfileirar_email(assunto, template, contexto, destinatarios, remetente=None):
+    """Renderiza `template` (HTML; o texto sai dele sem as tags) e grava o e-mail na caixa de saída."""
+    html = render_to_string(template, contexto)
+    return EmailPendente.objects.create(
+        assunto=assunto,
+        remetente=remetente or getattr(settings, 'DEFAULT_FROM_EMAIL', REMETENTE_PADRAO),
+        destinatarios=list(destinatarios),
+        corpo_texto=strip_tags(html),
+        corpo_html=html,
+    )
+
+
+def espera(tentativas):
+    """Segundos até a próxima tentativa depois de `tentativas` falhas."""
+    return min(ESPERA_BASE * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+
+
+def reservar_lote(tamanho=TAMANHO_LOTE):
+    """
+    Reserva para este worker até `tamanho` e-mails prontos para envio, com o
+    mesmo UPDATE condicional das importações: se outro worker reservou
+    antes, a linha não é atualizada e fica de fora.
+    """
+    agora = now()
+    prontos = Q(status=EmailPendente.PENDENTE, proxima_tentativa__lte=agora) | Q(
+        status=EmailPendente.ENVIANDO, reservado_em__lt=agora - RESERVA_EXPIRA
+    )
+    candidatos = list(EmailPendente.objects.filter(prontos).order_by('proxima_tentativa', 'id').values_list('id', flat=True)[:tamanho])
+    reservados = []
+    for pk in candidatos:
+        if EmailPendente.objects.filter(prontos, pk=pk).update(status=EmailPendente.ENVIANDO, reservado_em=agora):
+            reservados.append(pk)
+    return list(EmailPendente.objects.filter(pk__in=reservados).order_by('proxima_tentativa', 'id'))
+
+
+def _registrar_falha(email, erro):
+    email.tentativas += 1
+    email.ultimo_erro = f"{type(erro).__name__}: {erro}"
+    if email.tentativas >= MAXIMO_TENTATIVAS:
+        email.status = EmailPendente.FALHOU
+    else:
+        email.status = EmailPendente.PENDENTE
+        email.proxima_tentativa = now() + timedelta(seconds=espera(email.tentativas))
+    email.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa'])
+    logger.warning("Falha ao enviar e-mail #%s (tentativa %s): %s", email.pk, email.tentativas, email.ultimo_erro)
+
+
+def enviar_pendentes(tamanho_lote=TAMANHO_LOTE, backend=None):
+    """Envia um lote da caixa de saída por uma única conexão. Devolve (enviados, falhas)."""
+    lote = reservar_lote(tamanho_lote)
+    if not lote:
+        return 0, 0
+
+    enviados = falhas = 0
+    conexao = get_connection(backend)
+    try:
+        conexao.open()
+    except Exception as e:
+        # Servidor fora do ar: o lote inteiro volta para a fila com espera
+        for email in lote:
+            _registrar_falha(email, e)
+        return 0, len(lote)
+
+    try:
+        for email in lote:
+            mensagem = EmailMultiAlternatives(
+                email.assunto, email.corpo_texto, email.remetente, email.destinatarios, connection=conexao,
+            )
+            if email.corpo_html:
+                mensagem.attach_alternative(email.corpo_html, 'text/html')
+            try:
+                mensagem.send()
+            except Exception as e:
+                _registrar_falha(email, e)
+                falhas += 1
+            else:
+                email.status = EmailPendente.ENVIADO
+                email.data_envio = now()
+                email.save(update_fields=['status', 'data_envio'])
+                enviados += 1
+    finally:
+        conexao.close()
+    return enviados, falhas
@@ -0,0 +1,200 @@
+"""
+Exportação de chaves para Excel (e CSV) com memória constante.
+
+As linhas são lidas em blocos por id (keyset: WHERE id > último ORDER BY id
+LIMIT n), com projetista e polo vindos do mesmo SELECT por join, e escritas
+numa planilha openpyxl em modo write-only, que não mantém as células em
+memória. O arquivo é montado num temporário em disco e enviado em partes pelo
+FileResponse, sem passar inteiro pela memória do worker.
+
+O bloco por id (em vez de iterator()) é o que mantém a memória constante no
+MySQL: o mysqlclient traz o resultado inteiro de um SELECT para o cliente.
+
+Exportações de todas as chaves de um filtro do admin não cabem no tempo de
+uma requisição: viram uma ExportacaoChaves, processada pelo worker
+(manage.py processar_exportacoes) com processar_exportacao(). O arquivo fica
+em MEDIA_ROOT e é reaproveitado por pedidos com o mesmo formato, filtros e
+versão dos dados (chave_cache_exportacao).
+
+Fora do admin, resposta_csv() transmite o CSV (opcionalmente em gzip) com
+StreamingHttpResponse: o cabeçalho sai antes da primeira consulta e cada
+bloco é enviado assim que lido, sem montar o arquivo.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import json
+import tempfile
+import zlib
+
+from django.core.files import File
+from django.db.models import Count, Max
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.timezone import now
+
+from .filtros import filtrar_chaves
+from .models import Chave, ExportacaoChaves
+
+COLUNAS = ['Chave', 'Projetista', 'NS', 'Poste/Ponto', 'Coordenada', 'Polo', 'Município', 'Observação', 'Dt de Inclusão', 'Dt de Modificação']
+
+CAMPOS = (
+    'chave', 'projetista__projetista', 'ns', 'poste', 'coordenada', 'polo__polo',
+    'municipio', 'observacao', 'data_inclusao', 'data_modificacao',
+)
+
+# Chaves lidas por consulta
+TAMANHO_BLOCO = 2000
+
+FORMATO_DATA = "%Y-%m-%d %H:%M"
+
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Tamanho aproximado (caracteres) de cada parte enviada pelo CSV em streaming
+TAMANHO_PARTE_CSV = 64 * 1024
+
+
+def _data(valor):
+    return valor.strftime(FORMATO_DATA) if valor else ''
+
+
+def linhas_exportacao(queryset, tamanho_bloco=TAMANHO_BLOCO):
+    """Linhas da planilha (na ordem de COLUNAS) das chaves de `queryset`, em ordem de id."""
+    consulta = queryset.order_by('pk').values_list('pk', *CAMPOS)
+    ultimo = 0
+    while True:
+        bloco = list(consulta.filter(pk__gt=ultimo)[:tamanho_bloco])
+        for (_, chave, projetista, ns, poste, coordenada, polo, municipio, observacao,
+             data_inclusao, data_modificacao) in bloco:
+            yield [
+                chave, projetista or '', ns, poste, coordenada, polo or '', municipio, observacao,
+                _data(data_inclusao), _data(data_modificacao),
+            ]
+        if len(bloco) < tamanho_bloco:
+            return
+        ultimo = bloco[-1][0]
+
+
+def gravar_planilha(queryset, destino):
+    """Escreve a planilha das chaves de `queryset` em `destino` (caminho ou arquivo binário); devolve o número de chaves."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Chaves")
+    ws.append(COLUNAS)
+    total = 0
+    for total, linha in enumerate(linhas_exportacao(queryset), 1):
+        ws.append(linha)
+    wb.save(destino)
+    return total
+
+
+def resposta_planilha(queryset, nome_arquivo='relatorio_chaves.xlsx'):
+    """FileResponse com a planilha das chaves; o temporário é apagado quando a resposta fecha."""
+    arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        gravar_planilha(queryset, arquivo)
+    except BaseException:
+        arquivo.close()
+        raise
+    arquivo.seek(0)
+    return FileResponse(arquivo, as_attachment=True, filename=nome_arquivo, content_type=TIPO_XLSX)
+
+
+def gravar_csv(queryset, destino):
+    """Escreve o CSV (separado por ';', como o relatório de importação) das chaves de `queryset` no arquivo
+    binário `destino`, em UTF-8 com BOM para o Excel; devolve o número de chaves."""
+    destino.write(codecs.BOM_UTF8)
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+    escritor = csv.writer(texto, delimiter=';')
+    escritor.writerow(COLUNAS)
+    total = 0
+    for total, linha in enumerate(linhas_exportacao(queryset), 1):
+        escritor.writerow(linha)
+    texto.flush()
+    texto.detach()
+    return total
+
+
+def partes_csv(queryset, tamanho_parte=TAMANHO_PARTE_CSV):
+    """CSV das chaves de `queryset` em partes de bytes (UTF-8 com BOM, para o Excel); a primeira é só o cabeçalho."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    escritor.writerow(COLUNAS)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for linha in linhas_exportacao(queryset):
+        escritor.writerow(linha)
+        if buffer.tell() >= tamanho_parte:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def comprimir_gzip(partes):
+    """Comprime `partes` num único fluxo gzip, liberando cada parte comprimida assim que ela fica pronta."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for parte in partes:
+        comprimida = compressor.compress(parte) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if comprimida:
+            yield comprimida
+    yield compressor.flush()
+
+
+def resposta_csv(queryset, nome_arquivo='chaves.csv', comprimir=False):
+    """StreamingHttpResponse com o CSV das chaves de `queryset`; com `comprimir`, um .csv.gz."""
+    partes = partes_csv(queryset)
+    if comprimir:
+        partes = comprimir_gzip(partes)
+        nome_arquivo += '.gz'
+    response = StreamingHttpResponse(partes, content_type='application/gzip' if comprimir else 'text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
+def versao_dados_chaves():
+    """
+    Identifica o estado da tabela de chaves: muda quando uma chave é criada,
+    apagada ou alterada (data_modificacao, que o importador e a atribuição
+    em lote também atualizam). Renomear projetista ou polo não muda a versão.
+
+    Roda a cada "Exportar tudo": com o índice em data_modificacao (que no
+    InnoDB carrega o id) a consulta lê só esse índice, sem passar pela tabela.
+    """
+    versao = Chave.objects.aggregate(total=Count('pk'), ultimo_id=Max('pk'), ultima_modificacao=Max('data_modificacao'))
+    ultima = versao['ultima_modificacao']
+    return f"{versao['total']}:{versao['ultimo_id'] or 0}:{ultima.isoformat() if ultima else ''}"
+
+
+def chave_cache_exportacao(formato, filtros, versao=None):
+    """sha256 (hex) de formato + filtros + versão dos dados; pedidos com a mesma chave recebem o mesmo arquivo."""
+    if versao is None:
+        versao = versao_dados_chaves()
+    conteudo = json.dumps([formato, filtros, versao], sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def processar_exportacao(exportacao):
+    """
+    Executa uma ExportacaoChaves já reservada pelo worker
+    (manage.py processar_exportacoes): refaz a consulta a partir dos filtros
+    guardados, monta o arquivo num temporário e o salva em `exportacao.arquivo`.
+    """
+    queryset = filtrar_chaves(Chave.objects.all(), exportacao.filtros)
+    with tempfile.TemporaryFile() as temporario:
+        try:
+            gravar = gravar_csv if exportacao.formato == ExportacaoChaves.CSV else gravar_planilha
+            exportacao.linhas = gravar(queryset, temporario)
+            temporario.seek(0)
+            exportacao.arquivo.save(exportacao.nome_download, File(temporario), save=False)
+        except Exception as e:
+            exportacao.status = ExportacaoChaves.ERRO
+            exportacao.mensagem_erro = str(e)
+        else:
+            exportacao.status = ExportacaoChaves.CONCLUIDA
+    exportacao.data_fim = now()
+    exportacao.save()
+    return exportacao
@@ -0,0 +1,82 @@
+"""
+Filtros de chaves vindos da querystring, fora do request.
+
+A exportação em segundo plano guarda os filtros da listagem do admin e o
+worker refaz a consulta a partir deles, sem request nem ChangeList. Os
+mesmos parâmetros da listagem são aceitos aqui:
+
+- q: busca do admin (chaves.busca.filtrar_busca_geral, termo a termo);
+- projetista=nao_atribuido: SemProjetistaFilter;
+- projetista__id__exact: filtro por projetista.
+
+A tela gerenciar_chaves e a sua exportação CSV usam filtrar_gerenciar(),
+com os parâmetros de PARAMETROS_GERENCIAR.
+
+Parâmetros de ordenação, página etc. são ignorados: não mudam o conteúdo.
+"""
+from django.utils.http import urlencode
+from django.utils.text import smart_split, unescape_string_literal
+
+from .busca import filtrar_busca_geral, filtrar_por_trecho, ids_projetistas
+from .models import TrigramaChave
+
+PARAMETROS_ADMIN = ('q', 'projetista', 'projetista__id__exact')
+
+# sem_projeto vale pela presença, com qualquer valor
+PARAMETROS_GERENCIAR = ('ns_search', 'chave_search', 'projetista_search', 'sem_projeto')
+
+
+def filtros_da_querystring(querydict, parametros=PARAMETROS_ADMIN):
+    """Só os filtros conhecidos e preenchidos de `querydict`, em ordem fixa (serve de chave de cache)."""
+    filtros = {}
+    for nome in parametros:
+        valor = (querydict.get(nome) or '').strip()
+        if valor:
+            filtros[nome] = valor
+    return filtros
+
+
+def filtrar_busca_admin(queryset, busca):
+    """Busca do ChaveAdmin: cada termo precisa aparecer em algum campo; termos entre aspas podem ter espaços."""
+    for termo in smart_split(busca):
+        if termo[0] in ('"', "'") and termo[0] == termo[-1]:
+            termo = unescape_string_literal(termo)
+        if termo.strip():
+            queryset = filtrar_busca_geral(queryset, termo)
+    return queryset
+
+
+def filtrar_chaves(queryset, filtros):
+    """Aplica a `queryset` os filtros de filtros_da_querystring() ou uma lista de ids ({'ids': [...]})."""
+    if 'ids' in filtros:
+        queryset = queryset.filter(pk__in=filtros['ids'])
+    if filtros.get('q'):
+        queryset = filtrar_busca_admin(queryset, filtros['q'])
+    if filtros.get('projetista') == 'nao_atribuido':
+        queryset = queryset.filter(projetista__isnull=True)
+    projetista_id = filtros.get('projetista__id__exact', '')
+    if projetista_id.isdigit():
+        queryset = queryset.filter(projetista_id=projetista_id)
+    return queryset
+
+
+def filtrar_gerenciar(queryset, querydict):
+    """Filtros de gerenciar_chaves; a busca por trecho usa o índice de trigramas (chaves.busca), não LIKE '%...%'."""
+    ns_search = querydict.get('ns_search', '')
+    chave_search = querydict.get('chave_search', '')
+    projetista_search = querydict.get('projetista_search', '')
+
+    if ns_search:
+        queryset = filtrar_por_trecho(queryset, ns_search, [TrigramaChave.NS])
+    if chave_search:
+        queryset = filtrar_por_trecho(queryset, chave_search, [TrigramaChave.CHAVE])
+    if projetista_search:
+        queryset = queryset.filter(projetista_id__in=ids_projetistas(projetista_search))
+    if 'sem_projeto' in querydict:
+        queryset = queryset.filter(ns__isnull=True)
+    return queryset
+
+
+def querystring_gerenciar(querydict):
+    """Só os filtros de gerenciar_chaves de `querydict`, sem cursor de página, para montar links."""
+    return urlencode([(nome, querydict[nome]) for nome in PARAMETROS_GERENCIAR if nome in querydict])
@@ -1,6 +1,8 @@
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import CustomUsuario, Chave, Projetista
+from .atribuicao import ler_filtro
 from django import forms
+from django.core import signing
 
 class ChaveForm(forms.ModelForm):
     class Meta:
@@ -47,7 +49,18 @@ class CustomUsuarioChangeForm(UserChangeForm):
         fields = ('first_name', 'last_name')
 
 class PlanilhaUploadForm(forms.Form):
-    planilha = forms.FileField(label='Selecione uma planilha')
+    planilha = forms.FileField(
+        label='Selecione uma planilha',
+        help_text='Formatos aceitos: xlsx, xls, ods, csv e csv.gz (colunas: chave, data do chamado, chamado).',
+    )
+    atualizar_existentes = forms.BooleanField(
+        label='Atualizar chamado e data do chamado das chaves que já existem',
+        required=False,
+    )
+    forcar_reprocessamento = forms.BooleanField(
+        label='Forçar reprocessamento (importar de novo mesmo que esta planilha já tenha sido enviada)',
+        required=False,
+    )
 
 class AtribuirProjetistaForm(forms.Form):
     projetista = forms.ModelChoiceField(
@@ -55,7 +68,25 @@ class AtribuirProjetistaForm(forms.Form):
         required=True,
         label="Projetista"
     )
-    chaves_ids = forms.CharField(widget=forms.HiddenInput())
+    # Filtro assinado vindo da ação do admin (chaves.atribuicao); chaves_ids, lista "[1, 2, 3]", é opcional
+    filtro = forms.CharField(widget=forms.HiddenInput(), required=False)
+    chaves_ids = forms.CharField(widget=forms.HiddenInput(), required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('filtro'):
+            try:
+                cleaned_data['filtros'] = ler_filtro(cleaned_data['filtro'])
+            except signing.BadSignature:
+                raise forms.ValidationError("A seleção de chaves expirou ou é inválida. Selecione as chaves novamente.")
+        else:
+            ids = [int(id.strip()) for id in cleaned_data.get('chaves_ids', '').strip('[]').split(',') if id.strip().isdigit()]
+            if not ids:
+                raise forms.ValidationError("Nenhuma chave selecionada.")
+            cleaned_data['filtros'] = {'ids': ids}
+        return cleaned_data
 
 class ConfirmacaoSolicitacaoForm(forms.Form):
-    confirmacao = forms.BooleanField(label='Confirmar a solicitação de chaves', required=True)
\ No newline at end of file
+    confirmacao = forms.BooleanField(label='Confirmar a solicitação de chaves', required=True)
+    # Urgente: e-mail na hora, sem esperar o resumo da janela (chaves.solicitacoes)
+    urgente = forms.BooleanField(label='Urgente', required=False)
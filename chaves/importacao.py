@@ -0,0 +1,307 @@
+"""
+Importação de chaves a partir de planilhas (xlsx, xls, ods, csv e csv.gz).
+
+A leitura fica em chaves.leitores; aqui ficam a gravação no banco, sempre no
+processo principal, e os pontos de entrada (worker, upload e linha de comando).
+
+pandas e openpyxl são importados só dentro das funções que os usam: este
+módulo pode ser carregado pelos workers web sem pagar o custo desses pacotes.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.files import File
+from django.db import transaction
+from django.utils.timezone import now
+
+from core.facetas import invalidar_facetas
+
+from .busca import indexar_importadas
+from .leitores import TAMANHO_LOTE, lotes_da_planilha, lotes_do_dataframe
+from .models import Chave, ImportacaoPlanilha
+
+# Quantas linhas inválidas/chaves duplicadas são guardadas como exemplo no resultado
+LIMITE_AMOSTRA = 50
+
+# Situações de cada linha no relatório da importação
+CRIADA = 'criada'
+ATUALIZADA = 'atualizada'
+INALTERADA = 'inalterada'
+DUPLICADA = 'duplicada'
+INVALIDA = 'invalida'
+CABECALHO_RELATORIO = ['linha', 'chave', 'situacao', 'detalhe']
+
+
+def _chaves_existentes(numeros):
+    """
+    Retorna {chave: (id, chamado, data_chamado)} das chaves que já existem no
+    banco, consultando em blocos de TAMANHO_LOTE para não estourar o limite de
+    parâmetros do IN.
+    """
+    existentes = {}
+    numeros = list(numeros)
+    for inicio in range(0, len(numeros), TAMANHO_LOTE):
+        bloco = numeros[inicio:inicio + TAMANHO_LOTE]
+        consulta = Chave.objects.filter(chave__in=bloco).values_list('chave', 'id', 'chamado', 'data_chamado')
+        for numero, pk, chamado, data_chamado in consulta:
+            existentes[numero] = (pk, chamado, data_chamado)
+    return existentes
+
+
+def _novo_resultado():
+    return {
+        'processadas': 0,
+        'criados': 0,
+        'atualizados': 0,
+        'inalterados': 0,
+        'invalidos': 0,
+        'duplicados': 0,
+        # Amostras para mensagens; o detalhe completo vai para o relatório por linha
+        'linhas_invalidas': [],
+        'chaves_duplicadas': [],
+    }
+
+
+def _registrar(resultado, linhas_relatorio, situacao, indice, numero, detalhe=''):
+    if situacao == INVALIDA:
+        resultado['invalidos'] += 1
+        if len(resultado['linhas_invalidas']) < LIMITE_AMOSTRA:
+            resultado['linhas_invalidas'].append(indice)
+    elif situacao == DUPLICADA:
+        resultado['duplicados'] += 1
+        if len(resultado['chaves_duplicadas']) < LIMITE_AMOSTRA:
+            resultado['chaves_duplicadas'].append(numero)
+    if linhas_relatorio is not None:
+        linhas_relatorio.append((indice + 1, numero, situacao, detalhe))
+
+
+def _gravar_lote(lote, resultado, atualizar=False, relatorio=None):
+    """
+    Grava um lote de linhas já normalizadas (indice, chave, data_chamado, chamado).
+    data_chamado None indica data inválida.
+
+    Sem `atualizar`, chaves que já existem contam como duplicadas e a primeira
+    ocorrência no arquivo vence; repetições de lotes anteriores são
+    encontradas pela própria consulta IN, já que os lotes gravados antes já
+    estão no banco. Com `atualizar`, chamado/data_chamado das chaves
+    existentes são comparados com a planilha e só as diferentes são gravadas
+    (bulk_update); dentro do arquivo, a última ocorrência vence.
+
+    `relatorio`, se informado, é um csv.writer que recebe uma linha por
+    registro da planilha: (linha, chave, situação, detalhe), em ordem de linha.
+    """
+    relatorio_lote = [] if relatorio is not None else None
+    candidatas = {}
+    for indice, numero, data_chamado, chamado in lote:
+        if data_chamado is None:
+            _registrar(resultado, relatorio_lote, INVALIDA, indice, numero, 'Formato de data inválido')
+            continue
+        if numero in candidatas:
+            if atualizar:
+                substituida = candidatas.pop(numero)[0]
+                _registrar(resultado, relatorio_lote, DUPLICADA, substituida, numero, 'Substituída por ocorrência posterior')
+            else:
+                _registrar(resultado, relatorio_lote, DUPLICADA, indice, numero, 'Repetida na planilha')
+                continue
+        candidatas[numero] = (indice, data_chamado, chamado)
+
+    existentes = _chaves_existentes(candidatas)
+    momento = now()
+
+    novos, alterados = [], []
+    for numero, (indice, data_chamado, chamado) in candidatas.items():
+        if numero not in existentes:
+            novos.append(Chave(chave=numero, chamado=chamado, data_chamado=data_chamado))
+            _registrar(resultado, relatorio_lote, CRIADA, indice, numero)
+        elif not atualizar:
+            _registrar(resultado, relatorio_lote, DUPLICADA, indice, numero, 'Já existe no banco de dados')
+        else:
+            pk, chamado_atual, data_atual = existentes[numero]
+            if (chamado, data_chamado) == (chamado_atual, data_atual):
+                resultado['inalterados'] += 1
+                _registrar(resultado, relatorio_lote, INALTERADA, indice, numero)
+                continue
+            alterados.append(Chave(id=pk, chamado=chamado, data_chamado=data_chamado, data_modificacao=momento))
+            resultado['atualizados'] += 1
+            _registrar(
+                resultado, relatorio_lote, ATUALIZADA, indice, numero,
+                f"chamado: {chamado_atual} -> {chamado}; data_chamado: {data_atual} -> {data_chamado}",
+            )
+
+    Chave.objects.bulk_create(novos, batch_size=TAMANHO_LOTE)
+    if novos:
+        # bulk_create não dispara post_save: o índice de busca é alimentado aqui
+        indexar_importadas([chave.chave for chave in novos])
+    if alterados:
+        # bulk_update não passa por auto_now, por isso data_modificacao vai explícita
+        Chave.objects.bulk_update(alterados, ['chamado', 'data_chamado', 'data_modificacao'], batch_size=TAMANHO_LOTE)
+    resultado['processadas'] += len(lote)
+    resultado['criados'] += len(novos)
+    if relatorio is not None:
+        relatorio.writerows(sorted(relatorio_lote))
+
+
+def importar_lotes(lotes, progresso=None, transacao_por_lote=False, atualizar=False, relatorio=None):
+    """
+    Grava uma sequência de lotes de linhas normalizadas. Só um lote fica em
+    memória por vez.
+
+    Por padrão tudo roda em uma única transação. Com transacao_por_lote=True
+    cada lote é confirmado separadamente, o que deixa o progresso visível para
+    outras conexões (usado pelas importações em segundo plano).
+    `progresso`, se informado, é chamado com o resultado parcial após cada lote.
+    `atualizar` e `relatorio` seguem para _gravar_lote.
+
+    Retorna um dicionário com as contagens ('processadas', 'criados',
+    'atualizados', 'inalterados', 'invalidos', 'duplicados') e amostras das
+    linhas rejeitadas ('linhas_invalidas', 'chaves_duplicadas').
+    """
+    resultado = _novo_resultado()
+    if transacao_por_lote:
+        for lote in lotes:
+            with transaction.atomic():
+                _gravar_lote(lote, resultado, atualizar, relatorio)
+            if progresso is not None:
+                progresso(resultado)
+    else:
+        with transaction.atomic():
+            for lote in lotes:
+                _gravar_lote(lote, resultado, atualizar, relatorio)
+                if progresso is not None:
+                    progresso(resultado)
+    # bulk_create/bulk_update não disparam sinais: filtros do admin recalculam as contagens
+    invalidar_facetas(Chave)
+    return resultado
+
+
+def resumo_importacao(resultado):
+    """Mensagem única com o resultado de uma importação."""
+    resumo = (
+        f"{resultado['criados']} registros foram criados, {resultado['atualizados']} atualizados, "
+        f"{resultado['inalterados']} sem alteração, {resultado['duplicados']} duplicados "
+        f"e {resultado['invalidos']} com data inválida."
+    )
+    if resultado['linhas_invalidas']:
+        linhas = ', '.join(str(indice + 1) for indice in resultado['linhas_invalidas'][:10])
+        resumo += f" Linhas com data inválida: {linhas}{'...' if resultado['invalidos'] > 10 else ''}."
+    return resumo
+
+
+def importar_dataframe(df, **opcoes):
+    """
+    Grava as chaves de um DataFrame sem cabeçalho
+    (colunas: 0 - chave, 1 - data_chamado, 2 - chamado).
+    """
+    return importar_lotes(lotes_do_dataframe(df), **opcoes)
+
+
+def processos_importacao():
+    """
+    Processos usados para interpretar csv grandes (settings.IMPORTACAO_PROCESSOS).
+    0 escolhe pelo número de CPUs, limitado a 4: o gravador é um só e mais
+    leitores que isso só disputam CPU com o banco.
+    """
+    processos = getattr(settings, 'IMPORTACAO_PROCESSOS', 0)
+    if processos <= 0:
+        processos = min(4, os.cpu_count() or 1)
+    return processos
+
+
+def importar_planilha(planilha, processos=None, **opcoes):
+    """
+    Importa um arquivo aberto em modo binário. O formato é detectado pelo
+    conteúdo (xlsx, xls, ods, csv ou csv.gz), não pelo nome. xlsx e csv são
+    lidos em streaming, lote a lote; csv grandes são interpretados em
+    paralelo por `processos` processos (padrão: processos_importacao()).
+    As demais opções são repassadas para importar_lotes.
+    """
+    if processos is None:
+        processos = processos_importacao()
+    return importar_lotes(lotes_da_planilha(planilha, processos=processos), **opcoes)
+
+
+def hash_arquivo(arquivo):
+    """sha256 (hex) do conteúdo de um arquivo enviado, lido em blocos."""
+    sha = hashlib.sha256()
+    for bloco in arquivo.chunks():
+        sha.update(bloco)
+    arquivo.seek(0)
+    return sha.hexdigest()
+
+
+def processar_importacao(importacao):
+    """
+    Executa uma ImportacaoPlanilha já reservada pelo worker
+    (manage.py processar_importacoes). Cada lote é confirmado em sua própria
+    transação e o progresso é gravado no registro da importação, para a
+    tela de upload acompanhar. O relatório por linha é montado em um arquivo
+    temporário e salvo em `importacao.relatorio` no final.
+    """
+    def progresso(resultado):
+        ImportacaoPlanilha.objects.filter(pk=importacao.pk).update(
+            linhas_processadas=resultado['processadas'],
+            criados=resultado['criados'],
+            atualizados=resultado['atualizados'],
+            inalterados=resultado['inalterados'],
+            duplicados=resultado['duplicados'],
+            invalidos=resultado['invalidos'],
+        )
+
+    # Binário com UTF-8 + BOM explícitos: o storage grava os bytes como estão (um arquivo
+    # texto seria regravado na codificação do locale, sem o BOM que o Excel usa)
+    with tempfile.TemporaryFile() as arquivo_relatorio:
+        arquivo_relatorio.write(codecs.BOM_UTF8)
+        texto_relatorio = io.TextIOWrapper(arquivo_relatorio, encoding='utf-8', newline='')
+        relatorio = csv.writer(texto_relatorio, delimiter=';')
+        relatorio.writerow(CABECALHO_RELATORIO)
+        try:
+            with importacao.arquivo.open('rb') as arquivo:
+                resultado = importar_planilha(
+                    arquivo,
+                    progresso=progresso,
+                    transacao_por_lote=True,
+                    atualizar=importacao.atualizar_existentes,
+                    relatorio=relatorio,
+                )
+        except Exception as e:
+            importacao.refresh_from_db()
+            importacao.status = ImportacaoPlanilha.ERRO
+            importacao.mensagem_erro = str(e)
+        else:
+            importacao.status = ImportacaoPlanilha.CONCLUIDA
+            importacao.linhas_processadas = resultado['processadas']
+            importacao.criados = resultado['criados']
+            importacao.atualizados = resultado['atualizados']
+            importacao.inalterados = resultado['inalterados']
+            importacao.duplicados = resultado['duplicados']
+            importacao.invalidos = resultado['invalidos']
+        texto_relatorio.flush()
+        texto_relatorio.detach()
+        arquivo_relatorio.seek(0)
+        importacao.relatorio.save(f"relatorio_importacao_{importacao.pk}.csv", File(arquivo_relatorio), save=False)
+    importacao.data_fim = now()
+    importacao.save()
+    return importacao
+
+
+def cadastrar_chaves_from_planilha(request, planilha, use_messages=True, atualizar=False):
+    try:
+        resultado = importar_planilha(planilha, atualizar=atualizar)
+
+        if use_messages:
+            # Uma mensagem só: a sessão (MESSAGE_STORAGE) não cresce com o tamanho da planilha
+            if resultado['invalidos']:
+                messages.warning(request, resumo_importacao(resultado))
+            else:
+                messages.success(request, resumo_importacao(resultado))
+        return resultado
+    except Exception as e:
+        if use_messages:
+            messages.error(request, f"Erro: {e}")
+        return None
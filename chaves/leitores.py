@@ -0,0 +1,408 @@
+"""
+Leitura e validação das planilhas de chaves, sem acesso ao banco.
+
+O formato é detectado pelo conteúdo do arquivo (assinatura dos primeiros
+bytes), não pela extensão: xlsx, xls, ods, csv e csv.gz. Os leitores devolvem
+lotes de linhas normalizadas (indice, chave, data_chamado, chamado) que
+chaves.importacao grava no banco.
+
+Este módulo não importa Django nem os models: é o que os processos do pool
+carregam para interpretar intervalos de um csv grande em paralelo.
+pandas e openpyxl continuam importados só dentro das funções que os usam.
+"""
+import codecs
+import csv
+import gzip
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+
+FORMATO_DATA = '%Y-%m-%d %H:%M:%S'
+
+# Quantidade de linhas por lote entregue ao gravador
+TAMANHO_LOTE = 1000
+
+# Formatos reconhecidos por detectar_formato
+XLSX = 'xlsx'
+XLS = 'xls'
+ODS = 'ods'
+CSV = 'csv'
+CSV_GZ = 'csv.gz'
+
+ASSINATURA_ZIP = b'PK\x03\x04'
+ASSINATURA_OLE2 = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ASSINATURA_GZIP = b'\x1f\x8b'
+MIMETYPE_ODS = b'application/vnd.oasis.opendocument.spreadsheet'
+
+# csv menores que isso são lidos em um processo só: subir o pool custaria
+# mais do que a leitura inteira
+LIMIAR_PARALELO = 8 * 2 ** 20
+
+# Tamanho aproximado (em bytes) de cada intervalo de linhas enviado ao pool
+TAMANHO_INTERVALO = 4 * 2 ** 20
+
+# Bytes lidos por vez ao verificar se o csv inteiro é utf-8
+TAMANHO_BLOCO_CODIFICACAO = 2 ** 20
+
+
+# ---------- Normalização das células ----------
+
+def _normalizar_chave(valor):
+    """
+    Converte o valor lido da planilha para o texto gravado em Chave.chave.
+    Números inteiros lidos como float (ex.: 123456.0) perdem o '.0'.
+    """
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor)
+
+
+def _normalizar_chamado(valor):
+    """
+    Texto do chamado como ele fica gravado (CharField), para que a comparação
+    do modo de atualização não veja diferença entre 12345 e '12345'.
+    """
+    if valor is None or valor == '':
+        return None
+    return _normalizar_chave(valor)
+
+
+def _converter_datas(coluna):
+    """
+    Converte a coluna de datas inteira de uma vez. Segue a mesma regra do
+    antigo strptime por linha: o texto da célula precisa estar exatamente no
+    FORMATO_DATA; o que não estiver vira NaT.
+    """
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(coluna):
+        # str(Timestamp) com fração de segundo não casaria com FORMATO_DATA
+        return coluna.where((coluna.dt.microsecond == 0) & (coluna.dt.nanosecond == 0))
+    return pd.to_datetime(coluna.map(str), format=FORMATO_DATA, errors='coerce')
+
+
+def _converter_data(valor):
+    """Versão por célula de _converter_datas, usada na leitura em streaming."""
+    if isinstance(valor, datetime):
+        return valor.date() if valor.microsecond == 0 else None
+    if isinstance(valor, date):
+        return valor
+    try:
+        return datetime.strptime(str(valor), FORMATO_DATA).date()
+    except ValueError:
+        return None
+
+
+def _normalizar_linhas(linhas):
+    """
+    Normaliza linhas cruas (tuplas de células) em (indice, chave,
+    data_chamado, chamado), descartando as linhas em branco. O índice (a
+    partir de 0) é a posição da linha no arquivo, contando as em branco,
+    para o relatório apontar a mesma linha que o usuário vê na planilha.
+    """
+    for indice, linha in enumerate(linhas):
+        celulas = list(linha[:3]) + [None] * (3 - len(linha))
+        if all(celula in (None, '') for celula in celulas):
+            continue
+        numero, data_chamado, chamado = celulas
+        yield indice, _normalizar_chave(numero), _converter_data(data_chamado), _normalizar_chamado(chamado)
+
+
+def _em_lotes(linhas):
+    """Agrupa linhas já numeradas em lotes de TAMANHO_LOTE."""
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == TAMANHO_LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def lotes_de_linhas(linhas):
+    """Normaliza linhas cruas (tuplas de células) em lotes de TAMANHO_LOTE."""
+    return _em_lotes(_normalizar_linhas(linhas))
+
+
+def lotes_do_dataframe(df):
+    """
+    Converte um DataFrame sem cabeçalho (colunas: 0 - chave, 1 - data_chamado,
+    2 - chamado) em lotes normalizados. As datas são convertidas de uma vez
+    para a coluna inteira.
+    """
+    if df.empty:
+        return iter(())
+    datas = _converter_datas(df.iloc[:, 1])
+    return _em_lotes(zip(
+        range(len(df)),
+        df.iloc[:, 0].map(_normalizar_chave),
+        datas.dt.date.where(datas.notna(), None),
+        # NaN das células vazias vira None antes de normalizar
+        df.iloc[:, 2].astype(object).where(df.iloc[:, 2].notna(), None).map(_normalizar_chamado),
+    ))
+
+
+# ---------- Detecção do formato ----------
+
+def detectar_formato(arquivo):
+    """
+    Identifica o formato pelos primeiros bytes do arquivo e o devolve
+    posicionado no início. Zip com xl/workbook.xml é xlsx, zip com o mimetype
+    do OpenDocument é ods, OLE2 é xls (Excel 97-2003), gzip é csv compactado e
+    texto é csv. Qualquer outra coisa gera ValueError.
+    """
+    arquivo.seek(0)
+    inicio = arquivo.read(2048)
+    arquivo.seek(0)
+
+    if inicio.startswith(ASSINATURA_ZIP):
+        try:
+            with zipfile.ZipFile(arquivo) as pacote:
+                nomes = set(pacote.namelist())
+                mimetype = pacote.read('mimetype') if 'mimetype' in nomes else b''
+        except zipfile.BadZipFile:
+            raise ValueError("Arquivo compactado corrompido ou incompleto.")
+        finally:
+            arquivo.seek(0)
+        if 'xl/workbook.xml' in nomes:
+            return XLSX
+        if mimetype.startswith(MIMETYPE_ODS):
+            return ODS
+        raise ValueError("Arquivo zip que não é uma planilha xlsx nem ods.")
+    if inicio.startswith(ASSINATURA_OLE2):
+        return XLS
+    if inicio.startswith(ASSINATURA_GZIP):
+        return CSV_GZ
+    if b'\x00' not in inicio:
+        return CSV
+    raise ValueError("Formato de arquivo não reconhecido (aceitos: xlsx, xls, ods, csv e csv.gz).")
+
+
+# ---------- Leitores ----------
+
+def _linhas_xlsx(arquivo):
+    """Lê a primeira aba linha a linha com o openpyxl em modo read-only."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _ler_com_pandas(arquivo, formato):
+    """xls e ods não têm leitura em streaming: a aba inteira vai para um DataFrame."""
+    import pandas as pd
+
+    motor = {XLS: 'xlrd', ODS: 'odf'}[formato]
+    try:
+        return pd.read_excel(arquivo, header=None, engine=motor)
+    except ImportError:
+        pacote = {XLS: 'xlrd', ODS: 'odfpy'}[formato]
+        raise ValueError(f"A leitura de arquivos .{formato} requer o pacote {pacote} instalado no servidor.")
+
+
+def _codificacao_csv(arquivo):
+    """
+    utf-8 (com ou sem BOM) quando o arquivo inteiro decodifica; senão cp1252,
+    comum nos arquivos exportados pelo Excel. Olhar só o começo não basta: um
+    acento em cp1252 no meio do arquivo derrubaria a importação pela metade.
+    O arquivo é lido em blocos e devolvido no início.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    arquivo.seek(0)
+    try:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_CODIFICACAO), b''):
+            decodificador.decode(bloco)
+        decodificador.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    finally:
+        arquivo.seek(0)
+    return 'utf-8-sig'
+
+
+def _formato_csv(texto):
+    """Parâmetros do csv.reader detectados na amostra (separador ',', ';' ou tab)."""
+    try:
+        dialeto = csv.Sniffer().sniff(texto, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    # Só atributos simples: o dicionário precisa ser enviado aos processos do pool
+    return {
+        'delimiter': dialeto.delimiter,
+        'quotechar': dialeto.quotechar,
+        'doublequote': dialeto.doublequote,
+        'skipinitialspace': dialeto.skipinitialspace,
+    }
+
+
+def _linhas_csv(arquivo, codificacao, formato_csv):
+    """Lê um csv linha a linha."""
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+    try:
+        yield from csv.reader(texto, **formato_csv)
+    finally:
+        # Devolve o arquivo ao chamador sem fechá-lo junto com o wrapper
+        texto.detach()
+
+
+def _tamanho(arquivo):
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return tamanho
+
+
+@contextmanager
+def _caminho_local(arquivo):
+    """
+    Caminho em disco com o conteúdo do arquivo, para os processos do pool
+    abrirem por conta própria. Usa o arquivo temporário do upload ou o do
+    storage local quando existem; senão copia para um temporário.
+    """
+    for obter in (lambda: arquivo.temporary_file_path(), lambda: arquivo.path):
+        try:
+            caminho = obter()
+        except (AttributeError, NotImplementedError, ValueError):
+            continue
+        if os.path.isfile(caminho):
+            yield caminho
+            return
+
+    # Arquivo aberto com open(): o nome só serve se apontar para o mesmo arquivo
+    try:
+        if os.path.samestat(os.fstat(arquivo.fileno()), os.stat(arquivo.name)):
+            yield arquivo.name
+            return
+    except (AttributeError, OSError, TypeError, ValueError):
+        pass
+
+    with tempfile.NamedTemporaryFile(suffix='.csv') as copia:
+        arquivo.seek(0)
+        shutil.copyfileobj(arquivo, copia)
+        copia.flush()
+        yield copia.name
+    arquivo.seek(0)
+
+
+def _intervalos(caminho, tamanho):
+    """
+    Divide o arquivo em intervalos de bytes de ~TAMANHO_INTERVALO que começam
+    sempre no início de uma linha. Assume que nenhum campo entre aspas tem
+    quebra de linha, o que vale para as colunas da planilha de chaves.
+    """
+    limites = [0]
+    with open(caminho, 'rb') as arquivo:
+        for posicao in range(TAMANHO_INTERVALO, tamanho, TAMANHO_INTERVALO):
+            if posicao <= limites[-1]:
+                continue
+            arquivo.seek(posicao)
+            arquivo.readline()
+            limites.append(arquivo.tell())
+    if limites[-1] < tamanho:
+        limites.append(tamanho)
+    return list(zip(limites, limites[1:]))
+
+
+def _analisar_intervalo(caminho, inicio, fim, codificacao, formato_csv):
+    """Executado no pool: lê e normaliza as linhas de um intervalo de bytes do csv."""
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        bruto = arquivo.read(fim - inicio)
+    # Fora do primeiro intervalo não há BOM; utf-8-sig funciona igual a utf-8
+    texto = bruto.decode(codificacao)
+    leitor = csv.reader(io.StringIO(texto, newline=''), **formato_csv)
+    linhas = list(_normalizar_linhas(leitor))
+    # Índices relativos ao intervalo, mais o total de linhas dele para numerar os seguintes
+    return linhas, leitor.line_num
+
+
+def _numerar_intervalos(resultados):
+    """Converte os índices de cada intervalo em posições no arquivo inteiro."""
+    deslocamento = 0
+    for linhas, quantidade in resultados:
+        for indice, *celulas in linhas:
+            yield (indice + deslocamento, *celulas)
+        deslocamento += quantidade
+
+
+def _resultados_em_ordem(executor, funcao, tarefas, janela):
+    """
+    Como executor.map, mas com no máximo `janela` tarefas em andamento: o
+    gravador consome os resultados na ordem do arquivo e a memória não cresce
+    quando ele é mais lento que a leitura.
+    """
+    pendentes = deque()
+    try:
+        for tarefa in tarefas:
+            pendentes.append(executor.submit(funcao, *tarefa))
+            if len(pendentes) >= janela:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+    finally:
+        for futuro in pendentes:
+            futuro.cancel()
+
+
+def _lotes_csv_paralelo(arquivo, processos, codificacao, formato_csv, tamanho):
+    with _caminho_local(arquivo) as caminho:
+        tarefas = [
+            (caminho, inicio, fim, codificacao, formato_csv)
+            for inicio, fim in _intervalos(caminho, tamanho)
+        ]
+        # spawn: os filhos não herdam as conexões de banco abertas pelo processo principal
+        executor = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            resultados = _resultados_em_ordem(executor, _analisar_intervalo, tarefas, janela=processos * 2)
+            yield from _em_lotes(_numerar_intervalos(resultados))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _lotes_csv(arquivo, processos):
+    codificacao = _codificacao_csv(arquivo)
+    amostra = arquivo.read(4096)
+    arquivo.seek(0)
+    formato_csv = _formato_csv(amostra.decode(codificacao, errors='ignore'))
+
+    tamanho = _tamanho(arquivo)
+    if processos > 1 and tamanho >= LIMIAR_PARALELO:
+        return _lotes_csv_paralelo(arquivo, processos, codificacao, formato_csv, tamanho)
+    return lotes_de_linhas(_linhas_csv(arquivo, codificacao, formato_csv))
+
+
+def _lotes_csv_gz(arquivo, processos):
+    """Descompacta para um temporário (gzip não permite acesso aleatório) e lê como csv."""
+    with tempfile.NamedTemporaryFile(suffix='.csv') as descompactado:
+        with gzip.GzipFile(fileobj=arquivo, mode='rb') as compactado:
+            shutil.copyfileobj(compactado, descompactado)
+        descompactado.seek(0)
+        yield from _lotes_csv(descompactado, processos)
+
+
+def lotes_da_planilha(arquivo, processos=1):
+    """
+    Lotes normalizados de um arquivo binário aberto, em qualquer um dos
+    formatos aceitos. xlsx e csv são lidos em streaming; csv grandes (a
+    partir de LIMIAR_PARALELO) são divididos em intervalos de linhas
+    interpretados por `processos` processos. xls e ods passam pelo pandas.
+    """
+    formato = detectar_formato(arquivo)
+    if formato == XLSX:
+        return lotes_de_linhas(_linhas_xlsx(arquivo))
+    if formato in (XLS, ODS):
+        return lotes_do_dataframe(_ler_com_pandas(arquivo, formato))
+    if formato == CSV_GZ:
+        return _lotes_csv_gz(arquivo, processos)
+    return _lotes_csv(arquivo, processos)
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chaves.emails import TAMANHO_LOTE, enviar_pendentes
+from chaves.solicitacoes import enviar_resumo
+
+
+class Command(BaseCommand):
+    help = (
+        "Envia os e-mails da caixa de saída (EmailPendente) em lotes, por uma única conexão SMTP "
+        "por lote, reagendando as falhas, e monta os resumos de solicitações de chaves. "
+        "Vários workers podem rodar ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Envia os e-mails prontos e encerra (útil em cron).',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera entre consultas quando a fila está vazia (padrão: 5).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=TAMANHO_LOTE,
+            help=f'E-mails enviados por conexão (padrão: {TAMANHO_LOTE}).',
+        )
+        parser.add_argument(
+            '--backend',
+            help="Backend de e-mail no lugar de EMAIL_BACKEND, ex.: django.core.mail.backends.console.EmailBackend.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Solicitações de chaves cuja janela fechou viram um e-mail de resumo na caixa de saída
+            resumo = enviar_resumo()
+            if resumo:
+                self.stdout.write(f"Resumo de solicitações de chaves na caixa de saída: e-mail #{resumo.pk}.")
+            enviados, falhas = enviar_pendentes(options['lote'], options['backend'])
+            if enviados or falhas:
+                self.stdout.write(f"{enviados} e-mail(s) enviado(s), {falhas} falha(s).")
+                # Com falhas, o resto da fila espera o intervalo em vez de insistir no servidor
+                if not falhas:
+                    continue
+            if options['uma_vez']:
+                break
+            # Worker de longa duração: descarta conexões quebradas/expiradas enquanto espera
+            close_old_connections()
+            time.sleep(options['intervalo'])
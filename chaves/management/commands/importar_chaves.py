@@ -0,0 +1,82 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chaves.importacao import importar_planilha, processos_importacao, resumo_importacao
+
+# Arquivos considerados ao varrer um diretório; o formato real ainda é detectado pelo conteúdo
+EXTENSOES_PLANILHA = ('.xlsx', '.xls', '.ods', '.csv', '.gz')
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa chaves de planilhas (colunas: chave, data_chamado, chamado) sem passar pelo site. "
+        "Aceita arquivos e diretórios; o formato (xlsx, xls, ods, csv ou csv.gz) é detectado pelo "
+        "conteúdo. Cada arquivo é gravado em uma transação; o comando termina com código de saída "
+        "diferente de zero se algum arquivo falhar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('caminhos', nargs='+', help='Arquivos ou diretórios (os diretórios não são percorridos recursivamente).')
+        parser.add_argument(
+            '--atualizar', action='store_true',
+            help='Atualiza chamado/data_chamado das chaves existentes.',
+        )
+        parser.add_argument(
+            '--processos', type=int, default=None,
+            help='Processos para interpretar csv grandes em paralelo (padrão: IMPORTACAO_PROCESSOS).',
+        )
+        parser.add_argument(
+            '--parar-no-erro', action='store_true',
+            help='Interrompe no primeiro arquivo com erro em vez de seguir para os próximos.',
+        )
+
+    def arquivos(self, caminhos):
+        for caminho in caminhos:
+            if os.path.isdir(caminho):
+                for nome in sorted(os.listdir(caminho)):
+                    completo = os.path.join(caminho, nome)
+                    if not nome.startswith('.') and nome.lower().endswith(EXTENSOES_PLANILHA) and os.path.isfile(completo):
+                        yield completo
+            else:
+                yield caminho
+
+    def handle(self, *args, **options):
+        processos = options['processos'] or processos_importacao()
+        erros = []
+        importados = 0
+        total_linhas = 0
+        inicio_total = time.perf_counter()
+
+        for caminho in self.arquivos(options['caminhos']):
+            inicio = time.perf_counter()
+            try:
+                with open(caminho, 'rb') as arquivo:
+                    resultado = importar_planilha(arquivo, processos=processos, atualizar=options['atualizar'])
+            except Exception as e:
+                # A transação do arquivo é desfeita inteira; ele pode ser reenviado depois de corrigido
+                erros.append(caminho)
+                self.stderr.write(f"{caminho}: erro: {e}")
+                if options['parar_no_erro']:
+                    break
+                continue
+
+            duracao = time.perf_counter() - inicio
+            importados += 1
+            total_linhas += resultado['processadas']
+            self.stdout.write(self.style.SUCCESS(
+                f"{caminho}: {resumo_importacao(resultado)} "
+                f"({resultado['processadas']} linhas em {duracao:.1f}s, {resultado['processadas'] / max(duracao, 1e-6):,.0f} linhas/s)"
+            ))
+
+        if not importados and not erros:
+            raise CommandError("Nenhuma planilha encontrada nos caminhos informados.")
+
+        duracao_total = time.perf_counter() - inicio_total
+        self.stdout.write(
+            f"Total: {total_linhas} linhas em {duracao_total:.1f}s "
+            f"({total_linhas / max(duracao_total, 1e-6):,.0f} linhas/s), {len(erros)} arquivo(s) com erro."
+        )
+        if erros:
+            raise CommandError(f"{len(erros)} arquivo(s) não foram importados: {', '.join(erros)}")
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chaves.atribuicao import processar_atribuicao
+from chaves.models import AtribuicaoProjetista
+
+
+class Command(BaseCommand):
+    help = (
+        "Atribui projetista às chaves das atribuições enfileiradas pela tela 'Atribuir Projetista'. "
+        "Usa o próprio banco como fila; vários workers podem rodar ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as atribuições pendentes e encerra (útil em cron).',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera entre consultas quando a fila está vazia (padrão: 5).',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            atribuicao = AtribuicaoProjetista.reservar_proxima()
+            if atribuicao is None:
+                if options['uma_vez']:
+                    break
+                # Worker de longa duração: descarta conexões quebradas/expiradas enquanto espera
+                close_old_connections()
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f"Processando atribuição #{atribuicao.pk}: {atribuicao.total} chave(s) para {atribuicao.projetista}")
+            processar_atribuicao(atribuicao)
+            if atribuicao.status == AtribuicaoProjetista.ERRO:
+                self.stderr.write(f"Atribuição #{atribuicao.pk} falhou: {atribuicao.mensagem_erro}")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Atribuição #{atribuicao.pk} concluída: {atribuicao.atualizadas} chave(s) em {atribuicao.lotes} lote(s)."
+                ))
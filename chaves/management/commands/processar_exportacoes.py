@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chaves.exportacao import processar_exportacao
+from chaves.models import ExportacaoChaves
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera os arquivos das exportações de chaves pedidas pelo admin ('Exportar tudo'). "
+        "Usa o próprio banco como fila; vários workers podem rodar ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as exportações pendentes e encerra (útil em cron).',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera entre consultas quando a fila está vazia (padrão: 5).',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            exportacao = ExportacaoChaves.reservar_proxima()
+            if exportacao is None:
+                if options['uma_vez']:
+                    break
+                # Worker de longa duração: descarta conexões quebradas/expiradas enquanto espera
+                close_old_connections()
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f"Processando exportação #{exportacao.pk}: {exportacao.filtros or 'todas as chaves'}")
+            processar_exportacao(exportacao)
+            if exportacao.status == ExportacaoChaves.ERRO:
+                self.stderr.write(f"Exportação #{exportacao.pk} falhou: {exportacao.mensagem_erro}")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Exportação #{exportacao.pk} concluída: {exportacao.linhas} chaves em {exportacao.arquivo.name}."
+                ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from chaves.importacao import processar_importacao
+from chaves.models import ImportacaoPlanilha
+
+
+class Command(BaseCommand):
+    help = (
+        "Processa as importações de planilha enfileiradas pela tela de upload. "
+        "Usa o próprio banco como fila; vários workers podem rodar ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as importações pendentes e encerra (útil em cron).',
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera entre consultas quando a fila está vazia (padrão: 5).',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            importacao = ImportacaoPlanilha.reservar_proxima()
+            if importacao is None:
+                if options['uma_vez']:
+                    break
+                # Worker de longa duração: descarta conexões quebradas/expiradas enquanto espera
+                close_old_connections()
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f"Processando importação #{importacao.pk}: {importacao}")
+            processar_importacao(importacao)
+            if importacao.status == ImportacaoPlanilha.ERRO:
+                self.stderr.write(f"Importação #{importacao.pk} falhou: {importacao.mensagem_erro}")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Importação #{importacao.pk} concluída: {importacao.criados} criadas, "
+                    f"{importacao.duplicados} duplicadas, {importacao.invalidos} inválidas."
+                ))
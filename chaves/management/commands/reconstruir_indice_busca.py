@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chaves.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz o índice de busca por trecho (trigramas) de todas as chaves. "
+        "Necessário só depois de alterações feitas fora do Django (SQL direto, restauração de backup)."
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progresso(total):
+            if total % 10000 == 0:
+                self.stdout.write(f"{total} chaves indexadas...")
+
+        total = reconstruir_indice(progresso)
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice de busca reconstruído: {total} chaves em {time.perf_counter() - inicio:.1f}s."
+        ))
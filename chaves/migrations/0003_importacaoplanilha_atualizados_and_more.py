@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0002_importacaoplanilha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='atualizados',
+            field=models.PositiveIntegerField(default=0, verbose_name='Atualizados'),
+        ),
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='atualizar_existentes',
+            field=models.BooleanField(default=False, verbose_name='Atualizar chaves existentes'),
+        ),
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='inalterados',
+            field=models.PositiveIntegerField(default=0, verbose_name='Sem alteração'),
+        ),
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='relatorio',
+            field=models.FileField(blank=True, upload_to='importacoes/relatorios/%Y/%m/', verbose_name='Relatório por linha'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0003_importacaoplanilha_atualizados_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Hash do conteúdo'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def popular_indice(apps, schema_editor):
+    # Mesma regra de chaves.busca, com os models históricos; depois use
+    # manage.py reconstruir_indice_busca para refazer o índice
+    Chave = apps.get_model('chaves', 'Chave')
+    TrigramaChave = apps.get_model('chaves', 'TrigramaChave')
+    ultimo = 0
+    while True:
+        linhas = list(
+            Chave.objects.filter(pk__gt=ultimo).order_by('pk')
+            .values_list('pk', 'chave', 'ns', 'municipio', 'observacao')[:500]
+        )
+        if not linhas:
+            return
+        registros = []
+        for pk, *valores in linhas:
+            for campo, valor in enumerate(valores, start=1):
+                texto = (valor or '').lower()
+                registros.extend(
+                    TrigramaChave(chave_id=pk, campo=campo, trigrama=trigrama)
+                    for trigrama in {texto[i:i + 3] for i in range(len(texto) - 2)}
+                )
+        TrigramaChave.objects.bulk_create(registros, batch_size=1000)
+        ultimo = linhas[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0004_importacaoplanilha_hash_conteudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrigramaChave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.PositiveSmallIntegerField(choices=[(1, 'Chave'), (2, 'NS'), (3, 'Município'), (4, 'Observação')])),
+                ('trigrama', models.CharField(max_length=3)),
+                ('chave', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='chaves.chave')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de chave',
+                'verbose_name_plural': 'Trigramas de chave',
+                'indexes': [models.Index(fields=['campo', 'trigrama', 'chave'], name='trigrama_busca_idx')],
+            },
+        ),
+        migrations.RunPython(popular_indice, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0005_trigramachave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportacaoChaves',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formato', models.CharField(choices=[('xlsx', 'Excel (xlsx)'), ('csv', 'CSV')], default='xlsx', max_length=4, verbose_name='Formato')),
+                ('filtros', models.JSONField(blank=True, default=dict, verbose_name='Filtros')),
+                ('chave_cache', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('arquivo', models.FileField(blank=True, upload_to='exportacoes/%Y/%m/', verbose_name='Arquivo')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], db_index=True, default='pendente', max_length=20, verbose_name='Status')),
+                ('linhas', models.PositiveIntegerField(default=0, verbose_name='Linhas')),
+                ('mensagem_erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('notificada', models.BooleanField(default=False)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportação de chaves',
+                'verbose_name_plural': 'Exportações de chaves',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
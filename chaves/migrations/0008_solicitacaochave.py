@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0007_emailpendente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitacaoChave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chaves_sem_ns', models.PositiveIntegerField(default=0, verbose_name='Chaves sem NS')),
+                ('urgente', models.BooleanField(default=False, verbose_name='Urgente')),
+                ('data_solicitacao', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Data da solicitação')),
+                ('email', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='solicitacoes', to='chaves.emailpendente')),
+                ('projetista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitacoes', to='chaves.projetista')),
+            ],
+            options={
+                'verbose_name': 'Solicitação de chaves',
+                'verbose_name_plural': 'Solicitações de chaves',
+                'ordering': ['-data_solicitacao'],
+            },
+        ),
+    ]
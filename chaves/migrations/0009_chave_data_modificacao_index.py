@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0008_solicitacaochave'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chave',
+            name='data_modificacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
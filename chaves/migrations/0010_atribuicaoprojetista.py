@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-18 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chaves', '0009_chave_data_modificacao_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtribuicaoProjetista',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filtros', models.JSONField(blank=True, default=dict, verbose_name='Filtros')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Chaves selecionadas')),
+                ('atualizadas', models.PositiveIntegerField(default=0, verbose_name='Chaves atualizadas')),
+                ('lotes', models.PositiveIntegerField(default=0, verbose_name='Lotes')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], db_index=True, default='pendente', max_length=20, verbose_name='Status')),
+                ('mensagem_erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+                ('projetista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chaves.projetista')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Atribuição de projetista',
+                'verbose_name_plural': 'Atribuições de projetista',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
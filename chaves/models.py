@@ -1,8 +1,12 @@
+from datetime import timedelta
 from email.policy import default
 
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.utils.timezone import now
 
 
 class UsuarioManager(BaseUserManager):
@@ -102,7 +106,8 @@ class Chave(models.Model):
     chamado = models.CharField("Chamado", max_length=30, null=True, blank=True)
     data_chamado = models.DateField('Data do Chamado', null=True, blank=True)
     data_inclusao = models.DateTimeField(auto_now_add=True, editable=False)
-    data_modificacao = models.DateTimeField(auto_now=True)
+    # Indexado: a versão dos dados das exportações (chaves.exportacao.versao_dados_chaves) lê o MAX daqui
+    data_modificacao = models.DateTimeField(auto_now=True, db_index=True)
     observacao = models.TextField('Observação', null=True, blank=True)
 
     class Meta:
@@ -112,6 +117,281 @@ class Chave(models.Model):
     def __str__(self):
         return self.chave
 
+
+class TrigramaChave(models.Model):
+    """
+    Índice de busca por trecho: cada sequência de 3 caracteres (em minúsculas)
+    dos campos de texto pesquisáveis de uma chave. Mantido por chaves.busca; a busca
+    procura as chaves que têm todos os trigramas do termo em vez de um
+    LIKE '%termo%', que não usa índice.
+    """
+    CHAVE = 1
+    NS = 2
+    MUNICIPIO = 3
+    OBSERVACAO = 4
+    CAMPO_CHOICES = [
+        (CHAVE, 'Chave'),
+        (NS, 'NS'),
+        (MUNICIPIO, 'Município'),
+        (OBSERVACAO, 'Observação'),
+    ]
+
+    chave = models.ForeignKey(Chave, on_delete=models.CASCADE, related_name='trigramas')
+    campo = models.PositiveSmallIntegerField(choices=CAMPO_CHOICES)
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['campo', 'trigrama', 'chave'], name='trigrama_busca_idx')]
+        verbose_name = 'Trigrama de chave'
+        verbose_name_plural = 'Trigramas de chave'
+
+    def __str__(self):
+        return f"{self.chave_id} {self.get_campo_display()} {self.trigrama!r}"
+
+class ImportacaoPlanilha(models.Model):
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDA, 'Concluída'),
+        (ERRO, 'Erro'),
+    ]
+
+    arquivo = models.FileField('Arquivo', upload_to='importacoes/%Y/%m/')
+    nome_original = models.CharField('Nome do arquivo', max_length=255, blank=True)
+    # sha256 do conteúdo enviado: reenvios do mesmo arquivo reaproveitam esta importação
+    hash_conteudo = models.CharField('Hash do conteúdo', max_length=64, blank=True, db_index=True)
+    usuario = models.ForeignKey(CustomUsuario, on_delete=models.SET_NULL, null=True, blank=True)
+    atualizar_existentes = models.BooleanField('Atualizar chaves existentes', default=False)
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default=PENDENTE, db_index=True)
+    linhas_processadas = models.PositiveIntegerField('Linhas processadas', default=0)
+    criados = models.PositiveIntegerField('Criados', default=0)
+    atualizados = models.PositiveIntegerField('Atualizados', default=0)
+    inalterados = models.PositiveIntegerField('Sem alteração', default=0)
+    duplicados = models.PositiveIntegerField('Duplicados', default=0)
+    invalidos = models.PositiveIntegerField('Inválidos', default=0)
+    mensagem_erro = models.TextField('Erro', blank=True)
+    relatorio = models.FileField('Relatório por linha', upload_to='importacoes/relatorios/%Y/%m/', blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Importação de planilha'
+        verbose_name_plural = 'Importações de planilha'
+
+    def __str__(self):
+        return f"{self.nome_original or self.arquivo.name} ({self.get_status_display()})"
+
+    @property
+    def finalizada(self):
+        return self.status in (self.CONCLUIDA, self.ERRO)
+
+    @classmethod
+    def anterior_identica(cls, hash_conteudo, atualizar_existentes):
+        """
+        Importação mais recente do mesmo conteúdo e no mesmo modo, criada nas
+        últimas IMPORTACAO_REAPROVEITAR_HORAS, que está na fila, rodando ou
+        concluída. Não contam as que terminaram em erro nem as presas em
+        PROCESSANDO por um worker parado: o reenvio nesses casos é uma nova
+        tentativa. Uma importação antiga também não: as chaves do banco já
+        mudaram desde então e o arquivo precisa ser aplicado de novo.
+        """
+        if not hash_conteudo:
+            return None
+        return cls.objects.filter(
+            Q(status__in=[cls.PENDENTE, cls.CONCLUIDA]) | Q(status=cls.PROCESSANDO, data_inicio__gte=cls.inicio_expirado()),
+            hash_conteudo=hash_conteudo,
+            atualizar_existentes=atualizar_existentes,
+            data_criacao__gte=now() - timedelta(hours=settings.IMPORTACAO_REAPROVEITAR_HORAS),
+        ).order_by('-id').first()
+
+    @classmethod
+    def inicio_expirado(cls):
+        """Importações em PROCESSANDO iniciadas antes disso são de um worker que parou no meio."""
+        return now() - timedelta(minutes=settings.IMPORTACAO_RESERVA_EXPIRA_MINUTOS)
+
+    @classmethod
+    def reservar_proxima(cls):
+        """
+        Reserva a importação pendente mais antiga para o worker, ou uma que
+        ficou em PROCESSANDO além de IMPORTACAO_RESERVA_EXPIRA_MINUTOS. A
+        troca de status é um UPDATE condicional: se dois workers disputarem o
+        mesmo registro, só um consegue reservá-lo.
+        """
+        disponiveis = Q(status=cls.PENDENTE) | Q(status=cls.PROCESSANDO, data_inicio__lt=cls.inicio_expirado())
+        pendentes = cls.objects.filter(disponiveis).order_by('id').values_list('id', flat=True)[:10]
+        for pk in pendentes:
+            reservada = cls.objects.filter(disponiveis, pk=pk).update(
+                status=cls.PROCESSANDO, data_inicio=now()
+            )
+            if reservada:
+                return cls.objects.get(pk=pk)
+        return None
+
+
+class ExportacaoChaves(models.Model):
+    """
+    Exportação de todas as chaves de um filtro do admin, gerada pelo worker
+    (manage.py processar_exportacoes) e guardada em MEDIA_ROOT. Pedidos com
+    o mesmo formato, filtros e versão dos dados (chave_cache) reaproveitam o
+    arquivo já gerado.
+    """
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDA, 'Concluída'),
+        (ERRO, 'Erro'),
+    ]
+
+    XLSX = 'xlsx'
+    CSV = 'csv'
+    FORMATO_CHOICES = [
+        (XLSX, 'Excel (xlsx)'),
+        (CSV, 'CSV'),
+    ]
+
+    usuario = models.ForeignKey(CustomUsuario, on_delete=models.SET_NULL, null=True, blank=True)
+    formato = models.CharField('Formato', max_length=4, choices=FORMATO_CHOICES, default=XLSX)
+    filtros = models.JSONField('Filtros', default=dict, blank=True)
+    # sha256 de formato + filtros + versão dos dados (chaves.exportacao.chave_cache_exportacao)
+    chave_cache = models.CharField(max_length=64, db_index=True, editable=False)
+    arquivo = models.FileField('Arquivo', upload_to='exportacoes/%Y/%m/', blank=True)
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default=PENDENTE, db_index=True)
+    linhas = models.PositiveIntegerField('Linhas', default=0)
+    mensagem_erro = models.TextField('Erro', blank=True)
+    # Aviso de término já mostrado ao usuário na listagem de chaves do admin
+    notificada = models.BooleanField(default=False)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Exportação de chaves'
+        verbose_name_plural = 'Exportações de chaves'
+
+    def __str__(self):
+        return f"Exportação #{self.pk} ({self.get_formato_display()}, {self.get_status_display()})"
+
+    @property
+    def finalizada(self):
+        return self.status in (self.CONCLUIDA, self.ERRO)
+
+    @property
+    def nome_download(self):
+        return f"chaves_{self.pk}.{self.formato}"
+
+    @property
+    def tem_arquivo(self):
+        return bool(self.arquivo) and self.arquivo.storage.exists(self.arquivo.name)
+
+    @classmethod
+    def reaproveitavel(cls, chave_cache, usuario):
+        """
+        Exportação de `usuario` com a mesma chave que está na fila, rodando ou
+        concluída com arquivo. Se só outro usuário tem o arquivo pronto, cria
+        para `usuario` uma exportação já concluída apontando para o mesmo
+        arquivo, para que ele possa acompanhá-la e receba o aviso de término.
+        """
+        exportacao = cls.objects.filter(
+            chave_cache=chave_cache, usuario=usuario,
+            status__in=[cls.PENDENTE, cls.PROCESSANDO, cls.CONCLUIDA],
+        ).order_by('-id').first()
+        if exportacao and (exportacao.status != cls.CONCLUIDA or exportacao.tem_arquivo):
+            return exportacao
+
+        pronta = cls.objects.filter(chave_cache=chave_cache, status=cls.CONCLUIDA).exclude(arquivo='').order_by('-id').first()
+        if not (pronta and pronta.tem_arquivo):
+            return None
+        agora = now()
+        return cls.objects.create(
+            usuario=usuario, formato=pronta.formato, filtros=pronta.filtros, chave_cache=chave_cache,
+            arquivo=pronta.arquivo.name, status=cls.CONCLUIDA, linhas=pronta.linhas,
+            data_inicio=agora, data_fim=agora,
+        )
+
+    @classmethod
+    def reservar_proxima(cls):
+        """Reserva a exportação pendente mais antiga para o worker (mesmo UPDATE condicional das importações)."""
+        pendentes = cls.objects.filter(status=cls.PENDENTE).order_by('id').values_list('id', flat=True)[:10]
+        for pk in pendentes:
+            reservada = cls.objects.filter(pk=pk, status=cls.PENDENTE).update(
+                status=cls.PROCESSANDO, data_inicio=now()
+            )
+            if reservada:
+                return cls.objects.get(pk=pk)
+        return None
+
+
+
+class AtribuicaoProjetista(models.Model):
+    """
+    Atribuição de projetista às chaves de um filtro, feita pelo worker
+    (manage.py processar_atribuicoes) em lotes por faixa de id
+    (chaves.atribuicao). `atualizadas` avança a cada lote; a tela da
+    atribuição acompanha o progresso.
+    """
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDA, 'Concluída'),
+        (ERRO, 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(CustomUsuario, on_delete=models.SET_NULL, null=True, blank=True)
+    projetista = models.ForeignKey(Projetista, on_delete=models.CASCADE)
+    filtros = models.JSONField('Filtros', default=dict, blank=True)
+    total = models.PositiveIntegerField('Chaves selecionadas', default=0)
+    atualizadas = models.PositiveIntegerField('Chaves atualizadas', default=0)
+    lotes = models.PositiveIntegerField('Lotes', default=0)
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default=PENDENTE, db_index=True)
+    mensagem_erro = models.TextField('Erro', blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Atribuição de projetista'
+        verbose_name_plural = 'Atribuições de projetista'
+
+    def __str__(self):
+        return f"Atribuição #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def finalizada(self):
+        return self.status in (self.CONCLUIDA, self.ERRO)
+
+    @classmethod
+    def reservar_proxima(cls):
+        """
+        Reserva a atribuição pendente mais antiga para o worker (mesmo UPDATE condicional das
+        importações), ou uma parada em PROCESSANDO por um worker que morreu: refazer os lotes
+        já aplicados não muda nada.
+        """
+        expirado = now() - timedelta(minutes=settings.ATRIBUICAO_RESERVA_EXPIRA_MINUTOS)
+        disponiveis = Q(status=cls.PENDENTE) | Q(status=cls.PROCESSANDO, data_inicio__lt=expirado)
+        candidatas = cls.objects.filter(disponiveis).order_by('id').values_list('id', flat=True)[:10]
+        for pk in candidatas:
+            reservada = cls.objects.filter(disponiveis, pk=pk).update(status=cls.PROCESSANDO, data_inicio=now())
+            if reservada:
+                return cls.objects.get(pk=pk)
+        return None
+
+
 class Aviso(models.Model):
     titulo = models.CharField(max_length=200)
     mensagem = models.TextField()
@@ -137,4 +417,69 @@ class EmailConfig(models.Model):
         verbose_name_plural = 'Destinatários'
 
     def __str__(self):
-        return f"{self.nome} <{self.email}>"
\ No newline at end of file
+        return f"{self.nome} <{self.email}>"
+
+class EmailPendente(models.Model):
+    """
+    Caixa de saída de e-mails. As views gravam aqui em vez de abrir uma
+    conexão SMTP na requisição; o worker (manage.py enviar_emails) envia em
+    lotes por uma única conexão e reagenda as falhas com espera crescente
+    (chaves.emails).
+    """
+    PENDENTE = 'pendente'
+    ENVIANDO = 'enviando'
+    ENVIADO = 'enviado'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (ENVIANDO, 'Enviando'),
+        (ENVIADO, 'Enviado'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    assunto = models.CharField('Assunto', max_length=255)
+    remetente = models.CharField('Remetente', max_length=255)
+    destinatarios = models.JSONField('Destinatários', default=list)
+    corpo_texto = models.TextField('Texto')
+    corpo_html = models.TextField('HTML', blank=True)
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    tentativas = models.PositiveIntegerField('Tentativas', default=0)
+    proxima_tentativa = models.DateTimeField('Próxima tentativa', default=now)
+    ultimo_erro = models.TextField('Último erro', blank=True)
+    reservado_em = models.DateTimeField(null=True, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'E-mail pendente'
+        verbose_name_plural = 'Caixa de saída de e-mails'
+        indexes = [
+            # Fila do worker: pendentes cuja próxima tentativa já chegou
+            models.Index(fields=['status', 'proxima_tentativa'], name='emailpendente_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.assunto} ({self.get_status_display()})"
+
+
+class SolicitacaoChave(models.Model):
+    """
+    Pedido de mais chaves feito por um projetista. Os pedidos de uma janela
+    de SOLICITACOES_JANELA_MINUTOS saem juntos num único e-mail de resumo
+    (chaves.solicitacoes); os urgentes vão para a caixa de saída na hora.
+    """
+    projetista = models.ForeignKey(Projetista, on_delete=models.CASCADE, related_name='solicitacoes')
+    chaves_sem_ns = models.PositiveIntegerField('Chaves sem NS', default=0)
+    urgente = models.BooleanField('Urgente', default=False)
+    data_solicitacao = models.DateTimeField('Data da solicitação', default=now, db_index=True)
+    # E-mail (resumo) em que o pedido foi enviado; vazio enquanto espera a janela fechar
+    email = models.ForeignKey(EmailPendente, on_delete=models.SET_NULL, null=True, blank=True, related_name='solicitacoes')
+
+    class Meta:
+        ordering = ['-data_solicitacao']
+        verbose_name = 'Solicitação de chaves'
+        verbose_name_plural = 'Solicitações de chaves'
+
+    def __str__(self):
+        return f"{self.projetista} em {self.data_solicitacao:%d/%m/%Y %H:%M}"
@@ -0,0 +1,83 @@
+"""
+Paginação por cursor (keyset) para listagens grandes.
+
+Em vez de COUNT(*) + LIMIT/OFFSET, cada página é buscada a partir do último
+id exibido (`?apos=<id>`) ou do primeiro (`?antes=<id>`), usando o índice da
+chave primária. O custo de uma página não depende de quantas vêm antes dela
+nem do tamanho da tabela; o total só é contado quando pedido (`?contar=1`).
+"""
+from urllib.parse import urlencode
+
+# Parâmetros da querystring usados pela paginação; os demais (filtros) são preservados nos links
+PARAMETROS_CURSOR = ('apos', 'antes', 'page', 'contar')
+
+
+class PaginaPorCursor:
+    def __init__(self, itens, tem_anterior, tem_proxima, parametros, cursor, total=None):
+        self.itens = itens
+        self.tem_anterior = tem_anterior
+        self.tem_proxima = tem_proxima
+        self.total = total
+        self._parametros = parametros
+        self._cursor = cursor
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def _url(self, **cursor):
+        return '?' + urlencode({**self._parametros, **cursor})
+
+    @property
+    def url_anterior(self):
+        return self._url(antes=self.itens[0].pk) if self.tem_anterior and self.itens else ''
+
+    @property
+    def url_proxima(self):
+        return self._url(apos=self.itens[-1].pk) if self.tem_proxima and self.itens else ''
+
+    @property
+    def url_contar(self):
+        return self._url(**self._cursor, contar=1)
+
+
+def _cursor(valor):
+    return int(valor) if valor and valor.isdigit() else None
+
+
+def paginar_por_cursor(queryset, querydict, por_pagina=20):
+    """
+    Página de `queryset` ordenada por id, conforme os cursores de `querydict`
+    (request.GET). Busca por_pagina + 1 linhas para saber se há próxima
+    página sem contar o resto.
+    """
+    parametros = {}
+    for nome, valores in querydict.lists():
+        if nome not in PARAMETROS_CURSOR and valores:
+            parametros[nome] = valores[-1]
+
+    apos = _cursor(querydict.get('apos'))
+    antes = _cursor(querydict.get('antes'))
+
+    if antes is not None:
+        itens = list(queryset.filter(pk__lt=antes).order_by('-pk')[:por_pagina + 1])
+        tem_anterior = len(itens) > por_pagina
+        itens = itens[:por_pagina][::-1]
+        tem_proxima = True
+        if not itens:
+            # Nada antes do cursor (ex.: registros apagados): volta para a primeira página
+            antes = None
+    if antes is None:
+        consulta = queryset.order_by('pk')
+        if apos is not None:
+            consulta = consulta.filter(pk__gt=apos)
+        itens = list(consulta[:por_pagina + 1])
+        tem_proxima = len(itens) > por_pagina
+        itens = itens[:por_pagina]
+        tem_anterior = apos is not None
+
+    cursor = {'antes': antes} if antes is not None else {'apos': apos} if apos is not None else {}
+    total = queryset.count() if querydict.get('contar') else None
+    return PaginaPorCursor(itens, tem_anterior, tem_proxima, parametros, cursor, total)
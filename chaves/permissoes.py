@@ -0,0 +1,102 @@
+"""
+Papéis do usuário e permissões sobre chaves, resolvidos uma vez por requisição.
+
+Os grupos do usuário e os ids dos projetistas ligados a ele são lidos juntos
+(2 consultas), guardados no cache por TEMPO_CACHE segundos e memorizados no
+próprio objeto request.user; as verificações seguintes da mesma requisição
+não vão ao banco.
+
+Mudanças de grupo (m2m de CustomUsuario.groups, renomear/apagar Group) e de
+projetista invalidam o cache trocando a versão das chaves (chaves.signals). Sem CACHES
+configurado o Django usa LocMemCache, que é por processo: nos outros
+processos o TEMPO_CACHE limita por quanto tempo um papel removido ainda vale.
+"""
+from django.core.cache import cache
+
+from .models import Chave, Projetista
+
+SUPERVISOR = 'supervisor_projetos'
+TECNICOS = 'tecnicos'
+TOPOGRAFIA = 'topografia'
+
+TEMPO_CACHE = 60
+CHAVE_VERSAO = 'permissoes:versao'
+
+
+def _versao():
+    return cache.get_or_set(CHAVE_VERSAO, 1, None)
+
+
+def invalidar_cache():
+    """Descarta os papéis em cache de todos os usuários."""
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.set(CHAVE_VERSAO, 1, None)
+
+
+def _perfil(usuario):
+    """(grupos, ids de projetista) do usuário: memória da requisição, depois cache, depois banco."""
+    perfil = getattr(usuario, '_perfil_permissoes', None)
+    if perfil is not None:
+        return perfil
+    if not usuario.is_authenticated:
+        perfil = (frozenset(), frozenset())
+    else:
+        chave = f"permissoes:{_versao()}:{usuario.pk}"
+        perfil = cache.get(chave)
+        if perfil is None:
+            perfil = (
+                frozenset(usuario.groups.values_list('name', flat=True)),
+                frozenset(Projetista.objects.filter(email_id=usuario.pk).values_list('pk', flat=True)),
+            )
+            cache.set(chave, perfil, TEMPO_CACHE)
+    usuario._perfil_permissoes = perfil
+    return perfil
+
+
+def grupos(usuario):
+    return _perfil(usuario)[0]
+
+
+def projetistas_do_usuario(usuario):
+    """Ids dos projetistas cujo usuário (Projetista.email) é `usuario`."""
+    return _perfil(usuario)[1]
+
+
+def no_grupo(usuario, nome):
+    return nome in grupos(usuario)
+
+
+def eh_supervisor(usuario):
+    """Superusuário ou grupo supervisor_projetos: vê e altera todas as chaves."""
+    return usuario.is_superuser or no_grupo(usuario, SUPERVISOR)
+
+
+def pode_gerenciar_chaves(usuario):
+    return eh_supervisor(usuario) or no_grupo(usuario, TECNICOS)
+
+
+def pode_editar_chave(usuario, chave):
+    """Supervisores editam qualquer chave; os demais, só as do seu projetista (pelo projetista_id, sem carregar o projetista)."""
+    return eh_supervisor(usuario) or (
+        chave.projetista_id is not None and chave.projetista_id in projetistas_do_usuario(usuario)
+    )
+
+
+def chaves_visiveis(usuario):
+    """Chaves que `usuario` vê em gerenciar_chaves: todas para supervisores, as dos seus projetistas para os demais."""
+    if eh_supervisor(usuario):
+        return Chave.objects.all()
+    return Chave.objects.filter(projetista_id__in=projetistas_do_usuario(usuario))
+
+
+def contexto_papeis(usuario):
+    """Variáveis de papel usadas pelos templates (menu, base.html)."""
+    return {
+        'is_superuser': usuario.is_superuser,
+        'usuario_no_grupo_supervisor': no_grupo(usuario, SUPERVISOR),
+        'usuario_no_grupo_tecnicos': no_grupo(usuario, TECNICOS),
+        'usuario_no_grupo_topografia': no_grupo(usuario, TOPOGRAFIA),
+    }
+
@@ -0,0 +1,84 @@
+"""
+Reserva de chaves pelo próprio projetista, a partir das chaves sem projetista.
+
+Tudo numa transação:
+
+1. trava a linha do projetista (SELECT ... FOR UPDATE): pedidos simultâneos
+   do mesmo projetista passam um de cada vez pela regra de LIMITE_SEM_NS,
+   que assim não é furada por duas requisições ao mesmo tempo; o pedido é
+   reduzido ao que falta para o limite;
+2. escolhe as chaves livres com SELECT ... FOR UPDATE SKIP LOCKED: chaves
+   que outra reserva em andamento já travou são puladas, sem esperar o
+   lock nem entregar a mesma chave a dois projetistas;
+3. atribui as chaves escolhidas.
+
+No SQLite (testes locais) não há FOR UPDATE; as escritas já são em série.
+"""
+from django.db import transaction
+from django.utils.timezone import now
+
+from core.facetas import invalidar_facetas
+
+from .models import Chave, Projetista
+
+# Com esta quantidade de chaves sem NS o projetista não pode pedir mais (mesma regra da solicitação por e-mail)
+LIMITE_SEM_NS = 3
+
+# Chaves por reserva
+MAXIMO_POR_RESERVA = 10
+
+
+class ReservaNegada(Exception):
+    pass
+
+
+def cota_restante(usuario):
+    """
+    Quantas chaves o projetista de `usuario` ainda pode reservar agora (no máximo
+    MAXIMO_POR_RESERVA). Só para exibir no formulário: quem decide é reservar_chaves().
+    """
+    chaves_sem_ns = Chave.objects.filter(projetista__email=usuario, ns__isnull=True).count()
+    return max(0, min(MAXIMO_POR_RESERVA, LIMITE_SEM_NS - chaves_sem_ns))
+
+
+def verificar_cota(projetista, acao='Reserva'):
+    """
+    Chaves sem NS de `projetista`; levanta ReservaNegada se já chegou a LIMITE_SEM_NS.
+    Regra única da reserva direta e da solicitação por e-mail.
+    """
+    chaves_sem_ns = Chave.objects.filter(projetista=projetista, ns__isnull=True).count()
+    if chaves_sem_ns >= LIMITE_SEM_NS:
+        raise ReservaNegada(f"{acao} negada! Você ainda tem {chaves_sem_ns} chaves para serem designadas.")
+    return chaves_sem_ns
+
+
+def reservar_chaves(projetista, quantidade):
+    """
+    Atribui a `projetista` até `quantidade` chaves sem projetista, sem passar de
+    LIMITE_SEM_NS chaves sem NS. Devolve (chaves reservadas, quantidade atendida):
+    a quantidade atendida é menor que a pedida quando o limite a reduziu.
+    """
+    if not 1 <= quantidade <= MAXIMO_POR_RESERVA:
+        raise ReservaNegada(f"Informe de 1 a {MAXIMO_POR_RESERVA} chaves.")
+
+    with transaction.atomic():
+        # Primeira leitura da transação: no REPEATABLE READ do MySQL a contagem abaixo já
+        # enxerga o que a reserva anterior deste projetista gravou antes de soltar o lock
+        Projetista.objects.select_for_update().filter(pk=projetista.pk).first()
+        chaves_sem_ns = verificar_cota(projetista)
+        quantidade = min(quantidade, LIMITE_SEM_NS - chaves_sem_ns)
+
+        livres = list(
+            Chave.objects.select_for_update(skip_locked=True)
+            .filter(projetista__isnull=True)
+            .order_by('pk')
+            .values_list('pk', 'chave')[:quantidade]
+        )
+        if not livres:
+            raise ReservaNegada("Não há chaves livres no momento. Tente novamente mais tarde.")
+        ids, chaves = zip(*livres)
+        # update() não passa por auto_now; data_modificacao muda a versão das exportações em cache
+        Chave.objects.filter(pk__in=ids).update(projetista=projetista, data_modificacao=now())
+
+    invalidar_facetas(Chave)
+    return list(chaves), quantidade
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .busca import atualizar_indice
+from .models import Chave, CustomUsuario, Projetista
+from .permissoes import invalidar_cache
+
+
+@receiver(post_save, sender=Chave)
+def indexar_chave(sender, instance, created, raw=False, **kwargs):
+    # Mantém o índice de busca por trecho (chaves.busca) em dia a cada save
+    if not raw:
+        atualizar_indice([instance.pk], novas=created)
+
+
+@receiver(m2m_changed, sender=CustomUsuario.groups.through)
+def grupos_alterados(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_cache()
+
+
+@receiver(post_save, sender=CustomUsuario)
+@receiver(post_delete, sender=CustomUsuario)
+def usuario_alterado(sender, created=False, **kwargs):
+    # Só criação e exclusão: um id reaproveitado não pode herdar papéis em cache
+    if created or kwargs['signal'] is post_delete:
+        invalidar_cache()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Projetista)
+@receiver(post_delete, sender=Projetista)
+def papeis_alterados(sender, **kwargs):
+    # Papéis em cache (chaves.permissoes) dependem do nome dos grupos e do usuário de cada projetista
+    invalidar_cache()
@@ -0,0 +1,69 @@
+"""
+Resumo das solicitações de chaves.
+
+Cada "Solicitar Chaves" vira uma SolicitacaoChave. O primeiro pedido sem
+e-mail abre uma janela de SOLICITACOES_JANELA_MINUTOS; quando ela fecha, o
+worker (manage.py enviar_emails) junta todos os pedidos pendentes num único
+e-mail para os destinatários de EmailConfig, com o projetista, as chaves
+sem NS e a hora de cada pedido. Pedidos urgentes (ou janela 0) vão sozinhos
+para a caixa de saída na hora.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .emails import enfileirar_email
+from .models import EmailConfig, SolicitacaoChave
+
+ASSUNTO = 'Solicitação de Chaves'
+ASSUNTO_RESUMO = 'Solicitações de Chaves ({quantidade})'
+
+
+def _enviar(solicitacoes):
+    """Grava o e-mail de `solicitacoes` na caixa de saída e o liga aos pedidos; None se outro worker já os enviou."""
+    ids = [solicitacao.pk for solicitacao in solicitacoes]
+    destinatarios = EmailConfig.objects.values_list('email', flat=True)
+    with transaction.atomic():
+        if len(solicitacoes) == 1:
+            solicitacao = solicitacoes[0]
+            email = enfileirar_email(ASSUNTO, 'email_solicitacao_chave.html', {
+                'usuario_nome': solicitacao.projetista.projetista,
+                'data_solicitacao': solicitacao.data_solicitacao,
+                'chaves_sem_ns': solicitacao.chaves_sem_ns,
+                'urgente': solicitacao.urgente,
+            }, destinatarios)
+        else:
+            email = enfileirar_email(
+                ASSUNTO_RESUMO.format(quantidade=len(solicitacoes)),
+                'email_resumo_solicitacoes.html',
+                {'solicitacoes': solicitacoes},
+                destinatarios,
+            )
+        # Mesmo UPDATE condicional das filas: se outro worker ligou os pedidos antes, desfaz
+        if SolicitacaoChave.objects.filter(pk__in=ids, email__isnull=True).update(email=email) != len(ids):
+            transaction.set_rollback(True)
+            return None
+    return email
+
+
+def registrar_solicitacao(projetista, chaves_sem_ns, urgente=False):
+    """Grava o pedido; urgente (ou sem janela configurada) já vai para a caixa de saída."""
+    solicitacao = SolicitacaoChave.objects.create(projetista=projetista, chaves_sem_ns=chaves_sem_ns, urgente=urgente)
+    if urgente or not settings.SOLICITACOES_JANELA_MINUTOS:
+        _enviar([solicitacao])
+    return solicitacao
+
+
+def enviar_resumo(agora=None):
+    """Junta num e-mail os pedidos pendentes se a janela do mais antigo já fechou. Devolve o EmailPendente ou None."""
+    agora = agora or now()
+    pendentes = list(
+        SolicitacaoChave.objects.filter(email__isnull=True).select_related('projetista').order_by('data_solicitacao', 'id')
+    )
+    if not pendentes:
+        return None
+    if pendentes[0].data_solicitacao > agora - timedelta(minutes=settings.SOLICITACOES_JANELA_MINUTOS):
+        return None
+    return _enviar(pendentes)
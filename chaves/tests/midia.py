@@ -0,0 +1,19 @@
+import tempfile
+
+from django.test import override_settings
+
+
+class MidiaTemporaria:
+    """
+    MEDIA_ROOT num diretório temporário criado no setUpClass e apagado no fim
+    da classe, em vez de um mkdtemp() no import do módulo que fica para trás.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        diretorio = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(diretorio.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=diretorio.name)
+        configuracao.enable()
+        cls.addClassCleanup(configuracao.disable)
+        super().setUpClass()
@@ -0,0 +1,253 @@
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from chaves.atribuicao import atribuir_em_lotes, processar_atribuicao
+from chaves.exportacao import COLUNAS, linhas_exportacao, versao_dados_chaves
+from chaves.tests.midia import MidiaTemporaria
+from chaves.models import AtribuicaoProjetista, Chave, CustomUsuario, ExportacaoChaves, Polo, Projetista
+from logs.lentas import explicar
+
+
+class FiltrosFacetadosTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        self.client.login(email='admin@test.com', password='password')
+        self.maria = Projetista.objects.create(projetista='Maria')
+        Projetista.objects.create(projetista='Sem chaves')
+        Chave.objects.create(chave='CHV01', projetista=self.maria)
+        Chave.objects.create(chave='CHV02', projetista=self.maria)
+        Chave.objects.create(chave='CHV03')
+
+    def carregar(self, **parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('admin:chaves_chave_changelist'), parametros)
+        self.assertEqual(response.status_code, 200)
+        return response, len(consultas)
+
+    def test_opcoes_com_contagem_em_cache(self):
+        response, primeira = self.carregar()
+        self.assertContains(response, 'Maria (2)')
+        self.assertContains(response, 'Não Atribuído (1)')
+        # Só projetistas que têm chaves entram no filtro
+        self.assertNotContains(response, 'Sem chaves')
+
+        _, segunda = self.carregar()
+        # Sem o GROUP BY das opções, os nomes dos projetistas e o COUNT(*) da listagem
+        self.assertLessEqual(segunda, primeira - 2)
+
+        response, _ = self.carregar(projetista__id__exact=self.maria.pk)
+        self.assertContains(response, 'CHV02')
+        self.assertNotContains(response, 'CHV03')
+
+    def test_contagens_atualizadas_ao_salvar(self):
+        self.carregar()
+        Chave.objects.create(chave='CHV04', projetista=self.maria)
+
+        response, _ = self.carregar()
+        self.assertContains(response, 'Maria (3)')
+
+
+class ExportacaoExcelTestCase(TestCase):
+    def setUp(self):
+        CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        self.client.login(email='admin@test.com', password='password')
+        projetista = Projetista.objects.create(projetista='Maria')
+        polo = Polo.objects.create(polo='POA')
+        Chave.objects.create(chave='CHV01', projetista=projetista, polo=polo, ns='1234567890')
+        Chave.objects.create(chave='CHV02', projetista=projetista)
+        Chave.objects.create(chave='CHV03')
+
+    def test_linhas_em_blocos_com_join(self):
+        # 3 chaves em blocos de 2: duas consultas, sem uma por projetista/polo
+        with self.assertNumQueries(2):
+            linhas = list(linhas_exportacao(Chave.objects.all(), tamanho_bloco=2))
+        self.assertEqual([linha[:3] for linha in linhas], [
+            ['CHV01', 'Maria', '1234567890'],
+            ['CHV02', 'Maria', None],
+            ['CHV03', '', None],
+        ])
+        self.assertEqual(linhas[0][5], 'POA')
+
+    def test_acao_do_admin(self):
+        from openpyxl import load_workbook
+
+        response = self.client.post(reverse('admin:chaves_chave_changelist'), {
+            'action': 'exportar_para_excel',
+            '_selected_action': list(Chave.objects.filter(chave__in=['CHV01', 'CHV03']).values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('relatorio_chaves.xlsx', response['Content-Disposition'])
+
+        planilha = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        linhas = list(planilha.active.iter_rows(values_only=True))
+        self.assertEqual(list(linhas[0]), COLUNAS)
+        self.assertEqual([linha[0] for linha in linhas[1:]], ['CHV01', 'CHV03'])
+
+
+class ExportarTudoTestCase(MidiaTemporaria, TestCase):
+    def setUp(self):
+        self.admin = CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        self.client.login(email='admin@test.com', password='password')
+        self.maria = Projetista.objects.create(projetista='Maria')
+        Chave.objects.create(chave='CHV01', projetista=self.maria)
+        Chave.objects.create(chave='CHV02', projetista=self.maria)
+        Chave.objects.create(chave='CHV03')
+
+    def pedir(self, **parametros):
+        return self.client.get(reverse('admin:chaves_chave_exportar_tudo'), parametros)
+
+    def test_worker_gera_arquivo_do_filtro(self):
+        response = self.pedir(projetista__id__exact=self.maria.pk, formato='csv', o='1', p='2')
+        exportacao = ExportacaoChaves.objects.get()
+        self.assertRedirects(response, reverse('exportacao_chaves', kwargs={'id': exportacao.pk}))
+        # Ordenação e página da listagem não entram nos filtros
+        self.assertEqual(exportacao.filtros, {'projetista__id__exact': str(self.maria.pk)})
+
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO(), stderr=StringIO())
+        exportacao.refresh_from_db()
+        self.assertEqual(exportacao.status, ExportacaoChaves.CONCLUIDA)
+        self.assertEqual(exportacao.linhas, 2)
+
+        response = self.client.get(reverse('baixar_exportacao', kwargs={'id': exportacao.pk}))
+        bruto = b''.join(response.streaming_content)
+        self.assertTrue(bruto.startswith(b'\xef\xbb\xbf'))
+        conteudo = bruto.decode('utf-8-sig').splitlines()
+        self.assertEqual(conteudo[0].split(';'), COLUNAS)
+        self.assertEqual([linha.split(';')[0] for linha in conteudo[1:]], ['CHV01', 'CHV02'])
+
+        # Aviso com o link para baixar, uma vez só, na listagem do admin
+        response = self.client.get(reverse('admin:chaves_chave_changelist'))
+        self.assertContains(response, reverse('baixar_exportacao', kwargs={'id': exportacao.pk}))
+        response = self.client.get(reverse('admin:chaves_chave_changelist'))
+        self.assertNotContains(response, reverse('baixar_exportacao', kwargs={'id': exportacao.pk}))
+
+    def test_reaproveita_arquivo_enquanto_dados_nao_mudam(self):
+        self.pedir(q='CHV')
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO(), stderr=StringIO())
+        self.pedir(q='CHV')
+        self.assertEqual(ExportacaoChaves.objects.count(), 1)
+
+        # Outro formato ou outros dados: nova exportação
+        self.pedir(q='CHV', formato='csv')
+        self.assertEqual(ExportacaoChaves.objects.count(), 2)
+        Chave.objects.create(chave='CHV04')
+        self.pedir(q='CHV')
+        self.assertEqual(ExportacaoChaves.objects.count(), 3)
+
+    def test_outro_usuario_recebe_exportacao_propria_com_o_mesmo_arquivo(self):
+        self.pedir(q='CHV')
+        call_command('processar_exportacoes', '--uma-vez', stdout=StringIO(), stderr=StringIO())
+        original = ExportacaoChaves.objects.get()
+
+        # Staff sem ser supervisor: só enxerga as próprias exportações
+        outro = CustomUsuario.objects.create_user(email='outro@test.com', password='password', is_staff=True)
+        outro.user_permissions.add(Permission.objects.get(codename='view_chave'))
+        self.client.login(email='outro@test.com', password='password')
+        self.pedir(q='CHV')
+        copia = ExportacaoChaves.objects.exclude(pk=original.pk).get()
+        self.assertEqual(copia.usuario.email, 'outro@test.com')
+        self.assertEqual(copia.status, ExportacaoChaves.CONCLUIDA)
+        self.assertEqual(copia.arquivo.name, original.arquivo.name)
+        self.assertEqual(copia.linhas, original.linhas)
+        response = self.client.get(reverse('progresso_exportacao', kwargs={'id': copia.pk}))
+        self.assertEqual(response.status_code, 200)
+
+        # O aviso de término vai para quem pediu
+        response = self.client.get(reverse('admin:chaves_chave_changelist'))
+        self.assertContains(response, reverse('baixar_exportacao', kwargs={'id': copia.pk}))
+
+        # Novo pedido do mesmo usuário reaproveita a própria exportação
+        self.pedir(q='CHV')
+        self.assertEqual(ExportacaoChaves.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', 'plano do EXPLAIN QUERY PLAN do SQLite')
+    def test_versao_dos_dados_le_so_o_indice(self):
+        with CaptureQueriesContext(connection) as consultas:
+            versao_dados_chaves()
+        plano = explicar('default', consultas.captured_queries[0]['sql'], ())
+        self.assertIn('COVERING INDEX', plano)
+
+    def test_somente_dono_ou_supervisor(self):
+        self.pedir()
+        exportacao = ExportacaoChaves.objects.get()
+        CustomUsuario.objects.create_user(email='outro@test.com', password='password')
+        self.client.login(email='outro@test.com', password='password')
+        response = self.client.get(reverse('progresso_exportacao', kwargs={'id': exportacao.pk}))
+        self.assertEqual(response.status_code, 403)
+
+
+class AtribuirProjetistaEmLotesTestCase(TestCase):
+    def setUp(self):
+        CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        self.client.login(email='admin@test.com', password='password')
+        self.maria = Projetista.objects.create(projetista='Maria')
+        self.joao = Projetista.objects.create(projetista='João')
+        for i in range(5):
+            Chave.objects.create(chave=f'CHV0{i}', projetista=self.maria if i == 0 else None)
+
+    def test_selecionar_todas_leva_o_filtro(self):
+        changelist = reverse('admin:chaves_chave_changelist')
+        response = self.client.post(f"{changelist}?projetista=nao_atribuido", {
+            'action': 'atribuir_projetista',
+            'select_across': '1',
+            '_selected_action': [Chave.objects.filter(projetista__isnull=True).first().pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('chave_ids', self.client.session)
+
+        response = self.client.get(response.url)
+        self.assertContains(response, '4 chave(s) selecionada(s)')
+        filtro = response.context['form'].initial['filtro']
+
+        # Mais chaves que um lote: vai para o worker
+        with mock.patch('chaves.views.TAMANHO_LOTE', 3):
+            response = self.client.post(reverse('atribuir_projetista'), {'projetista': self.joao.pk, 'filtro': filtro})
+        atribuicao = AtribuicaoProjetista.objects.get()
+        self.assertRedirects(response, reverse('atribuicao_projetista', kwargs={'id': atribuicao.pk}))
+        self.assertEqual((atribuicao.status, atribuicao.total), (AtribuicaoProjetista.PENDENTE, 4))
+        self.assertFalse(Chave.objects.filter(projetista=self.joao).exists())
+
+        # O worker roda os lotes e o progresso mostra o andamento
+        call_command('processar_atribuicoes', '--uma-vez', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Chave.objects.filter(projetista=self.joao).count(), 4)
+        self.assertEqual(Chave.objects.filter(projetista=self.maria).count(), 1)
+        progresso = self.client.get(reverse('progresso_atribuicao', kwargs={'id': atribuicao.pk})).json()
+        self.assertEqual(progresso['status'], AtribuicaoProjetista.CONCLUIDA)
+        self.assertEqual((progresso['atualizadas'], progresso['total']), (4, 4))
+
+    def test_filtro_alterado_e_recusado(self):
+        response = self.client.post(reverse('atribuir_projetista'), {'projetista': self.joao.pk, 'filtro': 'e30:adulterado'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['form'].is_valid())
+        self.assertFalse(Chave.objects.filter(projetista=self.joao).exists())
+
+    def test_worker_retoma_atribuicao_parada(self):
+        atribuicao = AtribuicaoProjetista.objects.create(
+            projetista=self.joao, filtros={'projetista': 'nao_atribuido'}, total=4,
+            status=AtribuicaoProjetista.PROCESSANDO, data_inicio=now() - timedelta(days=1),
+        )
+        self.assertEqual(AtribuicaoProjetista.reservar_proxima(), atribuicao)
+        processar_atribuicao(atribuicao)
+        self.assertEqual(atribuicao.status, AtribuicaoProjetista.CONCLUIDA)
+        self.assertEqual(Chave.objects.filter(projetista=self.joao).count(), 4)
+
+    def test_lotes_por_faixa_de_id(self):
+        progresso = []
+        atualizadas, lotes = atribuir_em_lotes(
+            Chave.objects.filter(projetista__isnull=True), self.joao, tamanho_lote=3, progresso=progresso.append,
+        )
+        self.assertEqual((atualizadas, lotes), (4, 2))
+        self.assertEqual(progresso, [3, 4])
+        self.assertEqual(Chave.objects.get(chave='CHV00').projetista, self.maria)
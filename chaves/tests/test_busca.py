@@ -0,0 +1,58 @@
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory
+from io import StringIO
+
+from chaves.busca import filtrar_por_trecho, trigramas
+from chaves.models import Chave, CustomUsuario, Polo, Projetista, TrigramaChave
+
+
+class IndiceBuscaTestCase(TestCase):
+    def setUp(self):
+        self.projetista = Projetista.objects.create(projetista='Maria Souza')
+        self.polo = Polo.objects.create(polo='POA')
+        self.chave = Chave.objects.create(
+            chave='AB1234', ns='1234567890', municipio='Canoas',
+            projetista=self.projetista, polo=self.polo,
+        )
+        Chave.objects.create(chave='CD5678', ns='9999999999', municipio='Esteio')
+
+    def buscar(self, termo, *campos):
+        campos = campos or [TrigramaChave.CHAVE]
+        return list(filtrar_por_trecho(Chave.objects.all(), termo, campos).values_list('chave', flat=True))
+
+    def test_busca_pelo_indice(self):
+        self.assertEqual(trigramas('AbcD'), {'abc', 'bcd'})
+        self.assertEqual(self.buscar('b12'), ['AB1234'])
+        self.assertEqual(self.buscar('4567', TrigramaChave.NS), ['AB1234'])
+        # Todos os trigramas presentes, mas fora de ordem: a conferência com icontains descarta
+        self.assertEqual(self.buscar('234AB1'), [])
+        # Termos curtos caem no icontains
+        self.assertEqual(self.buscar('56'), ['CD5678'])
+
+    def test_indice_acompanha_alteracoes(self):
+        self.chave.ns = '5550000000'
+        self.chave.save()
+        self.assertEqual(self.buscar('4567', TrigramaChave.NS), [])
+        self.assertEqual(self.buscar('5550', TrigramaChave.NS), ['AB1234'])
+
+    def test_busca_do_admin(self):
+        request = RequestFactory().get('/')
+        request.user = CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        admin_chave = site._registry[Chave]
+
+        resultado, _ = admin_chave.get_search_results(request, Chave.objects.all(), 'canoas poa')
+        self.assertEqual([c.chave for c in resultado], ['AB1234'])
+        resultado, _ = admin_chave.get_search_results(request, Chave.objects.all(), 'esteio poa')
+        self.assertEqual(list(resultado), [])
+        resultado, _ = admin_chave.get_search_results(request, Chave.objects.all(), 'souza')
+        self.assertEqual([c.chave for c in resultado], ['AB1234'])
+
+    def test_reconstruir_indice(self):
+        TrigramaChave.objects.all().delete()
+        self.assertEqual(self.buscar('b12'), [])
+
+        call_command('reconstruir_indice_busca', stdout=StringIO())
+
+        self.assertEqual(self.buscar('b12'), ['AB1234'])
+        self.assertEqual(self.buscar('canoas', TrigramaChave.MUNICIPIO), ['AB1234'])
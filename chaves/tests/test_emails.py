@@ -0,0 +1,105 @@
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from chaves.emails import MAXIMO_TENTATIVAS, enfileirar_email, enviar_pendentes, espera
+from chaves.models import Chave, CustomUsuario, EmailConfig, EmailPendente, Projetista, SolicitacaoChave
+from chaves.solicitacoes import enviar_resumo, registrar_solicitacao
+
+
+class CaixaDeSaidaTestCase(TestCase):
+    def setUp(self):
+        EmailConfig.objects.create(nome='Despacho', email='despacho@test.com')
+        self.usuario = CustomUsuario.objects.create_user(email='projetista@test.com', password='password')
+        Projetista.objects.create(projetista='Maria', email=self.usuario)
+
+    def enfileirar(self, quantidade=1):
+        for _ in range(quantidade):
+            enfileirar_email('Solicitação de Chaves', 'email_solicitacao_chave.html',
+                             {'usuario_nome': 'Maria', 'data_solicitacao': now()}, ['despacho@test.com'])
+
+    @override_settings(SOLICITACOES_JANELA_MINUTOS=0)
+    def test_view_so_grava_na_caixa_de_saida(self):
+        self.client.login(email='projetista@test.com', password='password')
+        response = self.client.post(reverse('solicitar_chaves'), {'confirmacao': 'on'})
+        self.assertRedirects(response, reverse('gerenciar_chaves'), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.destinatarios, ['despacho@test.com'])
+        self.assertIn('Maria', email.corpo_html)
+
+        call_command('enviar_emails', '--uma-vez', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(EmailPendente.objects.get().status, EmailPendente.ENVIADO)
+
+    def test_lote_por_uma_conexao(self):
+        self.enfileirar(3)
+        with mock.patch.object(EmailBackend, 'open', autospec=True, return_value=True) as abrir:
+            self.assertEqual(enviar_pendentes(), (3, 0))
+        self.assertEqual(abrir.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_falha_reagenda_com_espera_crescente(self):
+        self.enfileirar()
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=SMTPException('fora do ar')), \
+                self.assertLogs('chaves.emails', 'WARNING'):
+            self.assertEqual(enviar_pendentes(), (0, 1))
+            email = EmailPendente.objects.get()
+            self.assertEqual((email.status, email.tentativas), (EmailPendente.PENDENTE, 1))
+            self.assertGreater(email.proxima_tentativa, now() + timedelta(seconds=espera(1) - 5))
+            self.assertIn('fora do ar', email.ultimo_erro)
+
+            # Antes da próxima tentativa, nada sai da fila
+            self.assertEqual(enviar_pendentes(), (0, 0))
+
+            EmailPendente.objects.update(tentativas=MAXIMO_TENTATIVAS - 1, proxima_tentativa=now())
+            enviar_pendentes()
+        self.assertEqual(EmailPendente.objects.get().status, EmailPendente.FALHOU)
+        self.assertEqual(espera(2), 2 * espera(1))
+
+
+@override_settings(SOLICITACOES_JANELA_MINUTOS=10)
+class ResumoSolicitacoesTestCase(TestCase):
+    def setUp(self):
+        EmailConfig.objects.create(nome='Despacho', email='despacho@test.com')
+        EmailConfig.objects.create(nome='Supervisão', email='supervisao@test.com')
+        self.usuario = CustomUsuario.objects.create_user(email='maria@test.com', password='password')
+        self.maria = Projetista.objects.create(projetista='Maria', email=self.usuario)
+        self.joao = Projetista.objects.create(projetista='João')
+        Chave.objects.create(chave='CHV01', projetista=self.maria)
+
+    def test_pedidos_da_janela_num_resumo(self):
+        self.client.login(email='maria@test.com', password='password')
+        self.client.post(reverse('solicitar_chaves'), {'confirmacao': 'on'})
+        registrar_solicitacao(self.joao, 2)
+        self.assertFalse(EmailPendente.objects.exists())
+
+        # Janela do primeiro pedido ainda aberta
+        self.assertIsNone(enviar_resumo())
+
+        resumo = enviar_resumo(now() + timedelta(minutes=11))
+        self.assertEqual(resumo.assunto, 'Solicitações de Chaves (2)')
+        self.assertEqual(resumo.destinatarios, ['despacho@test.com', 'supervisao@test.com'])
+        self.assertIn('Maria', resumo.corpo_html)
+        self.assertIn('João', resumo.corpo_html)
+        self.assertEqual(SolicitacaoChave.objects.get(projetista=self.maria).chaves_sem_ns, 1)
+        self.assertFalse(SolicitacaoChave.objects.filter(email__isnull=True).exists())
+        self.assertIsNone(enviar_resumo(now() + timedelta(minutes=11)))
+
+    def test_urgente_sai_na_hora(self):
+        self.client.login(email='maria@test.com', password='password')
+        self.client.post(reverse('solicitar_chaves'), {'confirmacao': 'on', 'urgente': 'on'})
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.assunto, 'Solicitação de Chaves')
+        self.assertIn('urgente', email.corpo_texto)
+        self.assertEqual(SolicitacaoChave.objects.get().email, email)
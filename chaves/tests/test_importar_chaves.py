@@ -1,7 +1,23 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management import CommandError, call_command
 from django.test import TestCase, RequestFactory
-from chaves.models import Chave
+from django.utils.timezone import now
+from chaves.models import Chave, ImportacaoPlanilha
 from scripts.importar_chaves import cadastrar_chaves_from_planilha
-from io import BytesIO
+from chaves import leitores
+from chaves.importacao import importar_planilha
+from chaves.tests.midia import MidiaTemporaria
+from django.core.files.uploadedfile import SimpleUploadedFile
+from io import BytesIO, StringIO
 import pandas as pd
 
 
@@ -38,6 +54,279 @@ class CadastrarChavesFromPlanilhaTestCase(TestCase):
         self.assertFalse(Chave.objects.filter(chave='chave2').exists())  # Devido a data inválida
         self.assertTrue(Chave.objects.filter(chave='chave3').exists())
 
+    def test_contagens_e_duplicadas(self):
+        Chave.objects.create(chave='chave1')
+        dados_teste = {
+            0: ['chave1', 'chave2', 'chave2', 'chave4'],
+            1: ['2024-01-05 00:00:00', '2024-01-05 00:00:00', '2024-01-06 00:00:00', '05/01/2024'],
+            2: ['Chamado A', 'Chamado B', 'Chamado C', 'Chamado D']
+        }
+        planilha = self.criar_planilha_teste(dados_teste)
+
+        resultado = cadastrar_chaves_from_planilha(self.request, planilha, use_messages=False)
+
+        self.assertEqual(resultado['criados'], 1)
+        self.assertEqual(resultado['invalidos'], 1)
+        self.assertEqual(resultado['duplicados'], 2)
+        chave2 = Chave.objects.get(chave='chave2')
+        self.assertEqual(chave2.chamado, 'Chamado B')  # a primeira ocorrência vence
+        self.assertEqual(str(chave2.data_chamado), '2024-01-05')
+
+    def test_consultas_nao_crescem_com_o_numero_de_linhas(self):
+        dados_teste = {
+            0: [f'K{i:05d}' for i in range(60)],
+            1: ['2024-01-05 00:00:00'] * 60,
+            2: ['Chamado'] * 60
+        }
+        planilha = self.criar_planilha_teste(dados_teste)
+
+        # 1 SELECT ... IN + 1 INSERT em lote + 1 SELECT dos ids e 1 INSERT no índice de busca
+        # (+ savepoint/release da transação)
+        with self.assertNumQueries(6):
+            resultado = cadastrar_chaves_from_planilha(self.request, planilha, use_messages=False)
+        self.assertEqual(resultado['criados'], 60)
+
+    def test_xlsx_lido_em_streaming(self):
+        dados_teste = {
+            0: [123456, 'chave2', 'chave3'],
+            1: ['2024-01-05 00:00:00', 'adasda', pd.Timestamp('2024-01-07')],
+            2: ['Chamado A', 'Chamado B', None]
+        }
+        planilha = SimpleUploadedFile('chaves.xlsx', self.criar_planilha_teste(dados_teste).read())
+
+        resultado = cadastrar_chaves_from_planilha(self.request, planilha, use_messages=False)
+
+        self.assertEqual((resultado['criados'], resultado['invalidos']), (2, 1))
+        self.assertEqual(resultado['linhas_invalidas'], [1])
+        self.assertTrue(Chave.objects.filter(chave='123456', chamado='Chamado A').exists())
+        self.assertEqual(str(Chave.objects.get(chave='chave3').data_chamado), '2024-01-07')
+
+    def test_csv_lido_em_streaming(self):
+        conteudo = (
+            'chave1;2024-01-05 00:00:00;Chamado A\r\n'
+            'chave2;05/01/2024;Chamado B\r\n'
+            'chave1;2024-01-06 00:00:00;Chamado C\r\n'
+        ).encode('utf-8')
+        planilha = SimpleUploadedFile('chaves.csv', conteudo)
+
+        resultado = cadastrar_chaves_from_planilha(self.request, planilha, use_messages=False)
+
+        self.assertEqual((resultado['criados'], resultado['invalidos'], resultado['duplicados']), (1, 1, 1))
+        self.assertEqual(Chave.objects.get(chave='chave1').chamado, 'Chamado A')
+
+    def test_modo_atualizacao(self):
+        Chave.objects.create(chave='chave1', chamado='Antigo', data_chamado='2024-01-01')
+        Chave.objects.create(chave='chave2', chamado='Igual', data_chamado='2024-01-05')
+        dados_teste = {
+            0: ['chave1', 'chave2', 'chave3'],
+            1: ['2024-01-05 00:00:00', '2024-01-05 00:00:00', '2024-01-05 00:00:00'],
+            2: ['Novo', 'Igual', 'Chamado C']
+        }
+        planilha = self.criar_planilha_teste(dados_teste)
+
+        resultado = cadastrar_chaves_from_planilha(self.request, planilha, use_messages=False, atualizar=True)
+
+        self.assertEqual(
+            (resultado['criados'], resultado['atualizados'], resultado['inalterados'], resultado['duplicados']),
+            (1, 1, 1, 0)
+        )
+        chave1 = Chave.objects.get(chave='chave1')
+        self.assertEqual((chave1.chamado, str(chave1.data_chamado)), ('Novo', '2024-01-05'))
+
+    def test_uma_mensagem_de_resumo(self):
+        for i in range(5):
+            Chave.objects.create(chave=f'chave{i}')
+        dados_teste = {
+            0: [f'chave{i}' for i in range(8)],
+            1: ['2024-01-05 00:00:00'] * 7 + ['x'],
+            2: ['Chamado'] * 8
+        }
+        request = self.factory.get('/fake-url')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+
+        cadastrar_chaves_from_planilha(request, self.criar_planilha_teste(dados_teste))
+
+        mensagens = [str(m) for m in get_messages(request)]
+        self.assertEqual(len(mensagens), 1)
+        self.assertIn('2 registros foram criados', mensagens[0])
+        self.assertIn('5 duplicados', mensagens[0])
+
     def tearDown(self):
         # Limpeza após o teste
         Chave.objects.all().delete()
+
+
+class ProcessarImportacoesTestCase(MidiaTemporaria, TestCase):
+    def criar_importacao(self, conteudo, nome='chaves.csv'):
+        return ImportacaoPlanilha.objects.create(
+            arquivo=SimpleUploadedFile(nome, conteudo),
+            nome_original=nome,
+        )
+
+    def test_worker_processa_fila(self):
+        importacao = self.criar_importacao(
+            b'chave1;2024-01-05 00:00:00;Chamado A\r\n'
+            b'chave2;data ruim;Chamado B\r\n'
+            b'chave1;2024-01-05 00:00:00;Chamado C\r\n'
+        )
+
+        call_command('processar_importacoes', '--uma-vez', stdout=StringIO())
+
+        importacao.refresh_from_db()
+        self.assertEqual(importacao.status, ImportacaoPlanilha.CONCLUIDA)
+        self.assertEqual(
+            (importacao.linhas_processadas, importacao.criados, importacao.duplicados, importacao.invalidos),
+            (3, 1, 1, 1)
+        )
+        self.assertIsNotNone(importacao.data_fim)
+        self.assertTrue(Chave.objects.filter(chave='chave1').exists())
+
+    def test_relatorio_por_linha(self):
+        Chave.objects.create(chave='chave1', chamado='Antigo', data_chamado='2024-01-05')
+        importacao = self.criar_importacao(
+            b'chave1;2024-01-05 00:00:00;Novo\r\n'
+            b'chave2;data ruim;Chamado B\r\n'
+        )
+        importacao.atualizar_existentes = True
+        importacao.save()
+
+        call_command('processar_importacoes', '--uma-vez', stdout=StringIO())
+
+        importacao.refresh_from_db()
+        self.assertEqual((importacao.atualizados, importacao.invalidos), (1, 1))
+        with importacao.relatorio.open('rb') as arquivo:
+            conteudo = arquivo.read()
+        # UTF-8 com BOM, para o Excel abrir os acentos certos
+        self.assertTrue(conteudo.startswith(b'\xef\xbb\xbf'))
+        linhas = conteudo[3:].decode('utf-8').splitlines()
+        self.assertEqual(linhas[0], 'linha;chave;situacao;detalhe')
+        self.assertTrue(linhas[1].startswith('1;chave1;atualizada;'))
+        self.assertEqual(linhas[2], '2;chave2;invalida;Formato de data inválido')
+
+    def test_arquivo_ilegivel_marca_erro(self):
+        # O formato vem do conteúdo: um zip truncado, e não o nome, é que torna o arquivo ilegível
+        importacao = self.criar_importacao(b'PK\x03\x04isto nao e uma planilha', nome='chaves.xlsx')
+
+        call_command('processar_importacoes', '--uma-vez', stdout=StringIO(), stderr=StringIO())
+
+        importacao.refresh_from_db()
+        self.assertEqual(importacao.status, ImportacaoPlanilha.ERRO)
+        self.assertTrue(importacao.mensagem_erro)
+
+    def test_reserva_nao_repete_importacao(self):
+        importacao = self.criar_importacao(b'chave1;2024-01-05 00:00:00;A\r\n')
+
+        self.assertEqual(ImportacaoPlanilha.reservar_proxima(), importacao)
+        self.assertIsNone(ImportacaoPlanilha.reservar_proxima())
+
+    def test_reserva_retoma_importacao_de_worker_parado(self):
+        importacao = self.criar_importacao(b'chave1;2024-01-05 00:00:00;A\r\n')
+        self.assertEqual(ImportacaoPlanilha.reservar_proxima(), importacao)
+
+        # Ainda dentro do prazo: outro worker não pega
+        self.assertIsNone(ImportacaoPlanilha.reservar_proxima())
+
+        ImportacaoPlanilha.objects.filter(pk=importacao.pk).update(
+            data_inicio=now() - timedelta(minutes=settings.IMPORTACAO_RESERVA_EXPIRA_MINUTOS + 1)
+        )
+        retomada = ImportacaoPlanilha.reservar_proxima()
+        self.assertEqual(retomada, importacao)
+        self.assertEqual(retomada.status, ImportacaoPlanilha.PROCESSANDO)
+        self.assertGreater(retomada.data_inicio, now() - timedelta(minutes=1))
+
+
+class FormatosPlanilhaTestCase(TestCase):
+    def csv_de_teste(self, n_linhas):
+        linhas = []
+        for i in range(n_linhas):
+            data = 'data ruim' if i % 10 == 3 else '2024-01-05 00:00:00'
+            linhas.append(f'K{i % 450:05d};{data};"Chamado; {i}"\r\n')
+        return ''.join(linhas).encode('utf-8')
+
+    def test_formato_detectado_pelo_conteudo(self):
+        conteudo = b'chave1;2024-01-05 00:00:00;Chamado A\r\nchave2;2024-01-05 00:00:00;Chamado B\r\n'
+        df = pd.DataFrame({0: ['chave3'], 1: ['2024-01-05 00:00:00'], 2: ['Chamado C']})
+        ods = BytesIO()
+        with pd.ExcelWriter(ods, engine='odf') as writer:
+            df.to_excel(writer, index=False, header=False)
+
+        # csv com extensão de Excel, csv compactado e ods sem extensão
+        for nome, dados in (('chaves.xls', conteudo), ('chaves.csv.gz', gzip.compress(conteudo)), ('chaves', ods.getvalue())):
+            importar_planilha(SimpleUploadedFile(nome, dados))
+
+        self.assertEqual(
+            sorted(Chave.objects.values_list('chave', flat=True)),
+            ['chave1', 'chave2', 'chave3']
+        )
+        self.assertEqual(leitores.detectar_formato(BytesIO(leitores.ASSINATURA_OLE2 + b'\x00' * 16)), leitores.XLS)
+        with self.assertRaises(ValueError):
+            leitores.detectar_formato(BytesIO(b'\x00\x01\x02binario'))
+
+    def test_csv_em_paralelo_igual_ao_sequencial(self):
+        conteudo = self.csv_de_teste(500)
+        resultado_sequencial = importar_planilha(SimpleUploadedFile('chaves.csv', conteudo), processos=1)
+        esperado = list(Chave.objects.order_by('chave').values_list('chave', 'chamado', 'data_chamado'))
+        Chave.objects.all().delete()
+
+        with mock.patch.object(leitores, 'LIMIAR_PARALELO', 0), \
+                mock.patch.object(leitores, 'TAMANHO_INTERVALO', 1024), \
+                mock.patch.object(leitores, '_lotes_csv_paralelo', wraps=leitores._lotes_csv_paralelo) as paralelo:
+            resultado_paralelo = importar_planilha(SimpleUploadedFile('chaves.csv', conteudo), processos=2)
+
+        paralelo.assert_called_once()
+
+        self.assertEqual(resultado_paralelo, resultado_sequencial)
+        self.assertEqual(list(Chave.objects.order_by('chave').values_list('chave', 'chamado', 'data_chamado')), esperado)
+
+    def test_linhas_numeradas_pela_posicao_no_arquivo(self):
+        # Linhas em branco no meio e um acento em cp1252 bem depois dos primeiros 4 KB
+        linhas = [f'K{i:05d};2024-01-05 00:00:00;Chamado {i}' for i in range(300)]
+        for posicao in (10, 11, 150):
+            linhas[posicao] = ''
+        linhas[-1] = 'K99999;2024-01-05 00:00:00;Manutenção'
+        conteudo = '\r\n'.join(linhas).encode('cp1252')
+        self.assertGreater(conteudo.index('ç'.encode('cp1252')), 4096)
+
+        def indices(processos):
+            lotes = leitores.lotes_da_planilha(BytesIO(conteudo), processos=processos)
+            return [(indice, chave, chamado) for lote in lotes for indice, chave, _, chamado in lote]
+
+        sequencial = indices(1)
+        with mock.patch.object(leitores, 'LIMIAR_PARALELO', 0), \
+                mock.patch.object(leitores, 'TAMANHO_INTERVALO', 1024):
+            paralelo = indices(2)
+
+        self.assertEqual(paralelo, sequencial)
+        self.assertEqual(len(sequencial), 297)
+        self.assertEqual(sequencial[10], (12, 'K00012', 'Chamado 12'))
+        self.assertEqual(sequencial[-1], (299, 'K99999', 'Manutenção'))
+
+    def test_comando_importar_chaves(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv.gz', delete=False) as arquivo:
+            arquivo.write(gzip.compress(self.csv_de_teste(20)))
+        self.addCleanup(os.remove, arquivo.name)
+        saida = StringIO()
+
+        call_command('importar_chaves', arquivo.name, '--processos', '1', stdout=saida)
+
+        self.assertEqual(Chave.objects.count(), 18)
+        self.assertIn('18 registros foram criados', saida.getvalue())
+
+    def test_comando_importa_diretorio_e_falha_com_arquivo_ruim(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio)
+        with open(os.path.join(diretorio, 'a.csv'), 'wb') as arquivo:
+            arquivo.write(self.csv_de_teste(10))
+        with open(os.path.join(diretorio, 'b.xlsx'), 'wb') as arquivo:
+            arquivo.write(b'PK\x03\x04corrompido')
+        with open(os.path.join(diretorio, 'leia-me.txt'), 'wb') as arquivo:
+            arquivo.write(b'ignorado')
+        saida, erros = StringIO(), StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command('importar_chaves', diretorio, stdout=saida, stderr=erros)
+
+        self.assertEqual(Chave.objects.count(), 9)
+        self.assertIn('linhas/s', saida.getvalue())
+        self.assertIn('b.xlsx', erros.getvalue())
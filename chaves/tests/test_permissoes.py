@@ -0,0 +1,47 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from chaves.models import Chave, CustomUsuario, Projetista
+from chaves.permissoes import eh_supervisor, pode_editar_chave, pode_gerenciar_chaves
+
+
+class PermissoesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.supervisor_group = Group.objects.create(name='supervisor_projetos')
+        self.usuario = CustomUsuario.objects.create_user(email='projetista@test.com', password='password')
+        self.projetista = Projetista.objects.create(projetista='Projetista', email=self.usuario)
+        self.chave_propria = Chave.objects.create(chave='CHV01', projetista=self.projetista)
+        self.chave_alheia = Chave.objects.create(chave='CHV02')
+
+    def recarregar(self):
+        # Novo objeto, como em uma nova requisição
+        return CustomUsuario.objects.get(pk=self.usuario.pk)
+
+    def test_edicao_pelo_projetista_da_chave(self):
+        usuario = self.recarregar()
+        with self.assertNumQueries(2):
+            self.assertTrue(pode_editar_chave(usuario, self.chave_propria))
+            self.assertFalse(pode_editar_chave(usuario, self.chave_alheia))
+            self.assertFalse(pode_gerenciar_chaves(usuario))
+
+        self.client.login(email='projetista@test.com', password='password')
+        response = self.client.get(reverse('editar_chave', kwargs={'id': self.chave_propria.id}))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('editar_chave', kwargs={'id': self.chave_alheia.id}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_papeis_em_cache_ate_mudar_o_grupo(self):
+        self.assertFalse(eh_supervisor(self.recarregar()))
+        # Outra requisição do mesmo usuário: papéis vêm do cache
+        with self.assertNumQueries(0):
+            self.assertFalse(eh_supervisor(CustomUsuario(pk=self.usuario.pk)))
+
+        self.usuario.groups.add(self.supervisor_group)
+        self.assertTrue(eh_supervisor(self.recarregar()))
+
+        self.usuario.groups.remove(self.supervisor_group)
+        self.assertFalse(eh_supervisor(self.recarregar()))
@@ -0,0 +1,107 @@
+import threading
+
+from django.contrib.auth.models import Group
+from django.contrib.messages import get_messages
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+
+from chaves.models import Chave, CustomUsuario, Projetista
+from chaves.reserva import LIMITE_SEM_NS, MAXIMO_POR_RESERVA, ReservaNegada, reservar_chaves
+
+
+class ReservaChavesTestCase(TestCase):
+    def setUp(self):
+        self.usuario = CustomUsuario.objects.create_user(email='maria@test.com', password='password')
+        self.maria = Projetista.objects.create(projetista='Maria', email=self.usuario)
+        for i in range(5):
+            Chave.objects.create(chave=f'CHV0{i}')
+
+    def test_view_reserva_chaves_livres(self):
+        self.client.login(email='maria@test.com', password='password')
+        response = self.client.post(reverse('reservar_chaves'), {'quantidade': '2'})
+        self.assertRedirects(response, reverse('gerenciar_chaves'), fetch_redirect_response=False)
+        self.assertEqual(list(Chave.objects.filter(projetista=self.maria).values_list('chave', flat=True)), ['CHV00', 'CHV01'])
+
+    def test_limite_de_chaves_sem_ns(self):
+        reservar_chaves(self.maria, LIMITE_SEM_NS)
+        with self.assertRaisesMessage(ReservaNegada, f'{LIMITE_SEM_NS} chaves'):
+            reservar_chaves(self.maria, 1)
+
+        # Com NS preenchida, a chave deixa de contar
+        Chave.objects.filter(projetista=self.maria).update(ns='1234567890')
+        self.assertEqual(reservar_chaves(self.maria, 5), (['CHV03', 'CHV04'], LIMITE_SEM_NS))
+        Chave.objects.filter(projetista=self.maria).update(ns='1234567890')
+        with self.assertRaisesMessage(ReservaNegada, 'Não há chaves livres'):
+            reservar_chaves(self.maria, 1)
+
+    def test_pedido_reduzido_ao_que_falta_para_o_limite(self):
+        reservar_chaves(self.maria, 1)
+        self.assertEqual(reservar_chaves(self.maria, 5), (['CHV01', 'CHV02'], 2))
+        self.assertEqual(Chave.objects.filter(projetista=self.maria, ns__isnull=True).count(), LIMITE_SEM_NS)
+
+    def test_view_avisa_pedido_reduzido_e_mostra_a_cota(self):
+        self.usuario.groups.add(Group.objects.create(name='tecnicos'))
+        self.client.login(email='maria@test.com', password='password')
+        response = self.client.get(reverse('gerenciar_chaves'))
+        self.assertEqual(response.context['cota_reserva'], LIMITE_SEM_NS)
+
+        reservar_chaves(self.maria, 1)
+        response = self.client.post(reverse('reservar_chaves'), {'quantidade': '5'})
+        mensagens = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertIn(f'Pedido reduzido de 5 para {LIMITE_SEM_NS - 1} chave(s)', mensagens[-1])
+        response = self.client.get(reverse('gerenciar_chaves'))
+        self.assertEqual(response.context['cota_reserva'], 0)
+
+    def test_solicitacao_usa_a_mesma_regra_da_reserva(self):
+        reservar_chaves(self.maria, LIMITE_SEM_NS)
+        self.client.login(email='maria@test.com', password='password')
+        response = self.client.post(reverse('solicitar_chaves'), {'confirmacao': 'on'})
+        mensagens = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertEqual(mensagens, [f'Solicitação negada! Você ainda tem {LIMITE_SEM_NS} chaves para serem designadas.'])
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ReservaConcorrenteTestCase(TransactionTestCase):
+    """
+    Muitos projetistas (e pedidos repetidos do mesmo) reservando ao mesmo tempo, cada pedido acima do
+    limite de chaves sem NS; precisa de MySQL/PostgreSQL.
+    """
+    PROJETISTAS = 20
+    PEDIDOS_POR_PROJETISTA = 3
+
+    def test_sem_chave_repetida_nem_limite_furado(self):
+        Chave.objects.bulk_create([Chave(chave=f'{i:06d}') for i in range(100)])
+        # create() um a um: no MySQL o bulk_create não devolve os ids
+        projetistas = [Projetista.objects.create(projetista=f'P{i}') for i in range(self.PROJETISTAS)]
+
+        largada = threading.Barrier(self.PROJETISTAS * self.PEDIDOS_POR_PROJETISTA)
+        reservadas, erros = [], []
+
+        def reservar(projetista):
+            try:
+                largada.wait()
+                reservadas.extend(reservar_chaves(projetista, MAXIMO_POR_RESERVA)[0])
+            except ReservaNegada:
+                pass
+            except Exception as e:
+                erros.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=reservar, args=(projetista,))
+            for projetista in projetistas for _ in range(self.PEDIDOS_POR_PROJETISTA)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        # Cada chave com um projetista só, e nenhum projetista acima do limite
+        self.assertEqual(len(reservadas), len(set(reservadas)))
+        self.assertEqual(len(reservadas), self.PROJETISTAS * LIMITE_SEM_NS)
+        self.assertEqual(Chave.objects.filter(projetista__isnull=False).count(), len(reservadas))
+        for projetista in projetistas:
+            self.assertEqual(Chave.objects.filter(projetista=projetista).count(), LIMITE_SEM_NS)
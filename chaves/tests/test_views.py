@@ -1,15 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.test import TestCase, Client, override_settings
+from django.utils.timezone import now
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from chaves.models import CustomUsuario, Chave, Polo, Projetista
+from chaves.models import CustomUsuario, Chave, Polo, Projetista, ImportacaoPlanilha
 from django.contrib.auth.models import Group
+import gzip
 import os
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.messages import get_messages
 from chaves.forms import AtribuirProjetistaForm
+from chaves.tests.midia import MidiaTemporaria
 
 
-class ImportarChavesViewTest(TestCase):
+class ImportarChavesViewTest(MidiaTemporaria, TestCase):
     def setUp(self):
         self.client = Client()
         self.url = reverse('view_importar_chaves')
@@ -48,6 +54,63 @@ class ImportarChavesViewTest(TestCase):
         response = self.client.post(self.url, {'planilha': ''})
         self.assertFalse(response.context['form'].is_valid())
 
+    def test_upload_enfileira_importacao(self):
+        self.client.login(username='supervisor@test.com', password='password')
+        arquivo = SimpleUploadedFile('chaves.csv', b'chave1;2024-01-05 00:00:00;Chamado A\r\n')
+        response = self.client.post(self.url, {'planilha': arquivo})
+
+        importacao = ImportacaoPlanilha.objects.get()
+        self.assertRedirects(response, f"{self.url}?importacao={importacao.pk}")
+        self.assertEqual(importacao.status, ImportacaoPlanilha.PENDENTE)
+        self.assertEqual(importacao.usuario, self.user_supervisor)
+        self.assertFalse(Chave.objects.exists())  # nada é gravado durante a requisição
+
+        progresso = self.client.get(reverse('progresso_importacao', kwargs={'id': importacao.pk}))
+        self.assertEqual(progresso.json()['status'], ImportacaoPlanilha.PENDENTE)
+
+    def test_reenvio_identico_reaproveita_importacao(self):
+        self.client.login(username='supervisor@test.com', password='password')
+        conteudo = b'chave1;2024-01-05 00:00:00;Chamado A\r\n'
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo)})
+        original = ImportacaoPlanilha.objects.get()
+
+        # Mesmo conteúdo com outro nome: nenhuma importação nova
+        response = self.client.post(self.url, {'planilha': SimpleUploadedFile('copia.csv', conteudo)})
+        self.assertRedirects(response, f"{self.url}?importacao={original.pk}")
+        self.assertEqual(ImportacaoPlanilha.objects.count(), 1)
+
+        # Forçando, ou em outro modo, a planilha entra de novo na fila
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo), 'forcar_reprocessamento': 'on'})
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo), 'atualizar_existentes': 'on'})
+        self.assertEqual(ImportacaoPlanilha.objects.filter(hash_conteudo=original.hash_conteudo).count(), 3)
+
+    def test_reenvio_nao_reaproveita_importacao_antiga_ou_parada(self):
+        self.client.login(username='supervisor@test.com', password='password')
+        conteudo = b'chave1;2024-01-05 00:00:00;Chamado A\r\n'
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo)})
+        original = ImportacaoPlanilha.objects.get()
+
+        # Presa em PROCESSANDO além do prazo de reserva: o reenvio cria outra
+        ImportacaoPlanilha.objects.filter(pk=original.pk).update(
+            status=ImportacaoPlanilha.PROCESSANDO,
+            data_inicio=now() - timedelta(minutes=settings.IMPORTACAO_RESERVA_EXPIRA_MINUTOS + 1),
+        )
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo)})
+        self.assertEqual(ImportacaoPlanilha.objects.count(), 2)
+
+        # Concluída há mais de IMPORTACAO_REAPROVEITAR_HORAS: também
+        ImportacaoPlanilha.objects.update(
+            status=ImportacaoPlanilha.CONCLUIDA,
+            data_criacao=now() - timedelta(hours=settings.IMPORTACAO_REAPROVEITAR_HORAS + 1),
+        )
+        self.client.post(self.url, {'planilha': SimpleUploadedFile('chaves.csv', conteudo)})
+        self.assertEqual(ImportacaoPlanilha.objects.count(), 3)
+
+    def test_progresso_exige_supervisor(self):
+        self.client.login(username='comum@test.com', password='password')
+        response = self.client.get(reverse('progresso_importacao', kwargs={'id': 1}))
+        self.assertEqual(response.status_code, 403)
+
 
 class CustomLoginTestCase(TestCase):
     def setUp(self):
@@ -145,6 +208,69 @@ class PesquisarChaveTest(TestCase):
         self.assertNotContains(response, 'CHV02')
         self.assertContains(response, 'CHV03')
 
+    def test_paginacao_por_cursor_mantem_filtros(self):
+        for i in range(45):
+            Chave.objects.create(chave=f"P{i:04d}")
+
+        primeira = self.client.get(reverse('gerenciar_chaves'), {'chave_search': 'P'})
+        pagina = primeira.context['chaves']
+        self.assertEqual([c.chave for c in pagina], [f"P{i:04d}" for i in range(20)])
+        self.assertEqual(pagina.url_anterior, '')
+        self.assertIn('chave_search=P', pagina.url_proxima)
+        self.assertIsNone(pagina.total)
+
+        terceira = self.client.get(reverse('gerenciar_chaves') + self.client.get(
+            reverse('gerenciar_chaves') + pagina.url_proxima).context['chaves'].url_proxima)
+        pagina = terceira.context['chaves']
+        self.assertEqual([c.chave for c in pagina], [f"P{i:04d}" for i in range(40, 45)])
+        self.assertEqual(pagina.url_proxima, '')
+
+        segunda = self.client.get(reverse('gerenciar_chaves') + pagina.url_anterior).context['chaves']
+        self.assertEqual([c.chave for c in segunda], [f"P{i:04d}" for i in range(20, 40)])
+
+        contada = self.client.get(reverse('gerenciar_chaves') + segunda.url_contar).context['chaves']
+        self.assertEqual(contada.total, 45)
+        self.assertEqual(contada.itens, segunda.itens)
+
+
+class ExportarChavesCsvTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.superuser = CustomUsuario.objects.create_superuser(email='superuser@test.com', password='password')
+        self.tecnico = CustomUsuario.objects.create_user(email='tecnico@test.com', password='password')
+        self.tecnico.groups.add(Group.objects.create(name='tecnicos'))
+        projetista = Projetista.objects.create(projetista='Tecnico', email=self.tecnico)
+
+        Chave.objects.create(chave="CHV01", ns="1234567890", projetista=projetista)
+        Chave.objects.create(chave="CHV02", projetista=projetista)
+        Chave.objects.create(chave="CHV03")
+
+    def exportar(self, **parametros):
+        response = self.client.get(reverse('exportar_chaves_csv'), parametros)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        conteudo = b''.join(response.streaming_content)
+        if parametros.get('gzip'):
+            conteudo = gzip.decompress(conteudo)
+        return [linha.split(';')[0] for linha in conteudo.decode('utf-8-sig').splitlines()[1:]]
+
+    def test_filtros_de_gerenciar_chaves(self):
+        self.client.login(email='superuser@test.com', password='password')
+        self.assertEqual(self.exportar(), ['CHV01', 'CHV02', 'CHV03'])
+        self.assertEqual(self.exportar(sem_projeto='true'), ['CHV02', 'CHV03'])
+        self.assertEqual(self.exportar(ns_search='1234', gzip='1'), ['CHV01'])
+
+    def test_tecnico_exporta_so_as_suas(self):
+        self.client.login(email='tecnico@test.com', password='password')
+        self.assertEqual(self.exportar(), ['CHV01', 'CHV02'])
+
+    def test_acesso_negado(self):
+        CustomUsuario.objects.create_user(email='comum@test.com', password='password')
+        self.client.login(email='comum@test.com', password='password')
+        response = self.client.get(reverse('exportar_chaves_csv'))
+        self.assertEqual(response.status_code, 403)
+
+
 class EditarChaveViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -1,19 +1,32 @@
 # chaves/urls.py
 from django.urls import path
-from .views import custom_login, janus_view, gerenciar_chaves, editar_chave, view_importar_chaves, view_atribuir_projetista, solicitacao_chave_view, pagina_de_sucesso_view, buscar_chave, view_com_erro
+from logs.consultas import orcamento_consultas
+from .views import custom_login, janus_view, gerenciar_chaves, exportar_chaves_csv, editar_chave, view_importar_chaves, progresso_importacao, relatorio_importacao, exportacao_chaves, progresso_exportacao, baixar_exportacao, view_atribuir_projetista, atribuicao_projetista, progresso_atribuicao, solicitacao_chave_view, reservar_chaves_view, pagina_de_sucesso_view, buscar_chave, view_com_erro
 
+# Orçamento de consultas SQL por requisição, incluindo sessão e usuário (logs.consultas).
+# Nos testes, passar do orçamento é erro; em produção vira registro em ConsultaSuspeita.
+# exportar_chaves_csv fica de fora: é StreamingHttpResponse e as consultas por bloco
+# rodam enquanto o corpo é enviado, em número proporcional às chaves exportadas.
 urlpatterns = [
-    path('login/', custom_login, name='login'),
-    path('menu/', janus_view, name='janus_view'),
-    path('gerenciar_chaves', gerenciar_chaves, name='gerenciar_chaves'),
-    path('chaves/editar/<int:id>/', editar_chave, name='editar_chave'),
-    path('importar-chaves/', view_importar_chaves, name='view_importar_chaves'),
-    path('atribuir_projetista/', view_atribuir_projetista, name='atribuir_projetista'),
-    path('solicitar-chaves/', solicitacao_chave_view, name='solicitar_chaves'),
-    path('pagina-de-sucesso/', pagina_de_sucesso_view, name='pagina_de_sucesso'),
-    path('buscar-chave/', buscar_chave, name='buscar_chave'),
+    path('login/', orcamento_consultas(custom_login, 10), name='login'),
+    path('menu/', orcamento_consultas(janus_view, 8), name='janus_view'),
+    path('gerenciar_chaves', orcamento_consultas(gerenciar_chaves, 8), name='gerenciar_chaves'),
+    path('gerenciar_chaves/exportar.csv', exportar_chaves_csv, name='exportar_chaves_csv'),
+    path('chaves/editar/<int:id>/', orcamento_consultas(editar_chave, 16), name='editar_chave'),
+    path('importar-chaves/', orcamento_consultas(view_importar_chaves, 10), name='view_importar_chaves'),
+    path('importar-chaves/<int:id>/progresso/', orcamento_consultas(progresso_importacao, 6), name='progresso_importacao'),
+    path('importar-chaves/<int:id>/relatorio/', orcamento_consultas(relatorio_importacao, 6), name='relatorio_importacao'),
+    path('exportacoes/<int:id>/', orcamento_consultas(exportacao_chaves, 8), name='exportacao_chaves'),
+    path('exportacoes/<int:id>/progresso/', orcamento_consultas(progresso_exportacao, 6), name='progresso_exportacao'),
+    path('exportacoes/<int:id>/baixar/', orcamento_consultas(baixar_exportacao, 6), name='baixar_exportacao'),
+    path('atribuir_projetista/', orcamento_consultas(view_atribuir_projetista, 12), name='atribuir_projetista'),
+    path('atribuicoes/<int:id>/', orcamento_consultas(atribuicao_projetista, 6), name='atribuicao_projetista'),
+    path('atribuicoes/<int:id>/progresso/', orcamento_consultas(progresso_atribuicao, 6), name='progresso_atribuicao'),
+    path('solicitar-chaves/', orcamento_consultas(solicitacao_chave_view, 14), name='solicitar_chaves'),
+    path('reservar-chaves/', orcamento_consultas(reservar_chaves_view, 14), name='reservar_chaves'),
+    path('pagina-de-sucesso/', orcamento_consultas(pagina_de_sucesso_view, 4), name='pagina_de_sucesso'),
+    path('buscar-chave/', orcamento_consultas(buscar_chave, 6), name='buscar_chave'),
 
     path('forcar-erro/', view_com_erro, name='forcar_erro'),
 
 ]
-
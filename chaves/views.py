@@ -2,17 +2,27 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
+from django.core import signing
 from django.core.exceptions import PermissionDenied
-from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render, redirect
-from django.utils.timezone import now
+from django.urls import reverse
+from django.utils.timezone import localtime, now
 from django.conf import settings
 
-from scripts.importar_chaves import cadastrar_chaves_from_planilha
 from .forms import AtribuirProjetistaForm, ConfirmacaoSolicitacaoForm
 from .forms import ChaveForm, PlanilhaUploadForm
-from .models import Chave, Projetista, Aviso
+from .atribuicao import TAMANHO_LOTE, atribuir_em_lotes, ler_filtro
+from .importacao import hash_arquivo
+from .exportacao import resposta_csv
+from .filtros import filtrar_chaves, filtrar_gerenciar, querystring_gerenciar
+from .models import AtribuicaoProjetista, Chave, Projetista, Aviso, ExportacaoChaves, ImportacaoPlanilha
+from .paginacao import paginar_por_cursor
+from .reserva import LIMITE_SEM_NS, ReservaNegada, cota_restante, reservar_chaves, verificar_cota
+from .permissoes import SUPERVISOR, chaves_visiveis, contexto_papeis, eh_supervisor, no_grupo, pode_editar_chave
+from .permissoes import pode_gerenciar_chaves
+from core.facetas import invalidar_facetas
 from core.messages import message_created_ok, message_updated_ok, message_deleted_ok, message_error
 
 
@@ -21,22 +31,113 @@ def view_index(request):
 
 @login_required(login_url='/janus/login')  # Substitua '/caminho_para_login/' pela URL da sua página de login
 def view_importar_chaves(request):
-    is_superuser = request.user.is_superuser
-    usuario_no_grupo_supervisor = request.user.groups.filter(name='supervisor_projetos').exists()
-
-    # Verifica se o usuário é superusuário ou pertence ao grupo 'topografia'
-    if not (is_superuser or usuario_no_grupo_supervisor):
+    # Verifica se o usuário é superusuário ou pertence ao grupo 'supervisor_projetos'
+    if not eh_supervisor(request.user):
         raise PermissionDenied
 
     if request.method == 'POST':
         form = PlanilhaUploadForm(request.POST, request.FILES)
         if form.is_valid():
             planilha = request.FILES['planilha']
-            cadastrar_chaves_from_planilha(request, planilha)
-            # return HttpResponse("Chaves importadas com sucesso!")
+            atualizar = form.cleaned_data['atualizar_existentes']
+            hash_conteudo = hash_arquivo(planilha)
+
+            # Reenvio do mesmo arquivo (ex.: a página pareceu travada): mostra a importação já existente
+            anterior = ImportacaoPlanilha.anterior_identica(hash_conteudo, atualizar)
+            if anterior and not form.cleaned_data['forcar_reprocessamento']:
+                messages.info(
+                    request,
+                    f"Esta planilha já foi enviada em {localtime(anterior.data_criacao):%d/%m/%Y %H:%M} "
+                    f"({anterior.get_status_display().lower()}). Exibindo o resultado dessa importação; "
+                    "marque 'Forçar reprocessamento' para importá-la novamente."
+                )
+                return redirect(f"{reverse('view_importar_chaves')}?importacao={anterior.pk}")
+
+            # A importação roda no worker (manage.py processar_importacoes);
+            # aqui só guardamos o arquivo e devolvemos a resposta
+            importacao = ImportacaoPlanilha.objects.create(
+                arquivo=planilha,
+                nome_original=planilha.name,
+                hash_conteudo=hash_conteudo,
+                usuario=request.user,
+                atualizar_existentes=atualizar,
+            )
+            messages.info(request, "Planilha recebida. A importação será processada em segundo plano.")
+            return redirect(f"{reverse('view_importar_chaves')}?importacao={importacao.pk}")
     else:
         form = PlanilhaUploadForm()
-    return render(request, 'upload_planilha.html', {'form': form})
+
+    importacao = None
+    importacao_id = request.GET.get('importacao', '')
+    if importacao_id.isdigit():
+        importacao = ImportacaoPlanilha.objects.filter(pk=importacao_id).first()
+    return render(request, 'upload_planilha.html', {'form': form, 'importacao': importacao})
+
+@login_required(login_url='/janus/login')
+def progresso_importacao(request, id):
+    if not eh_supervisor(request.user):
+        raise PermissionDenied
+
+    importacao = get_object_or_404(ImportacaoPlanilha, id=id)
+    return JsonResponse({
+        'status': importacao.status,
+        'status_display': importacao.get_status_display(),
+        'finalizada': importacao.finalizada,
+        'linhas_processadas': importacao.linhas_processadas,
+        'criados': importacao.criados,
+        'atualizados': importacao.atualizados,
+        'inalterados': importacao.inalterados,
+        'duplicados': importacao.duplicados,
+        'invalidos': importacao.invalidos,
+        'mensagem_erro': importacao.mensagem_erro,
+        'relatorio_url': reverse('relatorio_importacao', kwargs={'id': importacao.pk}) if importacao.relatorio else '',
+    })
+
+@login_required(login_url='/janus/login')
+def relatorio_importacao(request, id):
+    if not eh_supervisor(request.user):
+        raise PermissionDenied
+
+    importacao = get_object_or_404(ImportacaoPlanilha, id=id)
+    if not importacao.relatorio:
+        raise Http404
+    return FileResponse(
+        importacao.relatorio.open('rb'),
+        as_attachment=True,
+        filename=f"relatorio_importacao_{importacao.pk}.csv",
+        content_type='text/csv',
+    )
+
+def _exportacao_do_usuario(request, id):
+    # Exportações são vistas por quem pediu e pelos supervisores
+    exportacao = get_object_or_404(ExportacaoChaves, id=id)
+    if exportacao.usuario_id != request.user.pk and not eh_supervisor(request.user):
+        raise PermissionDenied
+    return exportacao
+
+@login_required(login_url='/janus/login')
+def exportacao_chaves(request, id):
+    exportacao = _exportacao_do_usuario(request, id)
+    return render(request, 'exportacao_chaves.html', {'exportacao': exportacao})
+
+@login_required(login_url='/janus/login')
+def progresso_exportacao(request, id):
+    exportacao = _exportacao_do_usuario(request, id)
+    return JsonResponse({
+        'status': exportacao.status,
+        'status_display': exportacao.get_status_display(),
+        'finalizada': exportacao.finalizada,
+        'linhas': exportacao.linhas,
+        'mensagem_erro': exportacao.mensagem_erro,
+        'download_url': reverse('baixar_exportacao', kwargs={'id': exportacao.pk}) if exportacao.arquivo else '',
+    })
+
+@login_required(login_url='/janus/login')
+def baixar_exportacao(request, id):
+    exportacao = _exportacao_do_usuario(request, id)
+    if exportacao.status != ExportacaoChaves.CONCLUIDA or not exportacao.arquivo:
+        raise Http404
+    return FileResponse(exportacao.arquivo.open('rb'), as_attachment=True, filename=exportacao.nome_download)
 
 def custom_login(request):
     if request.method == 'POST':
@@ -60,63 +161,48 @@ def custom_login(request):
 @login_required(login_url='/janus/login')  # Substitua '/caminho_para_login/' pela URL da sua página de login
 def gerenciar_chaves(request):
     usuario_logado = request.user
-    is_superuser = request.user.is_superuser
-    usuario_no_grupo_tecnicos = request.user.groups.filter(name='tecnicos').exists()
-    usuario_no_grupo_supervisor = request.user.groups.filter(name='supervisor_projetos').exists()
 
-    # Verifica se o usuário é superusuário ou pertence ao grupo 'topografia'
-    if not (is_superuser or usuario_no_grupo_tecnicos or usuario_no_grupo_supervisor):
+    # Verifica se o usuário é superusuário ou pertence aos grupos 'supervisor_projetos' ou 'tecnicos'
+    if not pode_gerenciar_chaves(usuario_logado):
         raise PermissionDenied
 
-    # Verifica se o usuário é superusuário ou está no grupo 'supervisor_projetos'
-    if usuario_logado.is_superuser or usuario_logado.groups.filter(name='supervisor_projetos').exists():
-        chaves = Chave.objects.all()
-    else:
-        # Ajuste a consulta para buscar o Projetista relacionado ao CustomUsuario
-        chaves = Chave.objects.filter(projetista__email__email=usuario_logado.email)
-
-    # Lógica de pesquisa
-    ns_search = request.GET.get('ns_search', '')
-    chave_search = request.GET.get('chave_search', '')
-    projetista_search = request.GET.get('projetista_search', '')
+    # Supervisores veem todas as chaves; os demais, só as dos seus projetistas.
+    # O template mostra projetista e polo de cada linha
+    chaves = chaves_visiveis(usuario_logado).select_related('projetista', 'polo')
 
-    if ns_search:
-        chaves = chaves.filter(ns__icontains=ns_search)
-    if chave_search:
-        chaves = chaves.filter(chave__icontains=chave_search)
-    if projetista_search:
-        chaves = chaves.filter(projetista__projetista__icontains=projetista_search)
+    # Lógica de pesquisa (mesmos filtros da exportação CSV)
+    chaves = filtrar_gerenciar(chaves, request.GET)
 
-    if 'sem_projeto' in request.GET:
-        chaves = chaves.filter(ns__isnull=True)
-
-    # Adicionando paginação
-    paginator = Paginator(chaves, 20)
-    page_number = request.GET.get('page')
-    chaves_page = paginator.get_page(page_number)
+    # Paginação por cursor (?apos=/?antes=): sem COUNT(*) nem OFFSET a cada página
+    chaves_page = paginar_por_cursor(chaves, request.GET, por_pagina=20)
 
     # Passando as verificações para o template
     context = {
         'chaves': chaves_page,
-        'is_superuser': is_superuser,
-        'usuario_no_grupo_supervisor': usuario_no_grupo_supervisor,
+        'is_superuser': usuario_logado.is_superuser,
+        'usuario_no_grupo_supervisor': no_grupo(usuario_logado, SUPERVISOR),
+        'filtros_query': querystring_gerenciar(request.GET),
+        # Máximo do campo de reserva: o que ainda cabe no limite de chaves sem NS
+        'cota_reserva': cota_restante(usuario_logado),
     }
 
     return render(request, 'chaves/gerenciar_chaves.html', context)
 
+@login_required(login_url='/janus/login')
+def exportar_chaves_csv(request):
+    # Mesma permissão, visibilidade e filtros de gerenciar_chaves; ?gzip=1 comprime o arquivo
+    if not pode_gerenciar_chaves(request.user):
+        raise PermissionDenied
+
+    chaves = filtrar_gerenciar(chaves_visiveis(request.user), request.GET)
+    return resposta_csv(chaves, comprimir=request.GET.get('gzip') in ('1', 'true'))
+
 @login_required(login_url='/janus/login')
 def janus_view(request):
-    usuario_no_grupo_topografia = request.user.groups.filter(name='topografia').exists()
-    is_superuser = request.user.is_superuser
-    usuario_no_grupo_supervisor = request.user.groups.filter(name='supervisor_projetos').exists()
-    usuario_no_grupo_tecnicos = request.user.groups.filter(name='tecnicos').exists()
     avisos = Aviso.objects.all()
     context = {
         'first_name': request.user.first_name if request.user.is_authenticated else 'Visitante',
-        'usuario_no_grupo_topografia': usuario_no_grupo_topografia,
-        'is_superuser': is_superuser,
-        'usuario_no_grupo_supervisor': usuario_no_grupo_supervisor,
-        'usuario_no_grupo_tecnicos': usuario_no_grupo_tecnicos,
+        **contexto_papeis(request.user),
         'avisos': avisos,
     }
     return render(request, 'menu.html', context)
@@ -124,15 +210,9 @@ def janus_view(request):
 @login_required(login_url='/janus/login')  # Substitua '/caminho_para_login/' pela URL da sua página de login
 def editar_chave(request, id):
     chave = get_object_or_404(Chave, id=id)
-    is_superuser = request.user.is_superuser
-    email_logado = request.user.email
 
     # Verifica se o usuário logado é o projetista associado à chave ou tem permissões especiais
-    if not (
-            is_superuser or
-            (chave.projetista and chave.projetista.email.email == email_logado) or
-            request.user.groups.filter(name__in=['supervisor_projetos']).exists()
-    ):
+    if not pode_editar_chave(request.user, chave):
         raise PermissionDenied
 
     if request.method == 'POST':
@@ -149,35 +229,74 @@ def editar_chave(request, id):
 
     return render(request, 'chaves/editar_chave.html', {'form': form})
 
+def _atribuicao_do_supervisor(request, id):
+    # Só supervisores atribuem projetista, e qualquer um deles acompanha as atribuições
+    if not eh_supervisor(request.user):
+        raise PermissionDenied
+    return get_object_or_404(AtribuicaoProjetista.objects.select_related('projetista'), id=id)
+
 @login_required(login_url='/janus/login/')
-def view_atribuir_projetista(request):
-    is_superuser = request.user.is_superuser
-    usuario_no_grupo_supervisor = request.user.groups.filter(name='supervisor_projetos').exists()
+def atribuicao_projetista(request, id):
+    atribuicao = _atribuicao_do_supervisor(request, id)
+    return render(request, 'atribuicao_projetista.html', {'atribuicao': atribuicao})
+
+@login_required(login_url='/janus/login/')
+def progresso_atribuicao(request, id):
+    atribuicao = _atribuicao_do_supervisor(request, id)
+    return JsonResponse({
+        'status': atribuicao.status,
+        'status_display': atribuicao.get_status_display(),
+        'finalizada': atribuicao.finalizada,
+        'total': atribuicao.total,
+        'atualizadas': atribuicao.atualizadas,
+        'mensagem_erro': atribuicao.mensagem_erro,
+    })
 
-    # Verifica se o usuário é superusuário ou pertence ao grupo 'topografia'
-    if not (is_superuser or usuario_no_grupo_supervisor):
+@login_required(login_url='/janus/login/')
+def view_atribuir_projetista(request):
+    # Verifica se o usuário é superusuário ou pertence ao grupo 'supervisor_projetos'
+    if not eh_supervisor(request.user):
         raise PermissionDenied
 
     if request.method == 'POST':
         form = AtribuirProjetistaForm(request.POST)
         if form.is_valid():
             projetista = form.cleaned_data['projetista']
-            chaves_ids_str = form.cleaned_data['chaves_ids']  # Uma string de IDs
-            chaves_ids = [int(id.strip()) for id in chaves_ids_str.strip('[]').split(',') if id.strip().isdigit()]
-            Chave.objects.filter(id__in=chaves_ids).update(projetista=projetista)
-            return redirect('admin:chaves_chave_changelist')
+            filtros = form.cleaned_data['filtros']
+            chaves = filtrar_chaves(Chave.objects.all(), filtros)
+            total = chaves.count()
+            if total <= TAMANHO_LOTE:
+                # Cabe num lote só: atribui já, numa transação
+                atualizadas, _ = atribuir_em_lotes(chaves, projetista)
+                invalidar_facetas(Chave)
+                messages.success(request, f"{atualizadas} chave(s) atribuída(s) a {projetista}.")
+                return redirect('admin:chaves_chave_changelist')
+
+            # Os lotes rodam no worker (manage.py processar_atribuicoes); a tela da atribuição mostra o progresso
+            atribuicao = AtribuicaoProjetista.objects.create(
+                usuario=request.user, projetista=projetista, filtros=filtros, total=total,
+            )
+            messages.info(request, "Atribuição enfileirada. As chaves serão atualizadas em segundo plano.")
+            return redirect('atribuicao_projetista', id=atribuicao.pk)
         else:
             return render(request, 'atribuir_projetista.html', {'form': form})
     else:
-        # Inicializa o formulário com os IDs das chaves da sessão
-        chaves_ids_inicial = request.session.get('chave_ids', [])
-        form = AtribuirProjetistaForm(initial={'chaves_ids': chaves_ids_inicial})
+        # Inicializa o formulário com o filtro assinado pela ação do admin
+        filtro = request.GET.get('filtro', '')
+        form = AtribuirProjetistaForm(initial={'filtro': filtro})
+        quantidade = None
+        if filtro:
+            try:
+                quantidade = filtrar_chaves(Chave.objects.all(), ler_filtro(filtro)).count()
+            except signing.BadSignature:
+                messages.error(request, "A seleção de chaves expirou ou é inválida. Selecione as chaves novamente.")
+                return redirect('admin:chaves_chave_changelist')
 
         # Ordena os projetistas alfabeticamente antes de passar para o formulário
         projetistas_ativos = Projetista.objects.filter(ativo=True).order_by('projetista')
         form.fields['projetista'].queryset = projetistas_ativos
 
-        return render(request, 'atribuir_projetista.html', {'form': form})
+        return render(request, 'atribuir_projetista.html', {'form': form, 'quantidade': quantidade})
 
 @login_required(login_url='/janus/login/')
 def buscar_chave(request):
@@ -191,10 +310,7 @@ def buscar_chave(request):
 
     return render(request, 'chaves/buscar_chave.html', {'chave': chave_pesquisada})
 
-from .models import EmailConfig
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from .solicitacoes import registrar_solicitacao
 from datetime import datetime
 
 def solicitacao_chave_view(request):
@@ -212,33 +328,16 @@ def solicitacao_chave_view(request):
             )
             return redirect("gerenciar_chaves")
 
-        # 3 ou mais chaves sem NS -> bloqueia e volta pra gestão
-        chaves_sem_ns = Chave.objects.filter(projetista=projetista, ns__isnull=True).count()
-        if chaves_sem_ns >= 3:
-            messages.warning(
-                request,
-                f"Solicitação negada! Você ainda tem {chaves_sem_ns} chaves para serem designadas.",
-                extra_tags="chaves_sem_ns no_toast"
-            )
+        # 3 ou mais chaves sem NS -> bloqueia e volta pra gestão (mesma regra da reserva, chaves.reserva)
+        try:
+            chaves_sem_ns = verificar_cota(projetista, acao='Solicitação')
+        except ReservaNegada as e:
+            messages.warning(request, str(e), extra_tags="chaves_sem_ns no_toast")
             return redirect("gerenciar_chaves")
 
-        # OK: envia a solicitação por e-mail
-        usuario_nome = projetista.projetista
-        destinatarios = EmailConfig.objects.all().values_list('email', flat=True)
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'JANOS <noreply@dbsistemas.com.br>')
-
-        context = {'usuario_nome': usuario_nome, 'data_solicitacao': now()}
-        html_content = render_to_string('email_solicitacao_chave.html', context)
-        text_content = strip_tags(html_content)
-
-        email = EmailMultiAlternatives(
-            'Solicitação de Chaves',
-            text_content,
-            from_email,
-            destinatarios
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        # OK: registra a solicitação; o e-mail sai no resumo da janela ou, se urgente, já vai
+        # para a caixa de saída (chaves.solicitacoes; envio pelo worker manage.py enviar_emails)
+        registrar_solicitacao(projetista, chaves_sem_ns, urgente=form.cleaned_data['urgente'])
 
         messages.success(
             request,
@@ -250,6 +349,39 @@ def solicitacao_chave_view(request):
     # GET (ou POST inválido): não há mais página própria; volte à gestão
     return redirect("gerenciar_chaves")
 
+@login_required(login_url='/janus/login')
+def reservar_chaves_view(request):
+    # O projetista pega chaves livres direto, sem esperar um supervisor (chaves.reserva)
+    if request.method != 'POST':
+        return redirect("gerenciar_chaves")
+
+    projetista = Projetista.objects.filter(email=request.user).first()
+    if projetista is None:
+        messages.error(
+            request,
+            "Não foi possível localizar seu cadastro de projetista. Contate o administrador.",
+            extra_tags="no_toast"
+        )
+        return redirect("gerenciar_chaves")
+
+    quantidade = request.POST.get('quantidade', '')
+    quantidade = int(quantidade) if quantidade.isdigit() else 0
+    try:
+        chaves, atendida = reservar_chaves(projetista, quantidade)
+    except ReservaNegada as e:
+        messages.warning(request, str(e), extra_tags="chaves_sem_ns no_toast")
+    else:
+        messages.success(request, f"Chaves reservadas para você: {', '.join(chaves)}.", extra_tags="no_toast")
+        if atendida < quantidade:
+            messages.info(
+                request,
+                f"Pedido reduzido de {quantidade} para {atendida} chave(s): o limite é de {LIMITE_SEM_NS} chaves sem NS.",
+                extra_tags="no_toast"
+            )
+        elif len(chaves) < quantidade:
+            messages.info(request, f"Só havia {len(chaves)} chave(s) livre(s) no momento.", extra_tags="no_toast")
+    return redirect("gerenciar_chaves")
+
 def pagina_de_sucesso_view(request):
     return render(request, 'pagina_de_sucesso.html')
 
@@ -0,0 +1,112 @@
+"""
+Filtros do admin com opções e contagens em cache.
+
+Os list_filter padrão do Django montam as opções a cada carregamento da
+listagem (SELECT DISTINCT do campo, ou a tabela relacionada inteira, como
+todos os projetistas) e o changelist ainda faz COUNT(*) do resultado. Aqui:
+
+- FiltroFacetado lista só os valores presentes no campo, com a quantidade de
+  registros de cada um, a partir de um GROUP BY guardado no cache;
+- PaginadorContagemEmCache guarda o COUNT(*) de cada consulta da listagem.
+
+Tudo expira em FACETAS_TEMPO_CACHE segundos e é descartado antes disso
+quando um registro do modelo é salvo ou apagado (sinais ligados por
+monitorar()). Operações em lote que não disparam sinais (bulk_create,
+update, DELETE em lote) chamam invalidar_facetas() ou contam com o TTL.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+
+# Quantas opções (as mais frequentes) cada filtro mostra
+MAXIMO_OPCOES = 50
+
+
+def _chave_versao(modelo):
+    return f"facetas:versao:{modelo._meta.label_lower}"
+
+
+def _versao(modelo):
+    return cache.get_or_set(_chave_versao(modelo), 1, None)
+
+
+def invalidar_facetas(modelo):
+    """Descarta as facetas e contagens em cache de `modelo`."""
+    try:
+        cache.incr(_chave_versao(modelo))
+    except ValueError:
+        cache.set(_chave_versao(modelo), 1, None)
+
+
+def _invalidar_por_sinal(sender, **kwargs):
+    invalidar_facetas(sender)
+
+
+def monitorar(modelo, sinais=(post_save, post_delete)):
+    """
+    Liga a invalidação das facetas de `modelo` aos seus sinais. Um receptor
+    de post_delete tira do Django o DELETE rápido em lote (ele passa a
+    carregar cada registro), por isso pode ficar de fora de `sinais`.
+    """
+    for sinal in sinais:
+        sinal.connect(_invalidar_por_sinal, sender=modelo, dispatch_uid=f"facetas_{id(sinal)}_{modelo._meta.label_lower}")
+
+
+def _em_cache(modelo, nome, calcular):
+    chave = f"facetas:{modelo._meta.label_lower}:{_versao(modelo)}:{nome}"
+    valor = cache.get(chave)
+    if valor is None:
+        valor = calcular()
+        cache.set(chave, valor, settings.FACETAS_TEMPO_CACHE)
+    return valor
+
+
+def contagens(modelo, campo):
+    """[(valor, quantidade)] dos valores de `campo` em `modelo`, dos mais frequentes para os menos."""
+    def calcular():
+        return [
+            (linha[campo], linha['quantidade'])
+            for linha in modelo._default_manager.order_by().values(campo).annotate(quantidade=Count('pk'))
+        ]
+    return sorted(_em_cache(modelo, f"contagens:{campo}", calcular), key=lambda item: -item[1])
+
+
+class FiltroFacetado(admin.SimpleListFilter):
+    """
+    Filtro por igualdade em `campo` com as opções vindas de contagens().
+    Subclasses definem title, parameter_name e campo; para chaves
+    estrangeiras, rotulos() traduz os ids em nomes.
+    """
+    campo = None
+
+    def rotulos(self, valores):
+        return {valor: str(valor) for valor in valores}
+
+    def lookups(self, request, model_admin):
+        facetas = [(valor, quantidade) for valor, quantidade in contagens(model_admin.model, self.campo)
+                   if valor not in (None, '')][:MAXIMO_OPCOES]
+        rotulos = self.rotulos([valor for valor, _ in facetas])
+        opcoes = [(str(valor), f"{rotulos.get(valor, valor)} ({quantidade})") for valor, quantidade in facetas]
+        return sorted(opcoes, key=lambda opcao: opcao[1].lower())
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(**{self.campo: self.value()})
+
+
+class PaginadorContagemEmCache(Paginator):
+    """Paginator do admin que guarda o COUNT(*) de cada consulta (filtros + busca) no cache."""
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        sql, params = self.object_list.query.sql_with_params()
+        assinatura = hashlib.sha1(f"{sql}|{params!r}".encode('utf-8')).hexdigest()
+        return _em_cache(self.object_list.model, f"count:{assinatura}", self.object_list.count)
@@ -10,12 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from decouple import config, Csv
 from django.contrib.messages import constants as messages
 
 ENV = config('ENV', default='development')  # 'production' em produção
 
+# Rodando "manage.py test"
+TESTANDO = sys.argv[1:2] == ['test']
+
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,16 +76,46 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logs.middleware.latencia.LatenciaMiddleware',
+    'logs.middleware.monitor_consultas.MonitorConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'logs.middleware.perfilador.PerfiladorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
 ]
 
+# Monitor de consultas SQL (logs.middleware.monitor_consultas): a mesma consulta
+# repetida este número de vezes numa requisição é registrada como possível N+1
+CONSULTAS_LIMIAR_REPETICAO = config('CONSULTAS_LIMIAR_REPETICAO', cast=int, default=10)
+# Orçamento de consultas excedido vira erro em vez de registro (ligado ao rodar os testes)
+CONSULTAS_ORCAMENTO_ESTRITO = config('CONSULTAS_ORCAMENTO_ESTRITO', cast=bool, default=TESTANDO)
+# Consultas a partir desta duração (ms) são registradas em logs.ConsultaLenta, com o EXPLAIN
+# dos SELECTs obtido por uma thread depois da resposta (na hora, nos testes)
+CONSULTAS_LENTAS_MS = config('CONSULTAS_LENTAS_MS', cast=float, default=200)
+CONSULTAS_LENTAS_EXPLAIN_ASSINCRONO = config('CONSULTAS_LENTAS_EXPLAIN_ASSINCRONO', cast=bool, default=not TESTANDO)
+
+# Histogramas de latência por view (logs.latencia): intervalo, em segundos, entre as
+# gravações no banco feitas pela thread de cada processo (0 desliga a thread)
+LATENCIA_DESCARGA_SEGUNDOS = config('LATENCIA_DESCARGA_SEGUNDOS', cast=int, default=0 if TESTANDO else 60)
+
+# Erros do LogErroMiddleware (logs.erros) são agrupados em memória e gravados a cada
+# tantos segundos por uma thread de cada processo (0 grava cada erro na hora)
+ERROS_DESCARGA_SEGUNDOS = config('ERROS_DESCARGA_SEGUNDOS', cast=int, default=0 if TESTANDO else 10)
+
+# Erros sem nova ocorrência há mais que isso são apagados pelo "manage.py purgar_erros"
+ERROS_RETENCAO_DIAS = config('ERROS_RETENCAO_DIAS', cast=int, default=180)
+
+# Validade (s) das opções/contagens dos filtros e do total das listagens do admin (core.facetas)
+FACETAS_TEMPO_CACHE = config('FACETAS_TEMPO_CACHE', cast=int, default=300)
+
+# Solicitações de chaves feitas dentro desta janela (min) saem num único e-mail de resumo (chaves.solicitacoes); 0 envia cada uma
+SOLICITACOES_JANELA_MINUTOS = config('SOLICITACOES_JANELA_MINUTOS', cast=int, default=10)
+
 # Ativar captura de erros no log apenas em produção
 if ENV == 'production':
     MIDDLEWARE.insert(0, 'logs.middleware.erro_logger.LogErroMiddleware')
@@ -193,6 +227,19 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'    # destino do collectstatic em produç
 # Mídia enviada por usuários
 MEDIA_ROOT = BASE_DIR / 'mediafiles'
 
+# Processos que interpretam csv grandes em paralelo na importação de chaves
+# (0 = automático pelo número de CPUs; 1 desliga o paralelismo)
+IMPORTACAO_PROCESSOS = config('IMPORTACAO_PROCESSOS', cast=int, default=0)
+
+# Importação em PROCESSANDO há mais que isso (worker morto no meio) volta para a fila do worker
+IMPORTACAO_RESERVA_EXPIRA_MINUTOS = config('IMPORTACAO_RESERVA_EXPIRA_MINUTOS', cast=int, default=120)
+
+# Reenvio da mesma planilha mostra a importação anterior se ela tiver até estas horas; depois disso é importada de novo
+IMPORTACAO_REAPROVEITAR_HORAS = config('IMPORTACAO_REAPROVEITAR_HORAS', cast=int, default=24)
+
+# Atribuição de projetista em PROCESSANDO há mais que isso (worker morto no meio) volta para a fila do worker
+ATRIBUICAO_RESERVA_EXPIRA_MINUTOS = config('ATRIBUICAO_RESERVA_EXPIRA_MINUTOS', cast=int, default=30)
+
 # Se o app estiver atrás de proxy (HTTPS terminado no proxy)
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
@@ -1,16 +1,45 @@
 from django.contrib import admin
-from .models import ErroSistema
+from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from core.facetas import FiltroFacetado, PaginadorContagemEmCache, monitorar
+from .models import ConsultaLenta, ConsultaSuspeita, ErroSistema, LatenciaView, PerfilRequisicao
+
+class UsuarioFilter(FiltroFacetado):
+    title = 'usuario'
+    parameter_name = 'usuario'
+    campo = 'usuario'
+
+
+class ViewFilter(FiltroFacetado):
+    title = 'view'
+    parameter_name = 'view'
+    campo = 'view'
+
+
+# Só post_save: um receptor de post_delete deixaria o purgar_erros carregar cada registro antes de apagar
+monitorar(ErroSistema, sinais=(post_save,))
+
 
 @admin.register(ErroSistema)
 class ErroSistemaAdmin(admin.ModelAdmin):
-    list_display = ('data', 'view', 'usuario', 'mensagem_curta', 'corrigido', 'icone_suporte')
-    search_fields = ('view', 'usuario', 'mensagem', 'stack_trace', 'acao_corretiva')
-    list_filter = ('usuario', 'view', 'data', 'corrigido')
+    # Cada linha é um erro distinto (logs.erros); view, usuário e mensagem são os da última ocorrência
+    list_display = ('ultima', 'tipo_curto', 'mensagem_curta', 'ocorrencias', 'view', 'usuario', 'data', 'corrigido', 'icone_suporte')
+    # stack_trace fica fora da busca: LIKE num TextField enorme varre a tabela inteira
+    search_fields = ('view', 'usuario', 'mensagem', 'acao_corretiva')
+    list_filter = (UsuarioFilter, ViewFilter, 'data', 'corrigido')
+    # Opções dos filtros e total da listagem em cache (core.facetas), sem o COUNT(*) da tabela inteira
+    paginator = PaginadorContagemEmCache
+    show_full_result_count = False
     list_editable = ('corrigido',)
-    readonly_fields = ('data', 'view', 'usuario', 'mensagem', 'stack_trace')
+    ordering = ('-ultima',)
+    readonly_fields = ('data', 'ultima', 'ocorrencias', 'tipo', 'view', 'usuario', 'mensagem', 'stack_trace')
     fieldsets = (
         (None, {
-            'fields': ('data', 'view', 'usuario', 'mensagem', 'stack_trace')
+            'fields': ('data', 'ultima', 'ocorrencias', 'tipo', 'view', 'usuario', 'mensagem', 'stack_trace')
         }),
         ('Tratamento do erro', {
             'fields': ('corrigido', 'acao_corretiva'),
@@ -22,6 +51,122 @@ class ErroSistemaAdmin(admin.ModelAdmin):
         return (obj.mensagem[:60] + '...') if len(obj.mensagem) > 60 else obj.mensagem
     mensagem_curta.short_description = "Mensagem"
 
+    def tipo_curto(self, obj):
+        return obj.tipo.rsplit('.', 1)[-1]
+    tipo_curto.short_description = "Tipo"
+
     def icone_suporte(self, obj):
         return "✅" if obj.corrigido else "🚨"
     icone_suporte.short_description = "Status"
+
+
+@admin.register(ConsultaSuspeita)
+class ConsultaSuspeitaAdmin(admin.ModelAdmin):
+    list_display = ('ultima', 'view', 'motivo', 'repeticoes', 'total_consultas', 'limite', 'tempo_banco_ms', 'ocorrencias')
+    list_filter = ('motivo', 'view')
+    search_fields = ('view', 'caminho')
+    readonly_fields = ('view', 'motivo', 'consulta', 'repeticoes', 'total_consultas', 'limite',
+                       'tempo_banco_ms', 'caminho', 'ocorrencias', 'primeira', 'ultima')
+
+    def has_add_permission(self, request):
+        return False
+
+
+def _ms(valor):
+    return '-' if valor is None else f"{valor:.0f} ms"
+
+
+@admin.register(LatenciaView)
+class LatenciaViewAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'view', 'requisicoes', 'p50', 'p95', 'p99', 'media')
+    list_filter = ('dia', 'view')
+    search_fields = ('view',)
+    date_hierarchy = 'dia'
+    readonly_fields = ('view', 'dia', 'requisicoes', 'p50', 'p95', 'p99', 'media')
+    exclude = ('soma_ms', 'contagens')
+
+    def has_add_permission(self, request):
+        return False
+
+    def p50(self, obj):
+        return _ms(obj.percentil(50))
+    p50.short_description = "p50"
+
+    def p95(self, obj):
+        return _ms(obj.percentil(95))
+    p95.short_description = "p95"
+
+    def p99(self, obj):
+        return _ms(obj.percentil(99))
+    p99.short_description = "p99"
+
+    def media(self, obj):
+        return _ms(obj.media_ms)
+    media.short_description = "Média"
+
+
+@admin.register(PerfilRequisicao)
+class PerfilRequisicaoAdmin(admin.ModelAdmin):
+    list_display = ('data', 'usuario', 'metodo', 'view', 'status', 'duracao_ms', 'link_download')
+    list_filter = ('view', 'usuario')
+    search_fields = ('caminho', 'view')
+    readonly_fields = ('data', 'usuario', 'metodo', 'view', 'caminho', 'status', 'duracao_ms', 'resumo_formatado', 'link_download')
+    exclude = ('resumo', 'dados')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/baixar/', self.admin_site.admin_view(self.baixar), name='logs_perfilrequisicao_baixar'),
+        ]
+        return urls + super().get_urls()
+
+    def baixar(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        perfil = get_object_or_404(PerfilRequisicao, pk=pk)
+        response = HttpResponse(bytes(perfil.dados), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="perfil_{perfil.pk}.prof"'
+        return response
+
+    def resumo_formatado(self, obj):
+        return format_html('<pre style="font-size: 12px">{}</pre>', obj.resumo)
+    resumo_formatado.short_description = "Funções mais demoradas"
+
+    def link_download(self, obj):
+        return format_html('<a href="{}">.prof (snakeviz)</a>', reverse('admin:logs_perfilrequisicao_baixar', args=[obj.pk]))
+    link_download.short_description = "Baixar"
+
+
+@admin.register(ConsultaLenta)
+class ConsultaLentaAdmin(admin.ModelAdmin):
+    list_display = ('ultima', 'view', 'consulta_curta', 'ocorrencias', 'media', 'maior_ms', 'tem_plano')
+    list_filter = ('view',)
+    search_fields = ('view', 'consulta')
+    readonly_fields = ('view', 'consulta', 'formato_parametros', 'caminho', 'ocorrencias', 'duracao_ms',
+                       'maior_ms', 'media', 'plano_formatado', 'primeira', 'ultima')
+    exclude = ('soma_ms', 'plano')
+
+    def has_add_permission(self, request):
+        return False
+
+    def consulta_curta(self, obj):
+        return (obj.consulta[:100] + '...') if len(obj.consulta) > 100 else obj.consulta
+    consulta_curta.short_description = "Consulta"
+
+    def media(self, obj):
+        return _ms(obj.media_ms)
+    media.short_description = "Média"
+
+    def tem_plano(self, obj):
+        return bool(obj.plano)
+    tem_plano.boolean = True
+    tem_plano.short_description = "EXPLAIN"
+
+    def plano_formatado(self, obj):
+        return format_html('<pre style="font-size: 12px">{}</pre>', obj.plano or 'Aguardando EXPLAIN')
+    plano_formatado.short_description = "Plano (EXPLAIN)"
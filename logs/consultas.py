@@ -0,0 +1,96 @@
+"""
+Contagem de consultas SQL por requisição e detecção de N+1.
+
+O ColetorConsultas é instalado com connection.execute_wrapper durante a
+requisição (logs.middleware.monitor_consultas) e agrupa as consultas pela
+"forma" do SQL: parâmetros já vêm separados, então basta juntar listas de
+IN (%s, %s, ...) e literais numéricos/strings de SQL cru. A mesma forma
+executada muitas vezes numa requisição é o sinal típico de N+1 (um acesso
+a chave.projetista por linha de uma listagem, por exemplo).
+
+O orçamento de consultas de cada view é declarado junto do path() com
+orcamento_consultas(view, limite). Ele conta só o que roda até a view
+retornar: as consultas do corpo de um StreamingHttpResponse ficam de fora.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+from functools import wraps
+
+_LISTA_IN = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r"\b\d+\b")
+_ESPACOS = re.compile(r"\s+")
+
+
+def forma_consulta(sql):
+    """SQL normalizado: consultas que só diferem nos valores têm a mesma forma."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMERO.sub('?', sql)
+    sql = _LISTA_IN.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+def assinatura(*partes):
+    """Hash curto usado para agrupar registros (view + forma da consulta)."""
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def formato_parametros(params, many=False):
+    """Tipos dos parâmetros, sem os valores: '(int, str)'; em executemany, 'N x (...)'."""
+    if many:
+        params = list(params or [])
+        return f"{len(params)} x {formato_parametros(params[0]) if params else '()'}"
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{nome}: {type(valor).__name__}" for nome, valor in params.items()) + '}'
+    return '(' + ', '.join(type(valor).__name__ for valor in params or ()) + ')'
+
+
+class ColetorConsultas:
+    """
+    execute_wrapper que conta consultas, soma o tempo no banco e agrupa por
+    forma. Com `limiar_lenta` (segundos), guarda também as consultas que
+    demoraram esse tanto ou mais: (alias, sql, params, many, duração).
+    """
+
+    def __init__(self, limiar_lenta=None):
+        self.total = 0
+        self.tempo = 0.0
+        self.formas = Counter()
+        self.limiar_lenta = limiar_lenta
+        self.lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.tempo += duracao
+            self.total += 1
+            self.formas[forma_consulta(sql)] += 1
+            if self.limiar_lenta is not None and duracao >= self.limiar_lenta:
+                self.lentas.append((context['connection'].alias, sql, params, many, duracao))
+
+    def repetidas(self, limiar):
+        """(forma, vezes) das consultas executadas `limiar` vezes ou mais, da mais repetida para a menos."""
+        return [(forma, vezes) for forma, vezes in self.formas.most_common() if vezes >= limiar]
+
+
+class OrcamentoConsultasExcedido(AssertionError):
+    """Levantada no modo estrito (testes) quando uma view passa do seu orçamento."""
+
+
+def orcamento_consultas(view, limite):
+    """
+    Declara quantas consultas `view` pode fazer por requisição, contando as
+    da sessão e do usuário. Uso em urls.py:
+
+        path('menu/', orcamento_consultas(janus_view, 8), name='janus_view')
+    """
+    @wraps(view)
+    def view_com_orcamento(*args, **kwargs):
+        return view(*args, **kwargs)
+    view_com_orcamento.orcamento_consultas = limite
+    return view_com_orcamento
@@ -0,0 +1,157 @@
+"""
+Registro agrupado de erros (ErroSistema) com gravação em lote.
+
+Cada exceção vira uma assinatura: tipo + sequência de (arquivo, função) do
+traceback, sem números de linha nem mensagem, para que o mesmo erro em
+outra chave/URL ou depois de um deploy caia no mesmo registro. As
+ocorrências são somadas em memória e gravadas por uma thread a cada
+ERROS_DESCARGA_SEGUNDOS, uma linha por erro distinto: uma view quebrada
+sob carga custa uma escrita por intervalo, não uma por requisição.
+
+O buffer guarda no máximo MAXIMO_ERROS_BUFFER erros distintos; além disso
+as ocorrências são descartadas (e contadas em `descartados`), para que uma
+enxurrada de erros diferentes não derrube o banco nem a memória. Com
+ERROS_DESCARGA_SEGUNDOS = 0 (testes) cada erro é gravado na hora.
+
+Um erro marcado como corrigido que volta a ocorrer é reaberto.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAXIMO_ERROS_BUFFER = 500
+
+
+def assinatura_erro(exception):
+    """Tipo da exceção e sua assinatura (hash do tipo + arquivo/função de cada frame)."""
+    tipo = f"{type(exception).__module__}.{type(exception).__qualname__}"
+    frames = [
+        f"{os.path.basename(frame.filename)}:{frame.name}"
+        for frame in traceback.extract_tb(exception.__traceback__)
+    ]
+    return tipo, hashlib.sha1('|'.join([tipo, *frames]).encode('utf-8')).hexdigest()
+
+
+class BufferErros:
+    def __init__(self, maximo=MAXIMO_ERROS_BUFFER):
+        self.maximo = maximo
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self._erros = {}
+
+    def adicionar(self, assinatura, dados):
+        """Soma uma ocorrência; `dados` (tipo, view, usuário, mensagem, stack trace) substitui o anterior."""
+        with self._lock:
+            atual = self._erros.get(assinatura)
+            if atual is not None:
+                atual['ocorrencias'] += 1
+                atual['ultima'] = dados['ultima']
+                atual['dados'] = dados
+            elif len(self._erros) < self.maximo:
+                self._erros[assinatura] = {'ocorrencias': 1, 'ultima': dados['ultima'], 'dados': dados}
+            else:
+                self.descartados += 1
+                return False
+        return True
+
+    def retirar(self):
+        with self._lock:
+            erros, self._erros = self._erros, {}
+        return erros
+
+
+buffer = BufferErros()
+
+
+def _gravar(assinatura, agregado):
+    from .models import ErroSistema
+
+    dados = agregado['dados']
+    campos = {
+        'tipo': dados['tipo'][:255],
+        'view': dados['view'][:255],
+        'usuario': dados['usuario'][:255],
+        'mensagem': dados['mensagem'],
+        'stack_trace': dados['stack_trace'],
+        'ultima': agregado['ultima'],
+        'corrigido': False,
+    }
+    atualizar = ErroSistema.objects.filter(assinatura=assinatura)
+    if atualizar.update(ocorrencias=F('ocorrencias') + agregado['ocorrencias'], **campos):
+        return
+    try:
+        ErroSistema.objects.create(assinatura=assinatura, ocorrencias=agregado['ocorrencias'], **campos)
+    except IntegrityError:
+        # Outro processo gravou o mesmo erro ao mesmo tempo
+        atualizar.update(ocorrencias=F('ocorrencias') + agregado['ocorrencias'], **campos)
+
+
+def descarregar():
+    """Grava o buffer em ErroSistema. Retorna quantos erros distintos foram gravados."""
+    erros = buffer.retirar()
+    for assinatura, agregado in erros.items():
+        _gravar(assinatura, agregado)
+    if buffer.descartados:
+        logger.warning("%s ocorrências de erro descartadas com o buffer cheio", buffer.descartados)
+        buffer.descartados = 0
+    return len(erros)
+
+
+def registrar_erro(exception, view='', usuario=''):
+    """Registra uma exceção; sem thread de descarga (ERROS_DESCARGA_SEGUNDOS = 0) grava na hora."""
+    tipo, assinatura = assinatura_erro(exception)
+    buffer.adicionar(assinatura, {
+        'tipo': tipo,
+        'view': view,
+        'usuario': usuario,
+        'mensagem': str(exception),
+        'stack_trace': ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__)),
+        'ultima': timezone.now(),
+    })
+    if settings.ERROS_DESCARGA_SEGUNDOS <= 0:
+        descarregar()
+    else:
+        iniciar_descarga(settings.ERROS_DESCARGA_SEGUNDOS)
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _laco_descarga(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        try:
+            descarregar()
+        except Exception:
+            logger.exception("Falha ao gravar erros do sistema")
+        finally:
+            connections.close_all()
+
+
+def iniciar_descarga(intervalo):
+    global _thread
+    if _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_laco_descarga, args=(intervalo,), name='descarga-erros', daemon=True)
+            _thread.start()
+            atexit.register(_descarregar_na_saida)
+
+
+def _descarregar_na_saida():
+    try:
+        descarregar()
+    except Exception:
+        logger.exception("Falha ao gravar erros do sistema na saída")
@@ -0,0 +1,121 @@
+"""
+Histogramas de latência por view, agregados em memória e gravados em lote.
+
+Cada requisição só incrementa um contador numa lista (faixa de tempo de
+resposta, via bisect) sob um lock: poucos microssegundos, sem I/O. Uma
+thread em segundo plano descarrega os contadores a cada
+LATENCIA_DESCARGA_SEGUNDOS em LatenciaView, uma linha por view e dia, somando
+aos valores já gravados por este e pelos outros processos. O que ainda
+estiver em memória é descarregado também na saída do processo.
+
+Os percentis vêm do histograma (interpolados dentro da faixa), então têm a
+precisão das FAIXAS_MS, o bastante para comparar antes e depois de um deploy.
+"""
+import atexit
+import logging
+import threading
+from bisect import bisect_left
+from datetime import date
+
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Limite superior (ms) de cada faixa; a última faixa recebe o que passar de 30 s
+FAIXAS_MS = (5, 10, 25, 50, 75, 100, 150, 250, 400, 600, 1000, 1500, 2500, 4000, 6000, 10000, 30000)
+NUMERO_FAIXAS = len(FAIXAS_MS) + 1
+
+
+class HistogramaLatencia:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}
+
+    def registrar(self, view, milissegundos):
+        faixa = bisect_left(FAIXAS_MS, milissegundos)
+        chave = (view, date.today())
+        with self._lock:
+            contagens = self._dados.get(chave)
+            if contagens is None:
+                # [contagem por faixa..., soma dos tempos em ms]
+                contagens = self._dados[chave] = [0] * NUMERO_FAIXAS + [0.0]
+            contagens[faixa] += 1
+            contagens[-1] += milissegundos
+
+    def retirar(self):
+        """Devolve e zera os contadores acumulados: {(view, dia): [contagens..., soma_ms]}."""
+        with self._lock:
+            dados, self._dados = self._dados, {}
+        return dados
+
+
+histograma = HistogramaLatencia()
+
+
+def percentil(contagens, p):
+    """Percentil `p` (0-100) em ms, estimado a partir das contagens por faixa."""
+    total = sum(contagens)
+    if not total:
+        return None
+    alvo = total * p / 100
+    acumulado = 0
+    for faixa, quantidade in enumerate(contagens):
+        if quantidade and acumulado + quantidade >= alvo:
+            inicio = FAIXAS_MS[faixa - 1] if faixa else 0
+            fim = FAIXAS_MS[faixa] if faixa < len(FAIXAS_MS) else inicio
+            return inicio + (fim - inicio) * (alvo - acumulado) / quantidade
+        acumulado += quantidade
+    return float(FAIXAS_MS[-1])
+
+
+def descarregar():
+    """Grava os contadores em memória em LatenciaView. Retorna quantas linhas foram atualizadas."""
+    from .models import LatenciaView
+
+    dados = histograma.retirar()
+    for (view, dia), valores in dados.items():
+        contagens, soma_ms = valores[:-1], valores[-1]
+        with transaction.atomic():
+            registro, _ = LatenciaView.objects.select_for_update().get_or_create(
+                view=view, dia=dia, defaults={'contagens': [0] * NUMERO_FAIXAS},
+            )
+            anteriores = registro.contagens + [0] * (NUMERO_FAIXAS - len(registro.contagens))
+            registro.contagens = [a + b for a, b in zip(anteriores, contagens)]
+            registro.requisicoes += sum(contagens)
+            registro.soma_ms += soma_ms
+            registro.save()
+    return len(dados)
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _laco_descarga(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        try:
+            descarregar()
+        except Exception:
+            logger.exception("Falha ao gravar histogramas de latência")
+        finally:
+            connections.close_all()
+
+
+def iniciar_descarga(intervalo):
+    """Inicia (uma vez por processo) a thread que descarrega os histogramas a cada `intervalo` segundos."""
+    global _thread
+    if intervalo <= 0 or _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_laco_descarga, args=(intervalo,), name='descarga-latencia', daemon=True)
+            _thread.start()
+            atexit.register(_descarregar_na_saida)
+
+
+def _descarregar_na_saida():
+    try:
+        descarregar()
+    except Exception:
+        logger.exception("Falha ao gravar histogramas de latência na saída")
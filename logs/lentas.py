@@ -0,0 +1,125 @@
+"""
+Registro de consultas SQL lentas, com o plano de execução.
+
+As consultas acima de CONSULTAS_LENTAS_MS são coletadas pelo
+ColetorConsultas do MonitorConsultasMiddleware e gravadas aqui depois da
+resposta: uma ConsultaLenta por (view, forma do SQL), com contadores. Os
+valores dos parâmetros não são gravados, só os tipos.
+
+Na primeira vez que um SELECT aparece (ou enquanto não tiver plano), o
+EXPLAIN é enfileirado para uma thread do processo, que o roda com os
+parâmetros originais e grava a saída em `plano`; a requisição não espera por
+ele. Com CONSULTAS_LENTAS_EXPLAIN_ASSINCRONO desligado (testes) o EXPLAIN roda
+na hora.
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .consultas import assinatura, forma_consulta, formato_parametros
+
+logger = logging.getLogger(__name__)
+
+# EXPLAINs aguardando a thread; se a fila encher, os excedentes são descartados
+# (voltam a ser pedidos na próxima ocorrência, enquanto o plano estiver vazio)
+TAMANHO_FILA_EXPLAIN = 100
+
+_fila = queue.Queue(maxsize=TAMANHO_FILA_EXPLAIN)
+_pendentes = set()
+_lock = threading.Lock()
+_thread = None
+
+
+def prefixo_explain(vendor):
+    return 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+
+
+def explicar(alias, sql, params):
+    """Saída do EXPLAIN de `sql` como texto tabulado (cabeçalho + linhas)."""
+    conexao = connections[alias]
+    with conexao.cursor() as cursor:
+        cursor.execute(prefixo_explain(conexao.vendor) + sql, params)
+        colunas = [coluna[0] for coluna in cursor.description or ()]
+        linhas = cursor.fetchall()
+    return '\n'.join('\t'.join('' if valor is None else str(valor) for valor in linha) for linha in [colunas, *linhas])
+
+
+def _gravar_plano(chave, alias, sql, params):
+    from .models import ConsultaLenta
+
+    try:
+        plano = explicar(alias, sql, params)
+    except Exception as erro:
+        plano = f"EXPLAIN falhou: {erro}"
+    ConsultaLenta.objects.filter(assinatura=chave).update(plano=plano)
+
+
+def _laco_explain():
+    while True:
+        chave, alias, sql, params = _fila.get()
+        try:
+            _gravar_plano(chave, alias, sql, params)
+        except Exception:
+            logger.exception("Falha ao gravar o EXPLAIN de uma consulta lenta")
+        finally:
+            with _lock:
+                _pendentes.discard(chave)
+            connections.close_all()
+
+
+def _pedir_explain(chave, alias, sql, params):
+    global _thread
+    if not settings.CONSULTAS_LENTAS_EXPLAIN_ASSINCRONO:
+        _gravar_plano(chave, alias, sql, params)
+        return
+    with _lock:
+        if chave in _pendentes:
+            return
+        if _thread is None:
+            _thread = threading.Thread(target=_laco_explain, name='explain-consultas-lentas', daemon=True)
+            _thread.start()
+        try:
+            _fila.put_nowait((chave, alias, sql, params))
+        except queue.Full:
+            return
+        _pendentes.add(chave)
+
+
+def registrar_lentas(view, caminho, lentas):
+    """Grava as consultas lentas de uma requisição: [(alias, sql, params, many, duração em s)]."""
+    from .models import ConsultaLenta
+
+    agora = timezone.now()
+    for alias, sql, params, many, duracao in lentas:
+        forma = forma_consulta(sql)
+        chave = assinatura(view, forma)
+        duracao_ms = duracao * 1000
+        atualizadas = ConsultaLenta.objects.filter(assinatura=chave).update(
+            ocorrencias=F('ocorrencias') + 1,
+            duracao_ms=duracao_ms,
+            maior_ms=Greatest('maior_ms', duracao_ms),
+            soma_ms=F('soma_ms') + duracao_ms,
+            caminho=caminho[:255],
+            ultima=agora,
+        )
+        if not atualizadas:
+            try:
+                ConsultaLenta.objects.create(
+                    assinatura=chave, view=view[:255], consulta=forma,
+                    formato_parametros=formato_parametros(params, many)[:255], caminho=caminho[:255],
+                    duracao_ms=duracao_ms, maior_ms=duracao_ms, soma_ms=duracao_ms, ultima=agora,
+                )
+            except IntegrityError:
+                # Outra requisição registrou a mesma consulta ao mesmo tempo
+                continue
+
+        if not many and forma.lstrip('(').upper().startswith('SELECT') and (
+            not atualizadas or ConsultaLenta.objects.filter(assinatura=chave, plano='').exists()
+        ):
+            _pedir_explain(chave, alias, sql, params)
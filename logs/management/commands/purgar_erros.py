@@ -0,0 +1,101 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.facetas import invalidar_facetas
+from logs.models import ErroSistema
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga os erros do sistema sem nova ocorrência há mais de ERROS_RETENCAO_DIAS dias, "
+        "em lotes pequenos (cada DELETE segura poucos locks no MySQL). Com --arquivar, "
+        "grava antes os registros apagados num .jsonl.gz. Pensado para rodar no cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.ERROS_RETENCAO_DIAS,
+            help=f'Retenção em dias, contada da última ocorrência (padrão: {settings.ERROS_RETENCAO_DIAS}).',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Registros apagados por DELETE (padrão: 500).',
+        )
+        parser.add_argument(
+            '--pausa', type=float, default=0.1,
+            help='Segundos de espera entre lotes, para não disputar o banco com as requisições (padrão: 0.1).',
+        )
+        parser.add_argument(
+            '--arquivar', metavar='DIRETORIO',
+            help='Grava os registros apagados (com stack trace) em DIRETORIO/erros_<data>.jsonl.gz.',
+        )
+        parser.add_argument(
+            '--somente-corrigidos', action='store_true',
+            help='Apaga apenas os erros marcados como corrigidos.',
+        )
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Só conta quantos registros seriam apagados.',
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 1:
+            raise CommandError("--dias e --lote precisam ser maiores que zero.")
+
+        limite = timezone.now() - timedelta(days=options['dias'])
+        antigos = ErroSistema.objects.filter(ultima__lt=limite)
+        if options['somente_corrigidos']:
+            antigos = antigos.filter(corrigido=True)
+
+        if options['simular']:
+            self.stdout.write(f"{antigos.count()} erros seriam apagados (última ocorrência antes de {limite:%d/%m/%Y}).")
+            return
+
+        arquivo = None
+        if options['arquivar']:
+            diretorio = Path(options['arquivar'])
+            if not diretorio.is_dir():
+                raise CommandError(f"Diretório não encontrado: {diretorio}")
+            caminho = diretorio / f"erros_{timezone.localtime():%Y%m%d_%H%M%S}.jsonl.gz"
+            arquivo = gzip.open(caminho, 'wt', encoding='utf-8')
+
+        total = 0
+        try:
+            while True:
+                # Lote por id: o DELETE usa a chave primária e não varre a tabela
+                if arquivo is not None:
+                    registros = list(antigos.order_by('pk').values()[:options['lote']])
+                    ids = [registro['id'] for registro in registros]
+                    for registro in registros:
+                        arquivo.write(json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                    # O que foi arquivado precisa estar no disco antes de sair do banco
+                    arquivo.flush()
+                else:
+                    ids = list(antigos.order_by('pk').values_list('pk', flat=True)[:options['lote']])
+                if not ids:
+                    break
+                ErroSistema.objects.filter(pk__in=ids).delete()
+                total += len(ids)
+                if len(ids) < options['lote']:
+                    break
+                time.sleep(options['pausa'])
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+                if not total:
+                    caminho.unlink()
+
+        if total:
+            invalidar_facetas(ErroSistema)
+        mensagem = f"{total} erros apagados (última ocorrência antes de {limite:%d/%m/%Y})."
+        if arquivo is not None and total:
+            mensagem += f" Arquivo: {caminho}"
+        self.stdout.write(self.style.SUCCESS(mensagem))
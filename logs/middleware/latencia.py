@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+
+from logs.latencia import histograma, iniciar_descarga
+
+
+class LatenciaMiddleware:
+    """
+    Mede o tempo de resposta de cada requisição e soma no histograma em
+    memória da view (nome da URL). A gravação no banco fica com a thread de
+    logs.latencia, a cada LATENCIA_DESCARGA_SEGUNDOS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        iniciar_descarga(settings.LATENCIA_DESCARGA_SEGUNDOS)
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        # Requisições sem rota (404 de URL inexistente) não entram: o nome da view é a chave do histograma
+        if match is not None:
+            histograma.registrar(match.view_name or match._func_path, (time.perf_counter() - inicio) * 1000)
+        return response
@@ -0,0 +1,102 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.http import FileResponse
+from django.db.models import F
+from django.utils import timezone
+
+from logs.consultas import ColetorConsultas, OrcamentoConsultasExcedido, assinatura
+from logs.lentas import registrar_lentas
+from logs.models import ConsultaSuspeita
+
+
+class MonitorConsultasMiddleware:
+    """
+    Conta as consultas SQL e o tempo no banco de cada requisição. Grava em
+    ConsultaSuspeita as requisições que repetem a mesma forma de consulta
+    CONSULTAS_LIMIAR_REPETICAO vezes ou mais (possível N+1) e as que passam do
+    orçamento declarado com logs.consultas.orcamento_consultas. Com
+    CONSULTAS_ORCAMENTO_ESTRITO (ligado nos testes) o orçamento excedido
+    vira erro. Consultas acima de CONSULTAS_LENTAS_MS vão para logs.lentas.
+
+    O corpo de um StreamingHttpResponse é gerado depois que a view retorna
+    (as exportações em CSV consultam bloco a bloco enquanto enviam): ali só
+    as consultas lentas são registradas, quando o corpo termina. Contagem,
+    orçamento e repetição valem para o que a view executa antes de retornar.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        coletor = ColetorConsultas(limiar_lenta=settings.CONSULTAS_LENTAS_MS / 1000)
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(coletor))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else ''
+        if coletor.lentas:
+            registrar_lentas(view, request.path, coletor.lentas)
+        # FileResponse lê um arquivo pronto, sem consultas; trocar o corpo perderia o wsgi.file_wrapper
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self.lentas_do_corpo(response.streaming_content, view, request.path)
+        if match is None:
+            return response
+        limite = getattr(match.func, 'orcamento_consultas', None)
+
+        if limite is not None and coletor.total > limite:
+            if settings.CONSULTAS_ORCAMENTO_ESTRITO:
+                formas = '\n'.join(f"  {vezes}x {forma}" for forma, vezes in coletor.formas.most_common(5))
+                raise OrcamentoConsultasExcedido(
+                    f"{view} fez {coletor.total} consultas (orçamento: {limite}). Mais frequentes:\n{formas}"
+                )
+            self.registrar(request, view, coletor, ConsultaSuspeita.ORCAMENTO, limite=limite)
+
+        repetidas = coletor.repetidas(settings.CONSULTAS_LIMIAR_REPETICAO)
+        if repetidas:
+            forma, vezes = repetidas[0]
+            self.registrar(request, view, coletor, ConsultaSuspeita.REPETICAO, forma, vezes, limite)
+        return response
+
+    def lentas_do_corpo(self, partes, view, caminho):
+        """Gera as partes do corpo com o coletor instalado a cada próxima parte e registra as lentas no fim."""
+        coletor = ColetorConsultas(limiar_lenta=settings.CONSULTAS_LENTAS_MS / 1000)
+        partes = iter(partes)
+        try:
+            while True:
+                # Instalado só durante o next(): entre uma parte e outra o servidor usa a conexão à vontade
+                with ExitStack() as pilha:
+                    for conexao in connections.all():
+                        pilha.enter_context(conexao.execute_wrapper(coletor))
+                    try:
+                        parte = next(partes)
+                    except StopIteration:
+                        break
+                yield parte
+        finally:
+            if hasattr(partes, 'close'):
+                partes.close()
+            if coletor.lentas:
+                registrar_lentas(view, caminho, coletor.lentas)
+
+    def registrar(self, request, view, coletor, motivo, consulta='', repeticoes=0, limite=None):
+        # Uma linha por (view, motivo, consulta): as ocorrências seguintes só atualizam contadores
+        chave = assinatura(view, motivo, consulta)
+        valores = {
+            'total_consultas': coletor.total,
+            'tempo_banco_ms': coletor.tempo * 1000,
+            'repeticoes': repeticoes,
+            'limite': limite,
+            'caminho': request.path[:255],
+            'ultima': timezone.now(),
+        }
+        if ConsultaSuspeita.objects.filter(assinatura=chave).update(ocorrencias=F('ocorrencias') + 1, **valores):
+            return
+        try:
+            ConsultaSuspeita.objects.create(assinatura=chave, view=view[:255], motivo=motivo, consulta=consulta, **valores)
+        except IntegrityError:
+            # Outra requisição criou a linha ao mesmo tempo
+            ConsultaSuspeita.objects.filter(assinatura=chave).update(ocorrencias=F('ocorrencias') + 1, **valores)
@@ -0,0 +1,63 @@
+import cProfile
+import io
+import marshal
+import pstats
+import time
+
+from django.urls import reverse
+
+from logs.models import PerfilRequisicao
+
+# Quantas funções (por tempo acumulado) entram no resumo exibido no admin
+FUNCOES_RESUMO = 40
+
+
+class PerfiladorMiddleware:
+    """
+    Roda o cProfile numa única requisição quando um superusuário pede, com
+    ?_perfilar na URL ou o cabeçalho X-Perfilar. O perfil fica em
+    PerfilRequisicao (admin de logs) e o cabeçalho X-Perfil da resposta
+    aponta para ele. Fica depois do AuthenticationMiddleware.
+
+    Sem o pedido, o custo é olhar a querystring e um cabeçalho: o usuário
+    nem é carregado.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.pedido(request) or not request.user.is_superuser:
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        response = perfil.runcall(self.get_response, request)
+        duracao = time.perf_counter() - inicio
+
+        registro = self.salvar(request, response, perfil, duracao)
+        response['X-Perfil'] = reverse('admin:logs_perfilrequisicao_change', args=[registro.pk])
+        return response
+
+    @staticmethod
+    def pedido(request):
+        # Parâmetro _perfilar (com ou sem valor), não um trecho qualquer da querystring como ?q=x_perfilar
+        return '_perfilar' in request.GET or 'HTTP_X_PERFILAR' in request.META
+
+    @staticmethod
+    def salvar(request, response, perfil, duracao):
+        resumo = io.StringIO()
+        estatisticas = pstats.Stats(perfil, stream=resumo)
+        estatisticas.sort_stats('cumulative').print_stats(FUNCOES_RESUMO)
+        match = getattr(request, 'resolver_match', None)
+        return PerfilRequisicao.objects.create(
+            usuario=request.user.get_username(),
+            view=(match.view_name or match._func_path) if match else '',
+            metodo=request.method,
+            caminho=request.get_full_path(),
+            status=response.status_code,
+            duracao_ms=duracao * 1000,
+            resumo=resumo.getvalue(),
+            # Mesmo formato que cProfile/pstats gravam em arquivo
+            dados=marshal.dumps(estatisticas.stats),
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0002_errosistema_acao_corretiva_errosistema_corrigido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaSuspeita',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assinatura', models.CharField(editable=False, max_length=40, unique=True)),
+                ('view', models.CharField(max_length=255)),
+                ('motivo', models.CharField(choices=[('repeticao', 'Consulta repetida (possível N+1)'), ('orcamento', 'Orçamento de consultas excedido')], max_length=10)),
+                ('consulta', models.TextField(blank=True, verbose_name='Consulta repetida')),
+                ('repeticoes', models.PositiveIntegerField(default=0, verbose_name='Repetições')),
+                ('total_consultas', models.PositiveIntegerField(verbose_name='Consultas na requisição')),
+                ('limite', models.PositiveIntegerField(blank=True, null=True, verbose_name='Orçamento')),
+                ('tempo_banco_ms', models.FloatField(verbose_name='Tempo no banco (ms)')),
+                ('caminho', models.CharField(max_length=255, verbose_name='Último caminho')),
+                ('ocorrencias', models.PositiveIntegerField(default=1, verbose_name='Ocorrências')),
+                ('primeira', models.DateTimeField(auto_now_add=True, verbose_name='Primeira ocorrência')),
+                ('ultima', models.DateTimeField(verbose_name='Última ocorrência')),
+            ],
+            options={
+                'verbose_name': 'Consulta suspeita',
+                'verbose_name_plural': 'Consultas suspeitas',
+                'ordering': ['-ultima'],
+            },
+        ),
+    ]
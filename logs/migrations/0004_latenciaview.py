@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_consultasuspeita'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatenciaView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=255)),
+                ('dia', models.DateField()),
+                ('requisicoes', models.PositiveIntegerField(default=0, verbose_name='Requisições')),
+                ('soma_ms', models.FloatField(default=0)),
+                ('contagens', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Latência por view',
+                'verbose_name_plural': 'Latências por view',
+                'ordering': ['-dia', 'view'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='latenciaview',
+            constraint=models.UniqueConstraint(fields=('view', 'dia'), name='latencia_view_dia_unica'),
+        ),
+    ]
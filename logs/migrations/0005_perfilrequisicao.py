@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_latenciaview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfilRequisicao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.CharField(max_length=255)),
+                ('view', models.CharField(blank=True, max_length=255)),
+                ('metodo', models.CharField(max_length=10, verbose_name='Método')),
+                ('caminho', models.TextField()),
+                ('status', models.PositiveSmallIntegerField(null=True)),
+                ('duracao_ms', models.FloatField(verbose_name='Duração (ms)')),
+                ('resumo', models.TextField(verbose_name='Funções mais demoradas')),
+                ('dados', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Perfil de requisição',
+                'verbose_name_plural': 'Perfis de requisição',
+                'ordering': ['-data'],
+            },
+        ),
+    ]
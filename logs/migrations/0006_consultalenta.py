@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0005_perfilrequisicao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaLenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assinatura', models.CharField(editable=False, max_length=40, unique=True)),
+                ('view', models.CharField(blank=True, max_length=255)),
+                ('consulta', models.TextField()),
+                ('formato_parametros', models.CharField(blank=True, max_length=255, verbose_name='Parâmetros')),
+                ('caminho', models.CharField(blank=True, max_length=255, verbose_name='Último caminho')),
+                ('ocorrencias', models.PositiveIntegerField(default=1, verbose_name='Ocorrências')),
+                ('duracao_ms', models.FloatField(verbose_name='Última duração (ms)')),
+                ('maior_ms', models.FloatField(verbose_name='Maior duração (ms)')),
+                ('soma_ms', models.FloatField()),
+                ('plano', models.TextField(blank=True)),
+                ('primeira', models.DateTimeField(auto_now_add=True, verbose_name='Primeira ocorrência')),
+                ('ultima', models.DateTimeField(verbose_name='Última ocorrência')),
+            ],
+            options={
+                'verbose_name': 'Consulta lenta',
+                'verbose_name_plural': 'Consultas lentas',
+                'ordering': ['-ultima'],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_ultima(apps, schema_editor):
+    # Registros antigos são de uma ocorrência só
+    ErroSistema = apps.get_model('logs', 'ErroSistema')
+    ErroSistema.objects.update(ultima=F('data'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0006_consultalenta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='errosistema',
+            name='assinatura',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='errosistema',
+            name='ocorrencias',
+            field=models.PositiveIntegerField(default=1, verbose_name='Ocorrências'),
+        ),
+        migrations.AddField(
+            model_name='errosistema',
+            name='tipo',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='errosistema',
+            name='ultima',
+            field=models.DateTimeField(null=True, verbose_name='Última ocorrência'),
+        ),
+        migrations.AlterField(
+            model_name='errosistema',
+            name='data',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Primeira ocorrência'),
+        ),
+        migrations.RunPython(preencher_ultima, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0007_errosistema_agrupado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='errosistema',
+            index=models.Index(fields=['ultima'], name='erro_ultima_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errosistema',
+            index=models.Index(fields=['corrigido', 'ultima'], name='erro_corrigido_ultima_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errosistema',
+            index=models.Index(fields=['usuario', 'ultima'], name='erro_usuario_ultima_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errosistema',
+            index=models.Index(fields=['view', 'ultima'], name='erro_view_ultima_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errosistema',
+            index=models.Index(fields=['data'], name='erro_data_idx'),
+        ),
+    ]
@@ -1,7 +1,13 @@
 from django.db import models
 
 class ErroSistema(models.Model):
-    data = models.DateTimeField(auto_now_add=True)
+    # Um registro por erro distinto (tipo + traceback normalizado, logs.erros);
+    # view, usuário, mensagem e stack trace são os da última ocorrência
+    data = models.DateTimeField("Primeira ocorrência", auto_now_add=True)
+    ultima = models.DateTimeField("Última ocorrência", null=True)
+    ocorrencias = models.PositiveIntegerField("Ocorrências", default=1)
+    assinatura = models.CharField(max_length=40, null=True, unique=True, editable=False)
+    tipo = models.CharField(max_length=255, blank=True)
     view = models.CharField(max_length=255, blank=True)
     usuario = models.CharField(max_length=255, blank=True)
     mensagem = models.TextField()
@@ -11,5 +17,125 @@ class ErroSistema(models.Model):
     corrigido = models.BooleanField("Corrigido?", default=False)
     acao_corretiva = models.TextField("Ação corretiva", blank=True)
 
+    class Meta:
+        # Um índice por filtro do admin, todos terminando em `ultima` (a ordenação da
+        # listagem); (ultima) sozinho atende a listagem sem filtro e o purgar_erros
+        indexes = [
+            models.Index(fields=['ultima'], name='erro_ultima_idx'),
+            models.Index(fields=['corrigido', 'ultima'], name='erro_corrigido_ultima_idx'),
+            models.Index(fields=['usuario', 'ultima'], name='erro_usuario_ultima_idx'),
+            models.Index(fields=['view', 'ultima'], name='erro_view_ultima_idx'),
+            models.Index(fields=['data'], name='erro_data_idx'),
+        ]
+
     def __str__(self):
         return f"[{self.data.strftime('%d/%m/%Y %H:%M:%S')}] {self.view or 'view desconhecida'}"
+
+
+class ConsultaSuspeita(models.Model):
+    """Requisições com muitas consultas SQL, agrupadas por view e motivo (logs.middleware.monitor_consultas)."""
+    REPETICAO = 'repeticao'
+    ORCAMENTO = 'orcamento'
+    MOTIVO_CHOICES = [
+        (REPETICAO, 'Consulta repetida (possível N+1)'),
+        (ORCAMENTO, 'Orçamento de consultas excedido'),
+    ]
+
+    assinatura = models.CharField(max_length=40, unique=True, editable=False)
+    view = models.CharField(max_length=255)
+    motivo = models.CharField(max_length=10, choices=MOTIVO_CHOICES)
+    consulta = models.TextField("Consulta repetida", blank=True)
+    repeticoes = models.PositiveIntegerField("Repetições", default=0)
+    total_consultas = models.PositiveIntegerField("Consultas na requisição")
+    limite = models.PositiveIntegerField("Orçamento", null=True, blank=True)
+    tempo_banco_ms = models.FloatField("Tempo no banco (ms)")
+    caminho = models.CharField("Último caminho", max_length=255)
+    ocorrencias = models.PositiveIntegerField("Ocorrências", default=1)
+    primeira = models.DateTimeField("Primeira ocorrência", auto_now_add=True)
+    ultima = models.DateTimeField("Última ocorrência")
+
+    class Meta:
+        ordering = ['-ultima']
+        verbose_name = 'Consulta suspeita'
+        verbose_name_plural = 'Consultas suspeitas'
+
+    def __str__(self):
+        return f"{self.view} ({self.get_motivo_display()})"
+
+
+class LatenciaView(models.Model):
+    """Histograma diário do tempo de resposta de uma view (logs.latencia)."""
+    view = models.CharField(max_length=255)
+    dia = models.DateField()
+    requisicoes = models.PositiveIntegerField("Requisições", default=0)
+    soma_ms = models.FloatField(default=0)
+    # Contagem de requisições por faixa de logs.latencia.FAIXAS_MS
+    contagens = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['-dia', 'view']
+        constraints = [models.UniqueConstraint(fields=['view', 'dia'], name='latencia_view_dia_unica')]
+        verbose_name = 'Latência por view'
+        verbose_name_plural = 'Latências por view'
+
+    def __str__(self):
+        return f"{self.view} em {self.dia:%d/%m/%Y}"
+
+    def percentil(self, p):
+        from .latencia import percentil
+        return percentil(self.contagens, p)
+
+    @property
+    def media_ms(self):
+        return self.soma_ms / self.requisicoes if self.requisicoes else None
+
+
+class PerfilRequisicao(models.Model):
+    """cProfile de uma requisição pedida por um superusuário (logs.middleware.perfilador)."""
+    data = models.DateTimeField(auto_now_add=True)
+    usuario = models.CharField(max_length=255)
+    view = models.CharField(max_length=255, blank=True)
+    metodo = models.CharField("Método", max_length=10)
+    caminho = models.TextField()
+    status = models.PositiveSmallIntegerField(null=True)
+    duracao_ms = models.FloatField("Duração (ms)")
+    resumo = models.TextField("Funções mais demoradas")
+    # Estatísticas no formato de pstats.dump_stats (abrem no snakeviz)
+    dados = models.BinaryField()
+
+    class Meta:
+        ordering = ['-data']
+        verbose_name = 'Perfil de requisição'
+        verbose_name_plural = 'Perfis de requisição'
+
+    def __str__(self):
+        return f"[{self.data.strftime('%d/%m/%Y %H:%M:%S')}] {self.metodo} {self.view or self.caminho}"
+
+
+class ConsultaLenta(models.Model):
+    """Consultas SQL acima de CONSULTAS_LENTAS_MS, agrupadas por view e forma do SQL (logs.lentas)."""
+    assinatura = models.CharField(max_length=40, unique=True, editable=False)
+    view = models.CharField(max_length=255, blank=True)
+    consulta = models.TextField()
+    formato_parametros = models.CharField("Parâmetros", max_length=255, blank=True)
+    caminho = models.CharField("Último caminho", max_length=255, blank=True)
+    ocorrencias = models.PositiveIntegerField("Ocorrências", default=1)
+    duracao_ms = models.FloatField("Última duração (ms)")
+    maior_ms = models.FloatField("Maior duração (ms)")
+    soma_ms = models.FloatField()
+    # Saída do EXPLAIN (só SELECT), obtida depois da resposta
+    plano = models.TextField(blank=True)
+    primeira = models.DateTimeField("Primeira ocorrência", auto_now_add=True)
+    ultima = models.DateTimeField("Última ocorrência")
+
+    class Meta:
+        ordering = ['-ultima']
+        verbose_name = 'Consulta lenta'
+        verbose_name_plural = 'Consultas lentas'
+
+    def __str__(self):
+        return f"{self.view or 'fora de view'}: {self.consulta[:80]}"
+
+    @property
+    def media_ms(self):
+        return self.soma_ms / self.ocorrencias
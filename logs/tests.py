@@ -1,3 +1,259 @@
-from django.test import TestCase
+import gzip
+import json
+import marshal
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib import admin
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+
+from chaves.models import Chave, CustomUsuario, Projetista
+from logs import erros, latencia
+from logs.consultas import OrcamentoConsultasExcedido, forma_consulta, formato_parametros, orcamento_consultas
+from logs.models import ConsultaLenta, ConsultaSuspeita, ErroSistema, LatenciaView, PerfilRequisicao
+
+
+def listar_com_n_mais_um(request):
+    nomes = [str(chave.projetista) for chave in Chave.objects.all()]
+    return HttpResponse(', '.join(nomes))
+
+
+def listar_com_select_related(request):
+    nomes = [str(chave.projetista) for chave in Chave.objects.select_related('projetista')]
+    return HttpResponse(', '.join(nomes))
+
+
+def transmitir_chaves(request):
+    # As consultas rodam enquanto o corpo é enviado, depois que a view retornou
+    def partes():
+        for chave in Chave.objects.select_related('projetista'):
+            yield chave.chave
+    return StreamingHttpResponse(partes())
+
+
+def falhar(request, id):
+    raise ValueError(f"Chave {id} inválida")
+
+
+urlpatterns = [
+    path('falhar/<int:id>/', falhar, name='falhar'),
+    path('n-mais-um/', listar_com_n_mais_um, name='n_mais_um'),
+    path('select-related/', orcamento_consultas(listar_com_select_related, 1), name='select_related'),
+    path('orcamento/', orcamento_consultas(listar_com_n_mais_um, 3), name='orcamento'),
+    path('transmitir/', transmitir_chaves, name='transmitir'),
+    path('painel/', admin.site.urls),
+]
+
+
+@override_settings(ROOT_URLCONF='logs.tests', CONSULTAS_LIMIAR_REPETICAO=5, CONSULTAS_ORCAMENTO_ESTRITO=False)
+class MonitorConsultasTestCase(TestCase):
+    def setUp(self):
+        for i in range(6):
+            projetista = Projetista.objects.create(projetista=f'Projetista {i}')
+            Chave.objects.create(chave=f'CHV{i}', projetista=projetista)
+
+    def test_forma_consulta(self):
+        self.assertEqual(
+            forma_consulta("SELECT * FROM t WHERE id IN (%s, %s,%s) AND  x = 10 AND nome = 'a''b'"),
+            "SELECT * FROM t WHERE id IN (...) AND x = ? AND nome = ?",
+        )
+
+    def test_registra_n_mais_um(self):
+        self.client.get('/n-mais-um/')
+        self.client.get('/n-mais-um/')
+
+        suspeita = ConsultaSuspeita.objects.get()
+        self.assertEqual(suspeita.motivo, ConsultaSuspeita.REPETICAO)
+        self.assertEqual(suspeita.view, 'n_mais_um')
+        self.assertEqual(suspeita.repeticoes, 6)
+        self.assertEqual(suspeita.total_consultas, 7)
+        self.assertEqual(suspeita.ocorrencias, 2)
+        self.assertIn('chaves_projetista', suspeita.consulta)
+
+    def test_sem_repeticao_nao_registra(self):
+        response = self.client.get('/select-related/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ConsultaSuspeita.objects.exists())
+
+    def test_orcamento_excedido(self):
+        self.client.get('/orcamento/')
+        self.assertEqual(
+            set(ConsultaSuspeita.objects.values_list('motivo', flat=True)),
+            {ConsultaSuspeita.ORCAMENTO, ConsultaSuspeita.REPETICAO},
+        )
+        self.assertEqual(ConsultaSuspeita.objects.get(motivo=ConsultaSuspeita.ORCAMENTO).limite, 3)
+
+        with override_settings(CONSULTAS_ORCAMENTO_ESTRITO=True):
+            with self.assertRaises(OrcamentoConsultasExcedido):
+                self.client.get('/orcamento/')
+
+
+@override_settings(ROOT_URLCONF='logs.tests', CONSULTAS_ORCAMENTO_ESTRITO=False)
+class LatenciaTestCase(TestCase):
+    def setUp(self):
+        # Descarta o que outras requisições dos testes deixaram no histograma do processo
+        latencia.histograma.retirar()
+
+    def test_percentil(self):
+        # 90 requisições na faixa até 5 ms e 10 na faixa de 100 a 150 ms
+        contagens = [90] + [0] * 5 + [10] + [0] * (latencia.NUMERO_FAIXAS - 7)
+        self.assertEqual(latencia.percentil(contagens, 50), 5 * 50 / 90)
+        self.assertEqual(latencia.percentil(contagens, 95), 125)
+        self.assertEqual(latencia.percentil(contagens, 99), 145)
+        self.assertIsNone(latencia.percentil([0] * latencia.NUMERO_FAIXAS, 50))
+
+    def test_descarga_agrega_por_view_e_dia(self):
+        for _ in range(3):
+            self.client.get('/select-related/')
+        self.client.get('/nao-existe/')
+        self.assertEqual(latencia.descarregar(), 1)
+
+        latencia.histograma.registrar('select_related', 200)
+        latencia.descarregar()
+
+        registro = LatenciaView.objects.get()
+        self.assertEqual(registro.view, 'select_related')
+        self.assertEqual(registro.requisicoes, 4)
+        self.assertEqual(sum(registro.contagens), 4)
+        self.assertGreaterEqual(registro.soma_ms, 200)
+        self.assertEqual(latencia.descarregar(), 0)
+
+
+@override_settings(ROOT_URLCONF='logs.tests', CONSULTAS_ORCAMENTO_ESTRITO=False)
+class PerfiladorTestCase(TestCase):
+    def setUp(self):
+        CustomUsuario.objects.create_superuser(email='admin@test.com', password='password')
+        CustomUsuario.objects.create_user(email='user@test.com', password='password')
+
+    def test_superusuario_perfila_requisicao(self):
+        self.client.login(email='admin@test.com', password='password')
+        response = self.client.get('/select-related/?_perfilar=1')
+        self.assertEqual(response.status_code, 200)
+
+        perfil = PerfilRequisicao.objects.get()
+        self.assertEqual(perfil.view, 'select_related')
+        self.assertEqual(perfil.usuario, 'admin@test.com')
+        self.assertIn('listar_com_select_related', perfil.resumo)
+        self.assertIn(str(perfil.pk), response['X-Perfil'])
+
+        self.client.get('/select-related/', HTTP_X_PERFILAR='1')
+        self.assertEqual(PerfilRequisicao.objects.count(), 2)
+
+        # Só o parâmetro _perfilar liga o perfil, não o texto dentro de outro parâmetro
+        response = self.client.get('/select-related/?q=x_perfilar&x_perfilar=1')
+        self.assertNotIn('X-Perfil', response)
+        self.client.get('/select-related/?_perfilar')
+        self.assertEqual(PerfilRequisicao.objects.count(), 3)
+
+    def test_download_do_perfil(self):
+        self.client.login(email='admin@test.com', password='password')
+        self.client.get('/select-related/?_perfilar=1')
+        perfil = PerfilRequisicao.objects.get()
+
+        response = self.client.get(reverse('admin:logs_perfilrequisicao_baixar', args=[perfil.pk]))
+        self.assertEqual(response.status_code, 200)
+        estatisticas = marshal.loads(response.content)
+        self.assertTrue(any(nome == 'listar_com_select_related' for _, _, nome in estatisticas))
+
+    def test_usuario_comum_nao_perfila(self):
+        self.client.login(email='user@test.com', password='password')
+        response = self.client.get('/select-related/?_perfilar=1', HTTP_X_PERFILAR='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Perfil', response)
+        self.assertFalse(PerfilRequisicao.objects.exists())
+
+
+@override_settings(ROOT_URLCONF='logs.tests', CONSULTAS_ORCAMENTO_ESTRITO=False, CONSULTAS_LENTAS_MS=0)
+class ConsultaLentaTestCase(TestCase):
+    def setUp(self):
+        Chave.objects.create(chave='CHV01', projetista=Projetista.objects.create(projetista='Projetista'))
+
+    def test_formato_parametros(self):
+        self.assertEqual(formato_parametros([1, 'a', None]), '(int, str, NoneType)')
+        self.assertEqual(formato_parametros([[1, 'a'], [2, 'b']], many=True), '2 x (int, str)')
+
+    def test_registra_consulta_lenta_com_plano(self):
+        self.client.get('/select-related/')
+        self.client.get('/select-related/')
+
+        lenta = ConsultaLenta.objects.get()
+        self.assertEqual(lenta.view, 'select_related')
+        self.assertEqual(lenta.ocorrencias, 2)
+        self.assertIn('FROM "chaves_chave"', lenta.consulta)
+        self.assertEqual(lenta.formato_parametros, '()')
+        self.assertGreaterEqual(lenta.maior_ms, lenta.duracao_ms)
+        self.assertIn('SCAN', lenta.plano)
+
+    def test_registra_consulta_lenta_do_corpo_em_streaming(self):
+        response = self.client.get('/transmitir/')
+        self.assertFalse(ConsultaLenta.objects.exists())
+        self.assertEqual(b''.join(response.streaming_content), b'CHV01')
+
+        lenta = ConsultaLenta.objects.get()
+        self.assertEqual(lenta.view, 'transmitir')
+        self.assertIn('FROM "chaves_chave"', lenta.consulta)
+
+
+@override_settings(
+    ROOT_URLCONF='logs.tests', CONSULTAS_ORCAMENTO_ESTRITO=False, ERROS_DESCARGA_SEGUNDOS=0,
+    MIDDLEWARE=['logs.middleware.erro_logger.LogErroMiddleware', *settings.MIDDLEWARE],
+)
+class ErroSistemaTestCase(TestCase):
+    def test_ocorrencias_do_mesmo_erro_agrupadas(self):
+        client = Client(raise_request_exception=False)
+        client.get('/falhar/1/')
+        client.get('/falhar/2/')
+
+        erro = ErroSistema.objects.get()
+        self.assertEqual(erro.ocorrencias, 2)
+        self.assertEqual(erro.tipo, 'builtins.ValueError')
+        self.assertEqual(erro.mensagem, 'Chave 2 inválida')
+        self.assertEqual(erro.view, '/falhar/2/')
+        self.assertIn('in falhar', erro.stack_trace)
+
+        # Erro corrigido que volta a acontecer é reaberto
+        ErroSistema.objects.update(corrigido=True)
+        client.get('/falhar/3/')
+        erro.refresh_from_db()
+        self.assertEqual(erro.ocorrencias, 3)
+        self.assertFalse(erro.corrigido)
+
+    def test_buffer_limitado(self):
+        buffer = erros.BufferErros(maximo=1)
+        self.assertTrue(buffer.adicionar('a', {'ultima': 1}))
+        self.assertTrue(buffer.adicionar('a', {'ultima': 2}))
+        self.assertFalse(buffer.adicionar('b', {'ultima': 3}))
+        self.assertEqual(buffer.descartados, 1)
+        self.assertEqual(buffer.retirar()['a']['ocorrencias'], 2)
+        self.assertEqual(buffer.retirar(), {})
+
+
+class PurgarErrosTestCase(TestCase):
+    def setUp(self):
+        agora = timezone.now()
+        for i, dias in enumerate([400, 200, 10]):
+            ErroSistema.objects.create(
+                assinatura=str(i), mensagem=f'Erro {i}', stack_trace=f'Traceback {i}',
+                ultima=agora - timedelta(days=dias), corrigido=(i == 1),
+            )
+
+    def test_purga_em_lotes_com_arquivo(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            call_command('purgar_erros', dias=180, lote=1, pausa=0, arquivar=diretorio, stdout=StringIO())
+
+            self.assertEqual(list(ErroSistema.objects.values_list('mensagem', flat=True)), ['Erro 2'])
+            arquivo, = Path(diretorio).glob('erros_*.jsonl.gz')
+            with gzip.open(arquivo, 'rt', encoding='utf-8') as conteudo:
+                arquivados = [json.loads(linha) for linha in conteudo]
+        self.assertEqual([erro['stack_trace'] for erro in arquivados], ['Traceback 0', 'Traceback 1'])
+
+    def test_somente_corrigidos(self):
+        call_command('purgar_erros', dias=180, somente_corrigidos=True, stdout=StringIO())
+        self.assertEqual(sorted(ErroSistema.objects.values_list('mensagem', flat=True)), ['Erro 0', 'Erro 2'])
@@ -0,0 +1,122 @@
+"""
+Benchmark da busca por trecho: LIKE '%termo%' (icontains) x índice de trigramas.
+
+Cria um banco de teste (mesmo backend do DJANGO_SETTINGS_MODULE), gera chaves
+sintéticas, monta o índice e mede a mediana de tempo das buscas usadas em
+gerenciar_chaves e na busca do admin.
+
+Uso:
+    python scripts/benchmark_busca_chaves.py [--chaves 100000] [--repeticoes 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+django_project_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(django_project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'janus.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chaves.busca import filtrar_busca_geral, filtrar_por_trecho, ids_projetistas, reconstruir_indice
+from chaves.models import Chave, Polo, Projetista, TrigramaChave
+
+MUNICIPIOS = ['Porto Alegre', 'Canoas', 'Esteio', 'Sapucaia do Sul', 'Gravataí', 'Viamão', 'Guaíba', 'Alvorada']
+
+CAMPOS_ADMIN = ['chave', 'ns', 'projetista__projetista', 'municipio', 'polo__polo', 'observacao']
+
+
+def like(campos, termo):
+    condicao = Q()
+    for campo in campos:
+        condicao |= Q(**{f"{campo}__icontains": termo})
+    return Chave.objects.filter(condicao)
+
+
+# (descrição, termo, consulta atual com LIKE, consulta pelo índice)
+BUSCAS = [
+    ('chave', '12345',
+     lambda t: like(['chave'], t), lambda t: filtrar_por_trecho(Chave.objects.all(), t, [TrigramaChave.CHAVE])),
+    ('ns', '4567890',
+     lambda t: like(['ns'], t), lambda t: filtrar_por_trecho(Chave.objects.all(), t, [TrigramaChave.NS])),
+    ('projetista', 'Projetista 07',
+     lambda t: like(['projetista__projetista'], t), lambda t: Chave.objects.filter(projetista_id__in=ids_projetistas(t))),
+    ('admin, número', '012345',
+     lambda t: like(CAMPOS_ADMIN, t), lambda t: filtrar_busca_geral(Chave.objects.all(), t)),
+    ('admin, município', 'sapucaia',
+     lambda t: like(CAMPOS_ADMIN, t), lambda t: filtrar_busca_geral(Chave.objects.all(), t)),
+]
+
+
+def popular(n_chaves):
+    projetistas = Projetista.objects.bulk_create([Projetista(projetista=f'Projetista {i:02d}') for i in range(30)])
+    polos = Polo.objects.bulk_create([Polo(polo=f'P{i:02d}') for i in range(10)])
+    Chave.objects.bulk_create(
+        [
+            Chave(
+                chave=f'{i:06d}',
+                ns=f'{(i * 7919) % 10 ** 10:010d}',
+                municipio=MUNICIPIOS[i % len(MUNICIPIOS)],
+                observacao=f'Observação da chave {i}',
+                projetista_id=projetistas[i % 30].pk if i % 3 else None,
+                polo_id=polos[i % 10].pk,
+            )
+            for i in range(n_chaves)
+        ],
+        batch_size=2000,
+    )
+    inicio = time.perf_counter()
+    reconstruir_indice()
+    return time.perf_counter() - inicio
+
+
+def medir(executar, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        executar()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chaves', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    nome_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        tempo_indice = popular(args.chaves)
+        print(f"Backend: {connection.vendor} | {args.chaves} chaves | "
+              f"{TrigramaChave.objects.count()} trigramas montados em {tempo_indice:.1f}s")
+        print("Primeira página (20 linhas) e contagem total, como na listagem do admin.")
+        for descricao, termo, atual, indice in BUSCAS:
+            medidas = []
+            for consulta in (atual, indice):
+                pagina = medir(lambda: list(consulta(termo).order_by('pk').values_list('pk', flat=True)[:20]), args.repeticoes)
+                contagem = medir(lambda: consulta(termo).count(), args.repeticoes)
+                medidas.append((pagina, contagem))
+            (pagina_like, contagem_like), (pagina_indice, contagem_indice) = medidas
+            print(
+                f"{descricao:<17} '{termo}': página LIKE {pagina_like:7.2f} ms / índice {pagina_indice:7.2f} ms"
+                f" | contagem LIKE {contagem_like:7.2f} ms / índice {contagem_indice:7.2f} ms"
+                f" | {indice(termo).count()} resultados"
+            )
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
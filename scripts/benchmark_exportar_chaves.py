@@ -0,0 +1,133 @@
+"""
+Benchmark da exportação de chaves para Excel: implementação anterior
+(Workbook em memória, projetista/polo acessados por linha) x chaves.exportacao
+(write-only, blocos por id com join).
+
+Cria um banco de teste (mesmo backend do DJANGO_SETTINGS_MODULE), gera chaves
+sintéticas e mede tempo, número de consultas e pico de memória Python
+(tracemalloc) de cada implementação.
+
+Uso:
+    python scripts/benchmark_exportar_chaves.py [--chaves 100000] [--sem-anterior]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+django_project_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(django_project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'janus.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chaves.exportacao import COLUNAS, gravar_planilha
+from chaves.models import Chave, Polo, Projetista
+
+MUNICIPIOS = ['Porto Alegre', 'Canoas', 'Esteio', 'Sapucaia do Sul', 'Gravataí', 'Viamão', 'Guaíba', 'Alvorada']
+
+
+def popular(n_chaves):
+    projetistas = Projetista.objects.bulk_create([Projetista(projetista=f'Projetista {i:02d}') for i in range(30)])
+    polos = Polo.objects.bulk_create([Polo(polo=f'P{i:02d}') for i in range(10)])
+    Chave.objects.bulk_create(
+        [
+            Chave(
+                chave=f'{i:06d}',
+                ns=f'{(i * 7919) % 10 ** 10:010d}',
+                poste=f'P{i % 997}',
+                coordenada=f'{480000 + i % 1000:06d}:{6670000 + i % 10000:07d}',
+                municipio=MUNICIPIOS[i % len(MUNICIPIOS)],
+                observacao=f'Observação da chave {i}',
+                projetista_id=projetistas[i % 30].pk if i % 3 else None,
+                polo_id=polos[i % 10].pk,
+            )
+            for i in range(n_chaves)
+        ],
+        batch_size=2000,
+    )
+
+
+def exportar_anterior(queryset, destino):
+    # Cópia da antiga ação exportar_para_excel do admin
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Chaves"
+    ws.append(COLUNAS)
+    for obj in queryset:
+        ws.append([
+            obj.chave,
+            obj.projetista.projetista if obj.projetista else '',
+            obj.ns,
+            obj.poste,
+            obj.coordenada,
+            obj.polo.polo if obj.polo else '',
+            obj.municipio,
+            obj.observacao,
+            obj.data_inclusao.strftime("%Y-%m-%d %H:%M") if obj.data_inclusao else '',
+            obj.data_modificacao.strftime("%Y-%m-%d %H:%M") if obj.data_modificacao else '',
+        ])
+    wb.save(destino)
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def medir(exportar):
+    """Tempo e consultas numa execução; pico de memória numa segunda, sob tracemalloc (que a deixa mais lenta)."""
+    with tempfile.TemporaryFile(suffix='.xlsx') as destino:
+        contador = ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            exportar(Chave.objects.all(), destino)
+        tempo = time.perf_counter() - inicio
+        tamanho = destino.seek(0, os.SEEK_END)
+
+    with tempfile.TemporaryFile(suffix='.xlsx') as destino:
+        tracemalloc.start()
+        exportar(Chave.objects.all(), destino)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return tempo, contador.total, pico / 2 ** 20, tamanho / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chaves', type=int, default=100000)
+    parser.add_argument('--sem-anterior', action='store_true', help='Mede só a implementação nova.')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    nome_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        popular(args.chaves)
+        print(f"Backend: {connection.vendor} | {args.chaves} chaves | pico de memória medido com tracemalloc")
+        implementacoes = [('write-only + blocos', gravar_planilha)]
+        if not args.sem_anterior:
+            implementacoes.insert(0, ('anterior', exportar_anterior))
+        for descricao, exportar in implementacoes:
+            tempo, consultas, pico, tamanho = medir(exportar)
+            print(f"{descricao:<20} {tempo:7.1f} s | {consultas:7d} consultas | pico {pico:7.1f} MiB | arquivo {tamanho:.1f} MiB")
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
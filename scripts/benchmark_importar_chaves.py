@@ -0,0 +1,139 @@
+"""
+Benchmark da importação de chaves por planilha.
+
+Mede linhas/segundo da leitura (pd.read_excel) e da gravação
+(importar_dataframe) para planilhas de 1k, 10k e 100k linhas. Roda sobre um
+banco de teste criado e destruído pelo próprio script, no mesmo backend
+configurado em DJANGO_SETTINGS_MODULE.
+
+Uso:
+    python scripts/benchmark_importar_chaves.py [--tamanhos 1000 10000 100000] [--comparar]
+
+--comparar também mede o laço antigo (um SELECT e um INSERT por linha),
+limitado a 10k linhas porque o tempo cresce com o número de round-trips.
+
+--memoria mede o pico de memória (tracemalloc) da importação completa de um
+.xlsx pela leitura em streaming (openpyxl read-only) e pelo pd.read_excel.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+django_project_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(django_project_path)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'janus.settings')
+
+import django
+
+django.setup()
+
+import pandas as pd
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chaves.models import Chave
+from django.core.files.uploadedfile import SimpleUploadedFile
+from chaves.importacao import importar_dataframe, importar_planilha
+from chaves.leitores import FORMATO_DATA
+
+
+def gerar_planilha(n_linhas):
+    """
+    Planilha sintética: ~5% de datas inválidas e ~5% de chaves repetidas.
+    """
+    chaves, datas, chamados = [], [], []
+    for i in range(n_linhas):
+        chaves.append(i if i % 20 else i // 2)
+        datas.append('data inválida' if i % 20 == 7 else '2024-01-05 00:00:00')
+        chamados.append(f'CH{i}')
+    df = pd.DataFrame({0: chaves, 1: datas, 2: chamados})
+    arquivo = BytesIO()
+    with pd.ExcelWriter(arquivo, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False, header=False)
+    arquivo.seek(0)
+    return arquivo
+
+
+def importar_linha_a_linha(df):
+    """Reprodução do laço anterior, só para comparação."""
+    criados = 0
+    for index, row in df.iterrows():
+        try:
+            data_chamado = datetime.strptime(str(row.iloc[1]), FORMATO_DATA)
+        except ValueError:
+            continue
+        if not Chave.objects.filter(chave=row.iloc[0]).first():
+            Chave.objects.create(chave=row.iloc[0], chamado=row.iloc[2], data_chamado=data_chamado)
+            criados += 1
+    return criados
+
+
+def medir(n_linhas, comparar):
+    planilha = gerar_planilha(n_linhas)
+
+    inicio = time.perf_counter()
+    df = pd.read_excel(planilha, header=None)
+    tempo_leitura = time.perf_counter() - inicio
+
+    Chave.objects.all().delete()
+    inicio = time.perf_counter()
+    resultado = importar_dataframe(df)
+    tempo_gravacao = time.perf_counter() - inicio
+
+    print(
+        f"{n_linhas:>7} linhas | leitura {tempo_leitura:7.2f}s ({n_linhas / tempo_leitura:>9,.0f} l/s)"
+        f" | gravação {tempo_gravacao:7.2f}s ({n_linhas / tempo_gravacao:>9,.0f} l/s)"
+        f" | criados={resultado['criados']} inválidos={resultado['invalidos']}"
+        f" duplicados={resultado['duplicados']}"
+    )
+
+    if comparar and n_linhas <= 10000:
+        Chave.objects.all().delete()
+        inicio = time.perf_counter()
+        importar_linha_a_linha(df)
+        tempo_antigo = time.perf_counter() - inicio
+        print(f"{'':>7}        | laço antigo {tempo_antigo:7.2f}s ({n_linhas / tempo_antigo:>9,.0f} l/s)")
+
+
+def medir_memoria(n_linhas):
+    conteudo = gerar_planilha(n_linhas).read()
+    for descricao, nome in (('streaming', 'planilha.xlsx'), ('pandas', 'planilha')):
+        Chave.objects.all().delete()
+        planilha = SimpleUploadedFile(nome, conteudo)
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        importar_planilha(planilha)
+        tempo = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{n_linhas:>7} linhas | {descricao:<9} pico {pico / 2 ** 20:8.1f} MiB | {tempo:7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--comparar', action='store_true')
+    parser.add_argument('--memoria', action='store_true')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    nome_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"Backend: {connection.vendor}")
+        for n_linhas in args.tamanhos:
+            if args.memoria:
+                medir_memoria(n_linhas)
+            else:
+                medir(n_linhas, args.comparar)
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark da inicialização a frio de um worker web.
+
+Cada rodada sobe um processo Python novo que importa janus.wsgi.application
+e carrega o URLconf (o que o Passenger faz antes de atender a primeira
+requisição). Mede o tempo até esse ponto, a memória residente máxima e se
+pandas/numpy/openpyxl acabaram carregados.
+
+Uso:
+    python scripts/benchmark_inicializacao.py [--rodadas 10]
+
+Usa o DJANGO_SETTINGS_MODULE do ambiente (padrão: janus.settings).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+django_project_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SONDA = r"""
+import json, resource, sys, time
+inicio = time.perf_counter()
+from janus.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+tempo = time.perf_counter() - inicio
+print(json.dumps({
+    'tempo': tempo,
+    'rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modulos': [m for m in ('pandas', 'numpy', 'openpyxl') if m in sys.modules],
+}))
+"""
+
+
+def rodar_sonda():
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'janus.settings')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [django_project_path, env.get('PYTHONPATH')]))
+    saida = subprocess.run(
+        [sys.executable, '-c', SONDA], cwd=django_project_path, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rodadas', type=int, default=10)
+    args = parser.parse_args()
+
+    rodar_sonda()  # aquece o cache de bytecode e de disco
+    medidas = [rodar_sonda() for _ in range(args.rodadas)]
+
+    tempos = [m['tempo'] * 1000 for m in medidas]
+    rss = [m['rss_kib'] / 1024 for m in medidas]
+    print(f"rodadas: {args.rodadas}")
+    print(f"tempo até a aplicação pronta: mediana {statistics.median(tempos):.0f} ms (mín {min(tempos):.0f} ms)")
+    print(f"memória residente máxima: mediana {statistics.median(rss):.1f} MiB")
+    print(f"módulos pesados carregados: {', '.join(medidas[-1]['modulos']) or 'nenhum'}")
+
+
+if __name__ == '__main__':
+    main()